@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException, status, Request
+from fastapi import APIRouter, HTTPException, status, Request, Response
 from app.schemas import api_model
-from app.core.pipeline import ProcessingPipeline,RagPipeline
+from app.core.pipeline import ProcessingPipeline,RagPipeline, LLMNotConfiguredError
+from app.core.job_queue import JobQueue, JobQueueFullError
 
 router = APIRouter()
 
@@ -13,6 +14,45 @@ def health_check() -> api_model.HealthCheckResponse:
     return api_model.HealthCheckResponse(status="ok", message="Service is running smoothly.")
 
 
+@router.get("/ready", response_model=api_model.ReadinessResponse, tags=["Monitoring"])
+def readiness_check(request: Request, response: Response) -> api_model.ReadinessResponse:
+    """
+    Readiness endpoint: 200 once the models are loaded and warm, 503 while loading or after a failure.
+    Unlike /health, this should gate traffic from the load balancer.
+    """
+    readiness = getattr(request.app.state, "readiness", None)
+    if readiness is None:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return api_model.ReadinessResponse(status="loading")
+    if not readiness.is_ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return api_model.ReadinessResponse(**readiness.to_dict())
+
+
+@router.get("/metrics", response_model=api_model.MetricsResponse, tags=["Monitoring"])
+def get_metrics(request: Request) -> api_model.MetricsResponse:
+    """
+    Returns runtime metrics such as embedding batch sizes, queueing delay and embedding/answer/rerank/hot-index cache hit counts and open vector store partitions.
+    """
+    state = request.app.state
+    embedding_service = getattr(state, "embedding_service", None)
+    job_queue = getattr(state, "job_queue", None)
+    answer_cache = getattr(state, "answer_cache", None)
+    semantic_cache = getattr(state, "semantic_cache", None)
+    rerank_cache = getattr(state, "rerank_cache", None)
+    vector_cache = getattr(state, "vector_cache", None)
+    vector_store = getattr(state, "vector_store", None)
+    return api_model.MetricsResponse(
+        embedding=embedding_service.stats() if embedding_service is not None else None,
+        jobs=job_queue.stats() if job_queue is not None else None,
+        answers=answer_cache.stats() if answer_cache is not None else None,
+        semantic_answers=semantic_cache.stats() if semantic_cache is not None else None,
+        rerank=rerank_cache.stats() if rerank_cache is not None else None,
+        hot_index=vector_cache.stats() if vector_cache is not None else None,
+        vector_store=vector_store.stats() if vector_store is not None else None,
+    )
+
+
 @router.post("/process",
              response_model=api_model.ProcessResponse,
              status_code=status.HTTP_202_ACCEPTED,
@@ -25,31 +65,54 @@ async def process_document(
 ) -> api_model.ProcessResponse:
     
     processing_pipeline: ProcessingPipeline = request.app.state.processing_pipeline
+    job_queue: JobQueue = request.app.state.job_queue
     
+    on_drop = None
+    if process_request.webhook_url:
+        # A job dropped at shutdown never runs execute(), so report the failure from here.
+        on_drop = lambda job: processing_pipeline.notify_webhook(process_request.webhook_url, process_request.file_id, 'ERROR', job.error)
     try:
-        await processing_pipeline.execute(
+        job = job_queue.submit(lambda: processing_pipeline.execute(
             file_id = process_request.file_id,
             user_id = process_request.user_id,
             document_id = process_request.document_id,
             source_type = process_request.source_type,
             source_location = process_request.source_location,
             webhook_url = process_request.webhook_url
-        )
-    except Exception as e:
+        ), on_drop=on_drop)
+    except JobQueueFullError as e:
         raise HTTPException(
-            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
             detail = f"Error processing document: {str(e)}"
         )
     return api_model.ProcessResponse(
         status = "processing_initiated",
         message = "Document processing has been initiated.",
-        file_id = process_request.file_id
+        file_id = process_request.file_id,
+        job_id = job.job_id
     )
+
+
+@router.get("/jobs/{job_id}",
+            response_model=api_model.JobStatusResponse,
+            tags=["Processing"])
+def get_job_status(job_id: str, request: Request) -> api_model.JobStatusResponse:
+    """
+    Returns the current state of a background processing job.
+    """
+    job_queue: JobQueue = request.app.state.job_queue
+    job = job_queue.status(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = f"Job {job_id} not found"
+        )
+    return api_model.JobStatusResponse(**job)
     
 @router.post("/query",
                 response_model=api_model.QueryResponse,
                 tags=["RAG"])
-def query_document(
+async def query_document(
     query_request: api_model.QueryRequest,
     request: Request
 ) -> api_model.QueryResponse:
@@ -57,7 +120,7 @@ def query_document(
     rag_pipeline: RagPipeline = request.app.state.rag_pipeline
     
     try:
-        result =  rag_pipeline.get_answer(
+        result = await rag_pipeline.aget_answer(
             user_id = query_request.user_id,
             document_id = query_request.document_id,
             question = query_request.question,
@@ -67,9 +130,47 @@ def query_document(
             answer=result["answer"],
             sources=result["sources"]
         )
+    except LLMNotConfiguredError as e:
+        raise HTTPException(
+            status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail = str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail = f"Error querying document: {str(e)}"
+        )
+
+@router.post("/query/batch",
+                response_model=api_model.BatchQueryResponse,
+                tags=["RAG"])
+async def query_document_batch(
+    batch_request: api_model.BatchQueryRequest,
+    request: Request
+) -> api_model.BatchQueryResponse:
+    """
+    Answers several questions about one document in one round-trip. A question whose
+    retrieval or LLM call fails gets an error entry; the others are still answered.
+    """
+    rag_pipeline: RagPipeline = request.app.state.rag_pipeline
+    
+    try:
+        results = await rag_pipeline.aget_answers(
+            user_id = batch_request.user_id,
+            document_id = batch_request.document_id,
+            questions = batch_request.questions,
+        )
+    except LLMNotConfiguredError as e:
+        raise HTTPException(
+            status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail = str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail = f"Error querying document: {str(e)}"
         )
-        
\ No newline at end of file
+    return api_model.BatchQueryResponse(results=[
+        api_model.BatchQueryItem(question=question, **result)
+        for question, result in zip(batch_request.questions, results)
+    ])
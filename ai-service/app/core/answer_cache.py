@@ -0,0 +1,118 @@
+import copy
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+
+@dataclass
+class _Entry:
+    value: Any
+    document_id: str
+    expires_at: float
+
+
+class AnswerCache:
+    """
+    An in-process cache of final RAG answers with a TTL and LRU eviction.
+
+    Entries are keyed by (user_id, document_id, normalized question, model settings) and are
+    dropped as soon as the document changes (see invalidate_document, wired to the
+    ProcessingPipeline's document listeners). A per-document generation counter keeps an
+    answer computed while the document was being re-ingested from being cached.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._keys_by_document: Dict[str, Set[Hashable]] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        print(f"AnswerCache initialized with max_entries={max_entries}, ttl_seconds={ttl_seconds}")
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        """Unicode-normalizes and case-folds the question and collapses runs of whitespace."""
+        return " ".join(unicodedata.normalize("NFC", question).casefold().split())
+
+    @classmethod
+    def make_key(cls, user_id: str, document_id: str, question: str, settings: Tuple = ()) -> Tuple:
+        return (user_id, document_id, cls.normalize_question(question), settings)
+
+    def generation(self, document_id: str) -> int:
+        """The document's current generation; read it before computing an answer and pass it to put()."""
+        with self._lock:
+            return self._generations.get(document_id, 0)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns a copy of the cached answer, or None on a miss or an expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= self._clock():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry.value)
+
+    def put(self, key: Hashable, document_id: str, value: Any, generation: int) -> bool:
+        """
+        Stores an answer unless the document changed since `generation` was read.
+
+        Returns:
+            bool: True if the answer was cached.
+        """
+        with self._lock:
+            if self._generations.get(document_id, 0) != generation:
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(copy.deepcopy(value), document_id, self._clock() + self.ttl_seconds)
+            self._keys_by_document.setdefault(document_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            return True
+
+    def invalidate_document(self, document_id: str) -> int:
+        """Drops every answer about the document and bumps its generation. Returns the number dropped."""
+        with self._lock:
+            self._generations[document_id] = self._generations.get(document_id, 0) + 1
+            keys = self._keys_by_document.pop(document_id, set())
+            for key in keys:
+                self._entries.pop(key, None)
+            self.invalidations += 1
+        if keys:
+            print(f"AnswerCache invalidated {len(keys)} answer(s) for document_id: {document_id}")
+        return len(keys)
+
+    def on_document_changed(self, user_id: str, document_id: str) -> None:
+        """ProcessingPipeline document listener."""
+        self.invalidate_document(document_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        """Removes one entry; the caller must hold the lock."""
+        entry = self._entries.pop(key)
+        keys = self._keys_by_document.get(entry.document_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_document[entry.document_id]
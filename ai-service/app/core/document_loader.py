@@ -1,7 +1,7 @@
 import os
 from langchain.document_loaders import PyPDFLoader, WebBaseLoader
 from langchain_core.documents import Document
-from typing import List
+from typing import Iterator, List
 import requests
 
 def download_file_from_url(signed_url: str, save_directory: str = "temp_files") -> str | None:
@@ -49,22 +49,9 @@ def download_file_from_url(signed_url: str, save_directory: str = "temp_files")
         print(f"Error downloading file: {e}")
         return None
 
-def load_from_source(source_type:str,source_location: str)-> List[Document]:
-    """Load a document from a specified source type and location.
-    Args:
-        source_type (str): Type of the source (e.g., 'pdf', 'url').
-        source_location (str): Location of the source (e.g., file path or URL).
-    Returns:
-        List[Document]: A list of Document objects containing the loaded content.
-    Raises:
-        FileNotFoundError: If the specified file does not exist.
-        ValueError: If the source type is not supported.
-    """
-    
-    print(f"Loading {source_type} from {source_location}")
-    
+def _create_loader(source_type: str, source_location: str):
+    """Builds the LangChain loader for a source, downloading uploaded files first."""
     loader = None
-    text_content = ""
     if source_type == 'upload':
         sigend_url = source_location  # Assume this is a signed URL from Supabase
         local_file_path = download_file_from_url(sigend_url)
@@ -79,6 +66,23 @@ def load_from_source(source_type:str,source_location: str)-> List[Document]:
         loader = WebBaseLoader(source_location)
     else:
         raise ValueError(f"Unsupported source type: {source_type}")
+    return loader
+
+def load_from_source(source_type:str,source_location: str)-> List[Document]:
+    """Load a document from a specified source type and location.
+    Args:
+        source_type (str): Type of the source (e.g., 'pdf', 'url').
+        source_location (str): Location of the source (e.g., file path or URL).
+    Returns:
+        List[Document]: A list of Document objects containing the loaded content.
+    Raises:
+        FileNotFoundError: If the specified file does not exist.
+        ValueError: If the source type is not supported.
+    """
+    
+    print(f"Loading {source_type} from {source_location}")
+    
+    loader = _create_loader(source_type, source_location)
     try:
         documents = loader.load()
         print(f"Loaded {len(documents)} page(s) from {source_location}")
@@ -86,6 +90,30 @@ def load_from_source(source_type:str,source_location: str)-> List[Document]:
     except Exception as e:
         raise RuntimeError(f"Failed to load document from {source_location}: {e}")
 
+def lazy_load_from_source(source_type: str, source_location: str) -> Iterator[Document]:
+    """Lazily load a document one page at a time.
+    Unlike load_from_source, pages are parsed on demand so only the current page is held in memory.
+    Args:
+        source_type (str): Type of the source (e.g., 'pdf', 'url').
+        source_location (str): Location of the source (e.g., file path or URL).
+    Yields:
+        Document: One Document per page.
+    Raises:
+        FileNotFoundError: If the specified file does not exist.
+        ValueError: If the source type is not supported.
+    """
+    print(f"Streaming {source_type} from {source_location}")
+    
+    loader = _create_loader(source_type, source_location)
+    page_count = 0
+    try:
+        for document in loader.lazy_load():
+            page_count += 1
+            yield document
+    except Exception as e:
+        raise RuntimeError(f"Failed to load document from {source_location}: {e}")
+    print(f"Streamed {page_count} page(s) from {source_location}")
+
 if __name__ == '__main__':
     # --- Testing a PDF file ---
     print("\n--- Testing PDF file ---")
@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+DocumentLoader = Callable[[], Tuple[List[Document], np.ndarray]]
+DocumentVersion = Callable[[], str]
+
+
+@dataclass
+class _DocumentMatrix:
+    """One document's chunks and their embeddings as a contiguous (n, dim) float32 matrix."""
+    documents: List[Document]
+    vectors: np.ndarray
+    nbytes: int
+    version: Optional[str] = None
+    checked_at: float = 0.0
+
+    def search(self, query_vector: np.ndarray, k: int) -> List[Document]:
+        # Exact search: one matrix-vector product over the document's chunks. Stored vectors are
+        # normalized, so the dot product ranks like the collection's L2/cosine distance.
+        scores = self.vectors @ np.asarray(query_vector, dtype=np.float32)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [self.documents[i] for i in top[np.argsort(-scores[top])]]
+
+
+class DocumentVectorCache:
+    """
+    An in-process LRU cache of per-document embedding matrices for exact filtered search.
+
+    Every /query is restricted to one user's document. Searching the global HNSW graph and
+    post-filtering scales with the whole collection; a brute-force dot product over the
+    document's own chunks scales with the document and is exact. Documents are loaded from
+    the vector store on their first query and evicted least recently used once the cache
+    holds more than max_bytes (vectors plus chunk text). A document larger than the whole
+    budget is never cached and always searched in the vector store.
+
+    In-process document listeners only see ingestion done by this process. When a version
+    callable is given, an entry older than revalidate_seconds is checked against the store's
+    current version of the document before it is used, and reloaded if the document changed
+    elsewhere.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, revalidate_seconds: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max(1, max_bytes)
+        self.revalidate_seconds = revalidate_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[str, str], _DocumentMatrix]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._too_large: Set[Tuple[str, str]] = set()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.stale = 0
+        print(f"DocumentVectorCache initialized with max_bytes={max_bytes}, revalidate_seconds={revalidate_seconds}")
+
+    def search(
+        self,
+        user_id: str,
+        document_id: str,
+        query_vector: np.ndarray,
+        k: int,
+        loader: DocumentLoader,
+        version: Optional[DocumentVersion] = None,
+    ) -> Optional[List[Document]]:
+        """
+        Finds the k chunks of the document closest to the query, loading the document on a miss.
+
+        Args:
+            user_id (str): The owner of the document.
+            document_id (str): The document to search.
+            query_vector (np.ndarray): The normalized query embedding.
+            k (int): The number of chunks to return.
+            loader: Returns the document's chunks (with IDs) and their embeddings from the vector store.
+            version: Returns the store's current version of the document; used to revalidate entries.
+
+        Returns:
+            Optional[List[Document]]: The chunks, best first, or None when the document cannot
+            be cached and the caller should search the vector store instead.
+        """
+        key = (user_id, document_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            generation = self._generations.get(document_id, 0)
+        if entry is not None and version is not None and self._clock() - entry.checked_at >= self.revalidate_seconds:
+            current = version()
+            with self._lock:
+                if current == entry.version:
+                    entry.checked_at = self._clock()
+                else:
+                    # Changed by another process; this process's listeners never saw it.
+                    self.stale += 1
+                    if self._entries.get(key) is entry:
+                        self._remove(key)
+                    self._too_large.discard(key)
+                    entry = None
+        with self._lock:
+            if entry is not None:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                if key in self._too_large:
+                    return None
+        if entry is None:
+            entry = self._load(key, generation, loader, version)
+            if entry is None:
+                return None
+        return entry.search(query_vector, k)
+
+    def _load(self, key: Tuple[str, str], generation: int, loader: DocumentLoader, version: Optional[DocumentVersion] = None) -> Optional[_DocumentMatrix]:
+        # Read the version first: a change between the two reads is caught by the next revalidation.
+        loaded_version = version() if version is not None else None
+        checked_at = self._clock()
+        documents, vectors = loader()
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not documents:
+            # Not ingested (yet); let the vector store answer and try again next time.
+            return None
+        nbytes = vectors.nbytes + sum(len(doc.page_content) for doc in documents)
+        entry = _DocumentMatrix(documents=documents, vectors=vectors, nbytes=nbytes, version=loaded_version, checked_at=checked_at)
+        with self._lock:
+            self.loads += 1
+            if self._generations.get(key[1], 0) != generation:
+                # The document changed while it was loading; use this copy once, do not keep it.
+                return entry
+            if nbytes > self.max_bytes:
+                self._too_large.add(key)
+                print(f"DocumentVectorCache: document_id {key[1]} needs {nbytes} bytes, more than the whole budget; using the vector store.")
+                return None
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        print(f"DocumentVectorCache loaded {len(documents)} chunks ({nbytes} bytes) for document_id: {key[1]}")
+        return entry
+
+    def invalidate_document(self, document_id: str) -> int:
+        """Drops the document's matrices for every user. Returns the number dropped."""
+        with self._lock:
+            self._generations[document_id] = self._generations.get(document_id, 0) + 1
+            keys = [key for key in self._entries if key[1] == document_id]
+            for key in keys:
+                self._remove(key)
+            self._too_large = {key for key in self._too_large if key[1] != document_id}
+        return len(keys)
+
+    def on_document_changed(self, user_id: str, document_id: str) -> None:
+        """ProcessingPipeline document listener."""
+        self.invalidate_document(document_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "stale": self.stale,
+                "documents": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        """Removes one entry; the caller must hold the lock."""
+        self._bytes -= self._entries.pop(key).nbytes
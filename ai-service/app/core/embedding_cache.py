@@ -0,0 +1,188 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.sparse_index import SparseWeights
+
+
+class EmbeddingCache:
+    """
+    A persistent, content-addressed cache of embedding vectors stored in SQLite.
+
+    Entries are keyed by (model name, hash of the normalized chunk text), so identical
+    boilerplate across files and re-uploads of the same document never hit the model twice.
+    BGE-M3 sparse weights can be cached next to the dense vectors (get_many_sparse,
+    put_many_sparse) under their own keys and share the same size budget. The least recently
+    used entries are evicted once the stored entries exceed max_size_mb; the stored byte
+    total is read once on connect and then kept up to date in memory.
+    """
+
+    def __init__(self, path: str = './embedding_cache.sqlite3', max_size_mb: float = 512):
+        self.path = path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        # Bytes of stored vectors; loaded when the connection opens.
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        print(f"EmbeddingCache initialized at {path} with max_size_mb={max_size_mb}")
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Unicode-normalizes the text and collapses runs of whitespace."""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @classmethod
+    def make_key(cls, model_name: str, text: str) -> str:
+        digest = hashlib.sha256(cls.normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{model_name}:{digest}"
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened on first use so constructing the cache never touches the disk.
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+            self._conn.commit()
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        return self._conn
+
+    def get_many(self, model_name: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        Looks up the cached vectors for the given texts.
+
+        Returns:
+            List[Optional[np.ndarray]]: One float32 vector per text, or None on a miss.
+        """
+        blobs = self._get_blobs([self.make_key(model_name, text) for text in texts])
+        results = [np.frombuffer(blob, dtype=np.float32) if blob is not None else None for blob in blobs]
+        hit_count = sum(1 for vector in results if vector is not None)
+        with self._lock:
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model_name: str, texts: Sequence[str], vectors: np.ndarray) -> None:
+        """Stores one vector per text and evicts old entries if the cache is over budget."""
+        if len(texts) != len(vectors):
+            raise ValueError("The number of texts must match the number of vectors.")
+        self._put_blobs([
+            (self.make_key(model_name, text), np.ascontiguousarray(vector, dtype=np.float32).tobytes())
+            for text, vector in zip(texts, vectors)
+        ])
+
+    def get_many_sparse(self, model_name: str, texts: Sequence[str]) -> List[Optional[SparseWeights]]:
+        """
+        Looks up the cached sparse weights for the given texts. Not counted in the hit and
+        miss statistics, which describe the dense lookups.
+
+        Returns:
+            List[Optional[SparseWeights]]: One token ID -> weight dict per text, or None on a miss.
+        """
+        blobs = self._get_blobs([self.make_key(self._sparse_namespace(model_name), text) for text in texts])
+        return [self._decode_sparse(blob) if blob is not None else None for blob in blobs]
+
+    def put_many_sparse(self, model_name: str, texts: Sequence[str], weights: Sequence[SparseWeights]) -> None:
+        """Stores one sparse weight dict per text and evicts old entries if the cache is over budget."""
+        if len(texts) != len(weights):
+            raise ValueError("The number of texts must match the number of sparse weight dicts.")
+        namespace = self._sparse_namespace(model_name)
+        self._put_blobs([(self.make_key(namespace, text), self._encode_sparse(text_weights)) for text, text_weights in zip(texts, weights)])
+
+    @staticmethod
+    def _sparse_namespace(model_name: str) -> str:
+        return f"{model_name}|sparse"
+
+    @staticmethod
+    def _encode_sparse(weights: SparseWeights) -> bytes:
+        """int32 token IDs followed by their float32 weights."""
+        token_ids = np.fromiter(weights.keys(), dtype=np.int32, count=len(weights))
+        values = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+        return token_ids.tobytes() + values.tobytes()
+
+    @staticmethod
+    def _decode_sparse(blob: bytes) -> SparseWeights:
+        count = len(blob) // 8
+        token_ids = np.frombuffer(blob, dtype=np.int32, count=count)
+        values = np.frombuffer(blob, dtype=np.float32, count=count, offset=count * 4)
+        return dict(zip(token_ids.tolist(), values.tolist()))
+
+    def _get_blobs(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Returns the stored blob of each key, or None, and marks the found entries as used."""
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            conn = self._connection()
+            unique_keys = list(dict.fromkeys(keys))
+            # Stay well below SQLite's bound-parameter limit.
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+                for key, blob in rows:
+                    found[key] = blob
+            if found:
+                now = time.time()
+                conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found])
+                conn.commit()
+        return [found.get(key) for key in keys]
+
+    def _put_blobs(self, entries: List[Tuple[str, bytes]]) -> None:
+        """Stores (key, blob) entries, replacing existing keys, and evicts if over budget."""
+        now = time.time()
+        rows: Dict[str, tuple] = {key: (key, blob, len(blob), now) for key, blob in entries}
+        with self._lock:
+            conn = self._connection()
+            # Replaced entries give back their old size; a primary-key lookup per batch.
+            replaced = 0
+            keys = list(rows)
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                replaced += conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({placeholders})", batch).fetchone()[0]
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)", list(rows.values())
+            )
+            conn.commit()
+            self._total_bytes += sum(row[2] for row in rows.values()) - replaced
+            if self._total_bytes > self.max_size_bytes:
+                self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Deletes least recently used entries down to 90% of the budget; the caller must hold the lock."""
+        # Evict down to 90% of the budget so we don't evict on every insert.
+        to_free = self._total_bytes - int(self.max_size_bytes * 0.9)
+        freed = 0
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM embeddings ORDER BY last_access ASC"):
+            evicted.append((key,))
+            freed += size
+            if freed >= to_free:
+                break
+        conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        conn.commit()
+        self._total_bytes -= freed
+        print(f"EmbeddingCache evicted {len(evicted)} entries ({freed} bytes).")
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._total_bytes = 0
@@ -0,0 +1,122 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Per-process state of a pool worker, set once by _init_worker.
+_worker_model = None
+
+
+def _init_worker(model_name: str, backend: str, onnx_file_name: Optional[str], threads_per_worker: int) -> None:
+    """Loads the model once per worker process and pins its intra-op thread count."""
+    global _worker_model
+    import torch
+    from app.core.embedding_service import load_sentence_transformer
+
+    torch.set_num_threads(threads_per_worker)
+    _worker_model = load_sentence_transformer(model_name, backend=backend, onnx_file_name=onnx_file_name)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _encode_shard(texts: List[str], shm_name: str, start: int, total: int, dimension: int, batch_size: int) -> int:
+    """Encodes one shard in a worker and writes its rows straight into the shared output array."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        output = np.ndarray((total, dimension), dtype=np.float32, buffer=shm.buf)
+        output[start:start + len(texts)] = _worker_model.encode(texts, normalize_embeddings=True, batch_size=batch_size)
+        del output
+    finally:
+        shm.close()
+    return len(texts)
+
+
+class EmbeddingPool:
+    """
+    Encodes large document batches across several worker processes, each with its own copy
+    of the model, so bulk ingestion is not limited to one GIL-bound process.
+
+    A request is split into one contiguous shard per worker. Workers write their embeddings
+    into a single shared-memory float32 array, so only the texts are pickled, not the vectors.
+    Every worker holds a full model in memory; size num_workers x threads_per_worker to the
+    physical core count.
+    """
+
+    def __init__(
+        self,
+        model_name: str = 'BAAI/bge-m3',
+        num_workers: int = 2,
+        threads_per_worker: int = 1,
+        backend: str = 'torch',
+        onnx_file_name: Optional[str] = None,
+        batch_size: int = 32,
+        min_texts: int = 32,
+    ):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1.")
+        self.num_workers = num_workers
+        self.threads_per_worker = max(1, threads_per_worker)
+        self.batch_size = max(1, batch_size)
+        # Smaller requests are cheaper to encode in-process than to ship to the workers.
+        self.min_texts = max(1, min_texts)
+        self._requests = 0
+        self._items = 0
+        # 'spawn' so workers never inherit a forked copy of torch's thread pools.
+        self._executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, backend, onnx_file_name, self.threads_per_worker),
+        )
+        print(f"EmbeddingPool started with num_workers={num_workers}, threads_per_worker={self.threads_per_worker}")
+
+    def encode(self, texts: List[str], dimension: int) -> np.ndarray:
+        """
+        Encodes texts across the worker processes.
+
+        Args:
+            texts (List[str]): The texts to embed.
+            dimension (int): The embedding dimension of the model.
+
+        Returns:
+            np.ndarray: A (len(texts), dimension) float32 array in input order.
+        """
+        if not texts:
+            return np.empty((0, dimension), dtype=np.float32)
+        total = len(texts)
+        shm = shared_memory.SharedMemory(create=True, size=total * dimension * np.dtype(np.float32).itemsize)
+        try:
+            shard_size = math.ceil(total / self.num_workers)
+            futures = [
+                self._executor.submit(
+                    _encode_shard, texts[start:start + shard_size], shm.name, start, total, dimension, self.batch_size
+                )
+                for start in range(0, total, shard_size)
+            ]
+            for future in futures:
+                future.result()
+            # Copy out so the shared segment can be released right away.
+            result = np.ndarray((total, dimension), dtype=np.float32, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+        self._requests += 1
+        self._items += total
+        return result
+
+    def warmup(self) -> None:
+        """Starts the worker processes now so they load their models before the first request."""
+        for future in [self._executor.submit(_ping) for _ in range(self.num_workers)]:
+            future.result()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.num_workers, "requests": self._requests, "items": self._items}
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
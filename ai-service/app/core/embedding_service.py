@@ -1,25 +1,339 @@
 import os
-from typing import List
-from sentence_transformers import SentenceTransformer
+import threading
+import numpy as np
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 from langchain_core.embeddings import Embeddings
 from PIL import Image
 
+from app.core.embedding_cache import EmbeddingCache
+from app.core.embedding_pool import EmbeddingPool
+from app.core.micro_batcher import MicroBatcher
+from app.core.inference_scheduler import InferenceScheduler, Priority
+from app.core.lazy_imports import lazy_imports
+from app.core.sparse_index import SparseWeights
+
+if TYPE_CHECKING:
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+_load, __getattr__ = lazy_imports(globals(), {"SentenceTransformer": ("sentence_transformers", "SentenceTransformer")})
+
+SUPPORTED_BACKENDS = ('torch', 'torch-int8', 'onnx')
+
+
+def load_sentence_transformer(model_name: str, backend: str = 'torch', onnx_file_name: Optional[str] = None) -> 'SentenceTransformer':
+    """
+    Loads the embedding model with the requested CPU inference backend.
+
+    Args:
+        model_name (str): Hugging Face model name; the same for every backend.
+        backend (str): 'torch' (fp32), 'torch-int8' (PyTorch dynamic int8 quantization of the
+            Linear layers) or 'onnx' (ONNX Runtime, needs the optional `optimum[onnxruntime]` package).
+        onnx_file_name (str, optional): ONNX file inside the model repo, e.g. a pre-quantized
+            'onnx/model_qint8_avx512_vnni.onnx'. Defaults to the library's choice.
+
+    Raises:
+        ValueError: If the backend is not supported.
+    """
+    SentenceTransformer = _load("SentenceTransformer")
+    if backend == 'torch':
+        return SentenceTransformer(model_name)
+    if backend == 'torch-int8':
+        import torch
+        model = SentenceTransformer(model_name, device='cpu')
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == 'onnx':
+        model_kwargs = {"file_name": onnx_file_name} if onnx_file_name else None
+        return SentenceTransformer(model_name, backend='onnx', model_kwargs=model_kwargs)
+    raise ValueError(f"Unsupported embedding backend: {backend}. Expected one of {SUPPORTED_BACKENDS}.")
+
+
+def load_sparse_linear(model_name: str = 'BAAI/bge-m3') -> 'torch.nn.Linear':
+    """
+    Loads BGE-M3's sparse head: the Linear(hidden_size, 1) layer in sparse_linear.pt that maps
+    each token's last hidden state to its lexical weight.
+
+    Args:
+        model_name (str): A local model directory or a Hugging Face model name.
+    """
+    import torch
+    path = os.path.join(model_name, 'sparse_linear.pt')
+    if not os.path.exists(path):
+        from huggingface_hub import hf_hub_download
+        path = hf_hub_download(model_name, 'sparse_linear.pt')
+    state = torch.load(path, map_location='cpu', weights_only=True)
+    linear = torch.nn.Linear(state['weight'].shape[1], state['weight'].shape[0])
+    linear.load_state_dict(state)
+    return linear.eval()
+
+
+def embedding_parity(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """
+    Compares candidate embeddings against reference (fp32) embeddings of the same texts.
+
+    Returns:
+        Dict[str, float]: Mean and minimum row-wise cosine similarity.
+    """
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    if reference.shape != candidate.shape:
+        raise ValueError(f"Shape mismatch: {reference.shape} vs {candidate.shape}")
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    cosine = np.sum(reference * candidate, axis=1) / np.maximum(norms, 1e-12)
+    return {"mean_cosine": float(cosine.mean()), "min_cosine": float(cosine.min())}
+
+
 class EmbeddingService(Embeddings):
     """
     A LangChain-compatible service class for handling embeddings using BGE-M3.
     It inherits from LangChain's Embeddings base class.
     """
-    def __init__(self, model_name: str = 'BAAI/bge-m3'):
-        self.model = SentenceTransformer(model_name)
-        print(f"EmbeddingService initialized with multimodal model: {model_name}")
+    def __init__(
+        self,
+        model_name: str = 'BAAI/bge-m3',
+        cache: Optional[EmbeddingCache] = None,
+        batch_window_ms: float = 0.0,
+        max_batch_size: int = 32,
+        scheduler: Optional[InferenceScheduler] = None,
+        bulk_slice_size: int = 16,
+        sort_by_length: bool = False,
+        encode_batch_size: int = 32,
+        max_batch_tokens: Optional[int] = None,
+        backend: str = 'torch',
+        onnx_file_name: Optional[str] = None,
+        pool: Optional[EmbeddingPool] = None,
+        lazy_load: bool = False,
+        sparse: bool = False,
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.onnx_file_name = onnx_file_name
+        # Sparse mode also loads BGE-M3's sparse head, for the *_with_sparse methods.
+        self.sparse = sparse
+        self._sparse_linear: Optional['torch.nn.Linear'] = None
+        # With lazy_load the model is loaded by load()/warmup() or on first use, not here.
+        self._model: Optional['SentenceTransformer'] = None
+        self._model_lock = threading.Lock()
+        if not lazy_load:
+            self.load()
+        self.cache = cache
+        # With a scheduler, query encodes preempt ingestion, which is fed in bulk_slice_size slices.
+        self.scheduler = scheduler
+        self.bulk_slice_size = max(1, bulk_slice_size)
+        # Length-sorted batching: group texts of similar token length so each batch pads less.
+        self.sort_by_length = sort_by_length
+        self.encode_batch_size = max(1, encode_batch_size)
+        self.max_batch_tokens = max_batch_tokens
+        # With a process pool, large bulk requests are sharded across worker processes.
+        self.pool = pool
+        # With a batching window, concurrent callers share one model.encode call.
+        self._batcher: Optional[MicroBatcher] = None
+        if batch_window_ms > 0:
+            self._batcher = MicroBatcher(self._encode_batch, max_batch_size=max_batch_size, max_wait_ms=batch_window_ms)
+        print(f"EmbeddingService initialized with multimodal model: {model_name} (backend={backend}, lazy_load={lazy_load})")
+
+    @property
+    def cache_namespace(self) -> str:
+        """
+        The embedding cache namespace: the model plus the inference backend, so vectors from
+        the int8 or ONNX backend are never served to an fp32 service or the other way round.
+        The fp32 'torch' backend keeps the bare model name used by existing caches.
+        """
+        if self.backend == 'torch':
+            return self.model_name
+        if self.onnx_file_name and self.backend == 'onnx':
+            return f"{self.model_name}|{self.backend}|{self.onnx_file_name}"
+        return f"{self.model_name}|{self.backend}"
+
+    @property
+    def model(self) -> 'SentenceTransformer':
+        if self._model is None:
+            self.load()
+        return self._model
+
+    def load(self) -> None:
+        """Loads the model if it is not loaded yet. Safe to call from several threads."""
+        with self._model_lock:
+            if self._model is None:
+                self._model = load_sentence_transformer(self.model_name, backend=self.backend, onnx_file_name=self.onnx_file_name)
+            if self.sparse and self._sparse_linear is None:
+                self._sparse_linear = load_sparse_linear(self.model_name)
+
+    @property
+    def sparse_linear(self) -> 'torch.nn.Linear':
+        if self._sparse_linear is None:
+            self.load()
+        return self._sparse_linear
+
+    def warmup(self) -> None:
+        """Loads the model and runs one small encode so the first real request skips the one-off setup cost."""
+        self.load()
+        if self.sparse:
+            self._model_encode_with_sparse(["warmup"])
+        else:
+            self.model.encode(["warmup"], normalize_embeddings=True)
+        if self.pool is not None:
+            self.pool.warmup()
+
+    def _model_encode(self, texts: List[str]) -> np.ndarray:
+        if self.sort_by_length:
+            # Batches are already length-homogeneous; encode each as a single forward pass.
+            return self.model.encode(texts, normalize_embeddings=True, batch_size=len(texts))
+        return self.model.encode(texts, normalize_embeddings=True)
+
+    def _model_encode_with_sparse(self, texts: List[str]) -> Tuple[np.ndarray, List[SparseWeights]]:
+        """
+        One forward pass for both outputs: the pooled dense vectors, L2-normalized, and, from the
+        same token states, BGE-M3's sparse weights (relu(sparse_linear(state)) per token, the
+        maximum over repeats of a token, special tokens dropped).
+        """
+        import torch
+        outputs = self.model.encode(texts, output_value=None, normalize_embeddings=True, batch_size=self.encode_batch_size)
+        special_ids = set(getattr(self.model.tokenizer, 'all_special_ids', []))
+        dense = np.stack([output['sentence_embedding'].float().cpu().numpy() for output in outputs]).astype(np.float32)
+        # encode() skips normalize_embeddings when output_value is None; normalize here so the
+        # vectors match the dense path (hot index dot products, semantic cache threshold).
+        norms = np.linalg.norm(dense, axis=1, keepdims=True)
+        dense /= np.where(norms > 0, norms, 1.0)
+        weights: List[SparseWeights] = []
+        with torch.inference_mode():
+            for output in outputs:
+                token_weights = torch.relu(self.sparse_linear(output['token_embeddings'].float().cpu())).squeeze(-1)
+                text_weights: SparseWeights = {}
+                for token_id, mask, weight in zip(output['input_ids'].tolist(), output['attention_mask'].tolist(), token_weights.tolist()):
+                    if mask and weight > 0 and token_id not in special_ids and weight > text_weights.get(token_id, 0.0):
+                        text_weights[token_id] = weight
+                weights.append(text_weights)
+        return dense, weights
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Runs one interactive-priority encode, through the scheduler when one is configured."""
+        if self.scheduler is not None:
+            return self.scheduler.run(self._model_encode, texts, priority=Priority.INTERACTIVE)
+        return self._model_encode(texts)
+
+    def _encode_bulk(self, texts: List[str]) -> np.ndarray:
+        """Encodes ingestion texts as preemptible bulk slices on the scheduler."""
+        slices = [
+            self.scheduler.run(self._model_encode, texts[i:i + self.bulk_slice_size], priority=Priority.BULK)
+            for i in range(0, len(texts), self.bulk_slice_size)
+        ]
+        return np.vstack(slices)
+
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        """Token length of each text (capped at the model's max_seq_length), or its character length without a tokenizer."""
+        tokenizer = getattr(self.model, 'tokenizer', None)
+        max_length = getattr(self.model, 'max_seq_length', None)
+        if tokenizer is None:
+            lengths = [len(text) for text in texts]
+        else:
+            encoded = tokenizer(texts, add_special_tokens=False, return_length=True, return_attention_mask=False, verbose=False)
+            lengths = list(encoded['length'])
+        if isinstance(max_length, int):
+            lengths = [min(length, max_length) for length in lengths]
+        return lengths
+
+    def _length_sorted_batches(self, texts: List[str]) -> List[List[int]]:
+        """
+        Groups text indices into batches of similar length, longest first. A batch is closed when it
+        reaches encode_batch_size texts or when its padded size (count x longest) would exceed max_batch_tokens.
+        """
+        lengths = self._token_lengths(texts)
+        order = sorted(range(len(texts)), key=lambda i: lengths[i], reverse=True)
+        batches: List[List[int]] = []
+        current: List[int] = []
+        for index in order:
+            # Sorted descending, so the first member is the longest and sets the padded width.
+            longest = lengths[current[0]] if current else lengths[index]
+            full = len(current) >= self.encode_batch_size
+            over_budget = self.max_batch_tokens is not None and (len(current) + 1) * max(longest, 1) > self.max_batch_tokens
+            if current and (full or over_budget):
+                batches.append(current)
+                current = []
+            current.append(index)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _encode(self, texts: List[str], priority: Priority = Priority.BULK) -> np.ndarray:
+        """
+        Encodes texts, in length-sorted batches for bulk work when enabled. Large bulk
+        requests go to the process pool when one is configured. Results are returned in
+        the original order.
+        """
+        if self.pool is not None and priority == Priority.BULK and len(texts) >= self.pool.min_texts:
+            return self.pool.encode(texts, self.model.get_sentence_embedding_dimension())
+        if not (self.sort_by_length and priority == Priority.BULK and len(texts) > 1):
+            return self._encode_unsorted(texts, priority)
+        result: Optional[np.ndarray] = None
+        for batch in self._length_sorted_batches(texts):
+            vectors = np.asarray(self._encode_unsorted([texts[i] for i in batch], priority))
+            if result is None:
+                result = np.empty((len(texts), vectors.shape[1]), dtype=vectors.dtype)
+            result[batch] = vectors
+        return result
+
+    def _encode_unsorted(self, texts: List[str], priority: Priority = Priority.BULK) -> np.ndarray:
+        """
+        Encodes texts. Bulk work goes to the scheduler in slices; interactive work goes
+        through the micro-batcher when enabled, otherwise straight to the model.
+        """
+        if self.scheduler is not None and priority == Priority.BULK:
+            return self._encode_bulk(texts)
+        if self._batcher is not None:
+            return self._batcher.submit(texts)
+        return self._encode_batch(texts)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns cache, micro-batching, scheduler and process-pool metrics for monitoring."""
+        return {
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "batcher": self._batcher.stats() if self._batcher is not None else None,
+            "scheduler": self.scheduler.stats() if self.scheduler is not None else None,
+            "pool": self.pool.stats() if self.pool is not None else None,
+        }
+
+    def close(self) -> None:
+        if self._batcher is not None:
+            self._batcher.close()
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """
         Embeds a list of text documents. This method is required by LangChain.
+        Thin list wrapper around the same encode path as embed_documents_array.
         """
         if not texts: return []
         print(f"Embedding a batch of {len(texts)} text documents...")
-        return self.model.encode(texts, normalize_embeddings=True).tolist()
+        return self._encode_documents(texts).tolist()
+
+    def embed_documents_array(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds a list of text documents as a contiguous (len(texts), dim) float32 array,
+        avoiding the per-float boxing of embed_documents.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        print(f"Embedding a batch of {len(texts)} text documents...")
+        return np.ascontiguousarray(self._encode_documents(texts), dtype=np.float32)
+
+    def _encode_documents(self, texts: List[str]) -> np.ndarray:
+        """
+        Encodes texts into an embedding matrix, serving repeated chunks from the cache
+        and only sending cache misses to the model.
+        """
+        if self.cache is None:
+            return self._encode(texts)
+
+        cached = self.cache.get_many(self.cache_namespace, texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            encoded = np.asarray(self._encode(missing_texts), dtype=np.float32)
+            self.cache.put_many(self.cache_namespace, missing_texts, encoded)
+            for i, vector in zip(missing, encoded):
+                cached[i] = vector
+        print(f"Embedding cache: {len(texts) - len(missing)} hit(s), {len(missing)} miss(es).")
+        return np.vstack(cached)
 
     def embed_query(self, text: str) -> List[float]:
         """
@@ -27,7 +341,102 @@ class EmbeddingService(Embeddings):
         """
         if not text: return []
         print(f"Embedding single query: '{text[:50]}...'")
-        return self.model.encode(text, normalize_embeddings=True).tolist()
+        return self._encode_query(text).tolist()
+
+    def embed_query_array(self, text: str) -> np.ndarray:
+        """
+        Embeds a single query string as a contiguous float32 vector.
+        """
+        if not text:
+            return np.empty((0,), dtype=np.float32)
+        return np.ascontiguousarray(self._encode_query(text), dtype=np.float32)
+
+    def embed_queries_array(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds several query strings in one interactive-priority encode call, as a contiguous
+        (len(texts), dim) float32 array. Used to answer a batch of questions.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.ascontiguousarray(self._encode(texts, priority=Priority.INTERACTIVE), dtype=np.float32)
+
+    def _encode_query(self, text: str) -> np.ndarray:
+        if self._batcher is not None or self.scheduler is not None:
+            return self._encode([text], priority=Priority.INTERACTIVE)[0]
+        return self.model.encode(text, normalize_embeddings=True)
+
+    def embed_documents_with_sparse(self, texts: List[str]) -> Tuple[np.ndarray, List[SparseWeights]]:
+        """
+        Embeds documents as dense vectors plus BGE-M3 sparse weights from the same forward pass.
+        Texts whose dense vector and sparse weights are both in the embedding cache skip the
+        model; only the misses are encoded, as preemptible bulk slices on the scheduler like
+        embed_documents_array. The process pool and the micro-batcher are dense-only and not used.
+
+        Returns:
+            Tuple[np.ndarray, List[SparseWeights]]: A (len(texts), dim) float32 matrix and one
+            token ID -> weight dict per text.
+
+        Raises:
+            ValueError: If the service was not created with sparse=True.
+        """
+        if not self.sparse:
+            raise ValueError("embed_documents_with_sparse requires EmbeddingService(sparse=True).")
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32), []
+        print(f"Embedding a batch of {len(texts)} text documents with sparse weights...")
+        if self.cache is None:
+            return self._encode_with_sparse_bulk(texts)
+
+        cached = self.cache.get_many(self.cache_namespace, texts)
+        cached_weights = self.cache.get_many_sparse(self.cache_namespace, texts)
+        missing = [i for i in range(len(texts)) if cached[i] is None or cached_weights[i] is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            dense, weights = self._encode_with_sparse_bulk(missing_texts)
+            self.cache.put_many(self.cache_namespace, missing_texts, dense)
+            self.cache.put_many_sparse(self.cache_namespace, missing_texts, weights)
+            for i, vector, text_weights in zip(missing, dense, weights):
+                cached[i] = vector
+                cached_weights[i] = text_weights
+        print(f"Embedding cache (sparse): {len(texts) - len(missing)} hit(s), {len(missing)} miss(es).")
+        return np.ascontiguousarray(np.vstack(cached), dtype=np.float32), cached_weights
+
+    def _encode_with_sparse_bulk(self, texts: List[str]) -> Tuple[np.ndarray, List[SparseWeights]]:
+        """Runs the dense + sparse encode, in bulk slices on the scheduler when one is configured."""
+        if self.scheduler is None:
+            return self._model_encode_with_sparse(texts)
+        parts = [
+            self.scheduler.run(self._model_encode_with_sparse, texts[i:i + self.bulk_slice_size], priority=Priority.BULK)
+            for i in range(0, len(texts), self.bulk_slice_size)
+        ]
+        return np.vstack([part[0] for part in parts]), [text_weights for part in parts for text_weights in part[1]]
+
+    def embed_query_with_sparse(self, text: str) -> Tuple[np.ndarray, SparseWeights]:
+        """
+        Embeds a query as a dense vector plus BGE-M3 sparse weights from one forward pass, at
+        interactive priority on the scheduler.
+
+        Raises:
+            ValueError: If the service was not created with sparse=True.
+        """
+        if not self.sparse:
+            raise ValueError("embed_query_with_sparse requires EmbeddingService(sparse=True).")
+        dense, weights = self.embed_queries_with_sparse([text])
+        return dense[0], weights[0]
+
+    def embed_queries_with_sparse(self, texts: List[str]) -> Tuple[np.ndarray, List[SparseWeights]]:
+        """
+        Embeds several queries as dense vectors plus BGE-M3 sparse weights in one forward
+        pass, at interactive priority on the scheduler.
+
+        Raises:
+            ValueError: If the service was not created with sparse=True.
+        """
+        if not self.sparse:
+            raise ValueError("embed_queries_with_sparse requires EmbeddingService(sparse=True).")
+        if self.scheduler is not None:
+            return self.scheduler.run(self._model_encode_with_sparse, texts, priority=Priority.INTERACTIVE)
+        return self._model_encode_with_sparse(texts)
 
     def embed_image(self, image_path: str) -> List[float]:
         """
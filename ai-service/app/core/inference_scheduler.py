@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Callable, Deque, Dict, Optional
+
+
+class Priority(IntEnum):
+    """Scheduling classes for model inference; lower values run first."""
+    INTERACTIVE = 0
+    BULK = 1
+
+
+@dataclass
+class _Task:
+    fn: Callable[..., Any]
+    args: tuple
+    kwargs: dict
+    priority: Priority
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class InferenceScheduler:
+    """
+    Serializes model inference on one thread and always runs interactive work
+    (query embeddings, reranking) ahead of bulk ingestion work.
+
+    Bulk callers are expected to submit small slices so an interactive task never waits
+    behind more than one slice. Two starvation limits keep ingestion moving under a steady
+    stream of queries: a bulk task that has waited longer than max_bulk_wait_ms runs next,
+    and so does a pending bulk task after max_interactive_streak interactive tasks in a row.
+    """
+
+    def __init__(self, max_bulk_wait_ms: float = 2000.0, max_interactive_streak: int = 16):
+        self.max_bulk_wait = max_bulk_wait_ms / 1000.0
+        self.max_interactive_streak = max(1, max_interactive_streak)
+        self._queues: Dict[Priority, Deque[_Task]] = {p: deque() for p in Priority}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._streak = 0
+        self._executed = {p.name.lower(): 0 for p in Priority}
+        self._total_wait = {p.name.lower(): 0.0 for p in Priority}
+        self._starvation_promotions = 0
+        self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._thread.start()
+        print(f"InferenceScheduler started with max_bulk_wait_ms={max_bulk_wait_ms}, max_interactive_streak={max_interactive_streak}")
+
+    def submit(self, fn: Callable[..., Any], *args: Any, priority: Priority = Priority.BULK, **kwargs: Any) -> Future:
+        """Queues fn(*args, **kwargs) and returns a Future for its result."""
+        task = _Task(fn=fn, args=args, kwargs=kwargs, priority=priority)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("InferenceScheduler is closed.")
+            self._queues[priority].append(task)
+            self._cond.notify()
+        return task.future
+
+    def run(self, fn: Callable[..., Any], *args: Any, priority: Priority = Priority.BULK, **kwargs: Any) -> Any:
+        """Queues fn and blocks until it has run. Must not be called from the scheduler thread."""
+        if threading.current_thread() is self._thread:
+            return fn(*args, **kwargs)
+        return self.submit(fn, *args, priority=priority, **kwargs).result()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": {p.name.lower(): len(q) for p, q in self._queues.items()},
+                "executed": dict(self._executed),
+                "avg_wait_ms": {
+                    name: (self._total_wait[name] / count * 1000.0) if count else 0.0
+                    for name, count in self._executed.items()
+                },
+                "starvation_promotions": self._starvation_promotions,
+            }
+
+    def _next_task(self) -> Optional[_Task]:
+        """Picks the next task; the caller must hold the condition lock."""
+        interactive = self._queues[Priority.INTERACTIVE]
+        bulk = self._queues[Priority.BULK]
+        if bulk and interactive:
+            waited = time.perf_counter() - bulk[0].enqueued_at
+            if waited >= self.max_bulk_wait or self._streak >= self.max_interactive_streak:
+                self._starvation_promotions += 1
+                self._streak = 0
+                return bulk.popleft()
+        if interactive:
+            self._streak += 1
+            return interactive.popleft()
+        if bulk:
+            self._streak = 0
+            return bulk.popleft()
+        return None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    task = self._next_task()
+                name = task.priority.name.lower()
+                self._executed[name] += 1
+                self._total_wait[name] += time.perf_counter() - task.enqueued_at
+            if not task.future.set_running_or_notify_cancel():
+                continue
+            try:
+                task.future.set_result(task.fn(*task.args, **task.kwargs))
+            except Exception as e:
+                task.future.set_exception(e)
@@ -0,0 +1,219 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Protocol
+
+
+class JobQueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class JobStatusStore(Protocol):
+    """Where job states are shared between processes, e.g. app.core.sidecar.SidecarClient."""
+
+    def put_job(self, job: Dict[str, Any]) -> None: ...
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]: ...
+
+
+@dataclass
+class Job:
+    """A single unit of background work and its current state."""
+    job_id: str
+    handler: Optional[Callable[[], Awaitable[Any]]]
+    status: str = 'queued'
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Awaited if the job is dropped at shutdown without running, so its caller still hears back.
+    on_drop: Optional[Callable[['Job'], Awaitable[Any]]] = field(default=None, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    An in-process background job queue backed by a bounded asyncio.Queue
+    and a fixed pool of worker tasks.
+
+    With a status_store, every state change of a job is also written there, so the status
+    of a job queued by one API worker process can be read by any of them.
+    """
+
+    def __init__(self, num_workers: int = 2, max_queue_size: int = 100, max_finished_jobs: int = 1000, status_store: Optional[JobStatusStore] = None):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1.")
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.max_finished_jobs = max_finished_jobs
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._jobs: Dict[str, Job] = {}
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+        self.status_store = status_store
+        print(f"JobQueue initialized with num_workers={num_workers}, max_queue_size={max_queue_size}")
+
+    async def start(self) -> None:
+        """Creates the queue and spawns the worker tasks on the running loop."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"job-worker-{i}")
+            for i in range(self.num_workers)
+        ]
+
+    async def stop(self, drain_timeout: float = 0.0) -> None:
+        """
+        Stops the worker tasks. Queued jobs get up to drain_timeout seconds to finish; then
+        running jobs are cancelled and jobs still queued are marked failed and their on_drop
+        callbacks awaited.
+        """
+        if self._queue is not None and self._workers and drain_timeout > 0:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                print(f"JobQueue: jobs still pending after {drain_timeout}s, cancelling them.")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        dropped: List[Job] = []
+        while self._queue is not None and not self._queue.empty():
+            job = self._queue.get_nowait()
+            job.status = 'failed'
+            job.error = "Dropped: the service shut down before the job ran."
+            job.finished_at = time.time()
+            job.handler = None
+            self._remember_finished(job)
+            self._publish(job)
+            self._queue.task_done()
+            dropped.append(job)
+        await asyncio.gather(*(self._notify_dropped(job) for job in dropped))
+
+    async def _notify_dropped(self, job: Job) -> None:
+        if job.on_drop is None:
+            return
+        try:
+            await job.on_drop(job)
+        except Exception as e:
+            print(f"Job {job.job_id}: on_drop callback failed: {e}")
+
+    async def join(self) -> None:
+        """Waits until every queued job has been processed."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    def submit(
+        self,
+        handler: Callable[[], Awaitable[Any]],
+        job_id: Optional[str] = None,
+        on_drop: Optional[Callable[[Job], Awaitable[Any]]] = None,
+    ) -> Job:
+        """
+        Enqueues a job without waiting for it to run.
+
+        Args:
+            handler: A zero-argument callable returning the coroutine to run.
+            job_id: Optional explicit job ID. A random one is generated otherwise.
+            on_drop: Optional callback awaited with the job if the queue stops before it runs.
+
+        Returns:
+            Job: The queued job record.
+
+        Raises:
+            RuntimeError: If the queue has not been started.
+            JobQueueFullError: If the queue is at capacity.
+        """
+        if self._queue is None:
+            raise RuntimeError("JobQueue has not been started.")
+        job = Job(job_id=job_id or uuid.uuid4().hex, handler=handler, on_drop=on_drop)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFullError(f"Job queue is full ({self.max_queue_size} jobs pending).")
+        self._jobs[job.job_id] = job
+        self._publish(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the state of a job queued by this process or, through the status store, by another one."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.status_store is None:
+            return None
+        try:
+            return self.status_store.get_job(job_id)
+        except Exception as e:
+            print(f"JobQueue: could not read job {job_id} from the status store: {e}")
+            return None
+
+    def _publish(self, job: Job) -> None:
+        if self.status_store is None:
+            return
+        try:
+            self.status_store.put_job(job.to_dict())
+        except Exception as e:
+            print(f"Job {job.job_id}: could not publish its status: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        counts = {"queued": 0, "running": 0, "finished": 0, "failed": 0}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        counts["workers"] = len(self._workers)
+        return counts
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = 'running'
+            job.started_at = time.time()
+            self._publish(job)
+            try:
+                job.result = await job.handler()
+                if isinstance(job.result, dict) and job.result.get('status') == 'ERROR':
+                    # The handler caught its own failure and reported it in the result.
+                    job.status = 'failed'
+                    job.error = job.result.get('error') or "The job reported an error."
+                    print(f"Job {job.job_id} failed on worker {index}: {job.error}")
+                else:
+                    job.status = 'finished'
+            except asyncio.CancelledError:
+                job.status = 'failed'
+                job.error = "Cancelled: the service shut down while the job was running."
+                raise
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(e)
+                print(f"Job {job.job_id} failed on worker {index}: {e}")
+            finally:
+                job.finished_at = time.time()
+                job.handler = None
+                job.on_drop = None
+                self._remember_finished(job)
+                self._publish(job)
+                self._queue.task_done()
+
+    def _remember_finished(self, job: Job) -> None:
+        """Keeps a bounded history of finished jobs for status lookups."""
+        self._finished[job.job_id] = None
+        while len(self._finished) > self.max_finished_jobs:
+            old_id, _ = self._finished.popitem(last=False)
+            self._jobs.pop(old_id, None)
@@ -0,0 +1,35 @@
+import importlib
+from typing import Any, Callable, Dict, Tuple
+
+
+def lazy_imports(
+    module_globals: Dict[str, Any],
+    names: Dict[str, Tuple[str, str]],
+) -> Tuple[Callable[[str], Any], Callable[[str], Any]]:
+    """
+    Defers heavy imports (torch through sentence-transformers, the Gemini client) until first use,
+    so importing the app takes well under a second instead of several.
+
+    The deferred names stay module attributes, so `mocker.patch('app.core.pipeline.CrossEncoder')`
+    keeps working. Code inside the module must resolve them through the returned loader.
+
+    Args:
+        module_globals: The calling module's globals().
+        names: Maps each attribute name to its (module, attribute) source.
+
+    Returns:
+        A (load, __getattr__) pair: load(name) imports and caches one name, and __getattr__
+        is meant to be assigned as the module-level __getattr__ (PEP 562).
+    """
+    def load(name: str) -> Any:
+        if name not in module_globals:
+            module_name, attribute = names[name]
+            module_globals[name] = getattr(importlib.import_module(module_name), attribute)
+        return module_globals[name]
+
+    def module_getattr(name: str) -> Any:
+        if name in names:
+            return load(name)
+        raise AttributeError(f"module {module_globals['__name__']!r} has no attribute {name!r}")
+
+    return load, module_getattr
@@ -0,0 +1,250 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+Posting = Tuple[str, str, float, float]
+
+# Thai is written without spaces between words; runs of Thai script are indexed as
+# overlapping character bigrams, which needs no dictionary and matches any substring of
+# two or more characters. Other scripts are split into words; joined codes, dates and
+# versions ("AB-1234", "15/10/2567", "v2.1") are kept whole as well as split into parts.
+_THAI = r"\u0e00-\u0e7f"
+_WORD = rf"[^\W_{_THAI}]+"
+_TOKEN_RE = re.compile(rf"([{_THAI}]+)|({_WORD}(?:[-_./:]{_WORD})*)")
+_PART_RE = re.compile(_WORD)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into case-folded index terms.
+
+    Args:
+        text (str): Text in any mix of Thai and space-delimited scripts.
+
+    Returns:
+        List[str]: The terms, with repeats, in order of appearance.
+    """
+    terms: List[str] = []
+    for thai, word in _TOKEN_RE.findall(unicodedata.normalize("NFC", text).casefold()):
+        if thai:
+            if len(thai) == 1:
+                terms.append(thai)
+            else:
+                terms.extend(thai[i:i + 2] for i in range(len(thai) - 1))
+        else:
+            terms.append(word)
+            parts = _PART_RE.findall(word)
+            if len(parts) > 1:
+                terms.extend(parts)
+    return terms
+
+
+class ChunkPostingsIndex:
+    """
+    SQLite storage shared by the lexical indexes: chunk texts scoped by user and document,
+    and a (term, chunk, weight) postings table. Subclasses decide what the terms and weights
+    are and how matches are scored.
+
+    Chunks are stored under the same IDs as in the vector store, with their user_id and
+    document_id, so every search is scoped to one user's document like the dense retriever.
+    ProcessingPipeline keeps the index in step with the vector store: chunks are written with
+    every upserted batch and deleted when a re-ingested file no longer produces them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened on first use so constructing the index never touches the disk.
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "chunk_id TEXT PRIMARY KEY, user_id TEXT, document_id TEXT, length REAL NOT NULL, "
+                "content TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_scope ON chunks(user_id, document_id)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                "term TEXT NOT NULL, chunk_id TEXT NOT NULL, weight REAL NOT NULL, PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def _delete_chunks(conn: sqlite3.Connection, ids: Sequence[str]) -> None:
+        # Stay well below SQLite's bound-parameter limit.
+        for i in range(0, len(ids), 500):
+            batch = list(ids[i:i + 500])
+            placeholders = ",".join("?" * len(batch))
+            conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({placeholders})", batch)
+            conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", batch)
+
+    def _write(self, documents: List[Document], ids: List[str], term_weights: List[Dict[str, float]]) -> None:
+        """Replaces the chunks stored under ids with the documents and their term weights."""
+        if not (len(documents) == len(ids) == len(term_weights)):
+            raise ValueError("The number of documents, IDs and term weights must match.")
+        if not documents:
+            return
+        chunk_rows = []
+        posting_rows = []
+        for doc, chunk_id, weights in zip(documents, ids, term_weights):
+            metadata = doc.metadata or {}
+            chunk_rows.append((
+                chunk_id,
+                metadata.get('user_id'),
+                metadata.get('document_id'),
+                sum(weights.values()),
+                doc.page_content,
+                json.dumps(metadata, ensure_ascii=False, default=str),
+            ))
+            posting_rows.extend((term, chunk_id, weight) for term, weight in weights.items())
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                self._delete_chunks(conn, ids)
+                conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?)", chunk_rows)
+                conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", posting_rows)
+        print(f"{type(self).__name__} indexed {len(documents)} chunks ({len(posting_rows)} postings).")
+
+    def delete(self, ids: List[str]) -> None:
+        """Removes chunks from the index by ID."""
+        if not ids:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                self._delete_chunks(conn, ids)
+
+    def missing_ids(self, ids: Sequence[str]) -> List[str]:
+        """Returns the IDs that are not indexed."""
+        found = set()
+        with self._lock:
+            conn = self._connection()
+            for i in range(0, len(ids), 500):
+                batch = list(ids[i:i + 500])
+                placeholders = ",".join("?" * len(batch))
+                found.update(row[0] for row in conn.execute(f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({placeholders})", batch))
+        return [chunk_id for chunk_id in ids if chunk_id not in found]
+
+    def _search(
+        self,
+        terms: Sequence[str],
+        user_id: str,
+        document_id: str,
+        k: int,
+        score: Callable[[List[Posting], int, float], Dict[str, float]],
+    ) -> List[Document]:
+        """
+        Scores the scope's chunks that share a term with the query and returns the top k.
+        score receives the matching (term, chunk_id, weight, chunk length) postings, the
+        number of chunks in the scope and their average length, and returns chunk ID -> score.
+        """
+        if not terms or k <= 0:
+            return []
+        with self._lock:
+            conn = self._connection()
+            total, average_length = conn.execute(
+                "SELECT COUNT(*), AVG(length) FROM chunks WHERE user_id = ? AND document_id = ?",
+                (user_id, document_id),
+            ).fetchone()
+            if not total:
+                return []
+            placeholders = ",".join("?" * len(terms))
+            postings = conn.execute(
+                "SELECT p.term, p.chunk_id, p.weight, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id "
+                f"WHERE p.term IN ({placeholders}) AND c.user_id = ? AND c.document_id = ?",
+                [*terms, user_id, document_id],
+            ).fetchall()
+            scores = score(postings, total, average_length or 1.0)
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            if not top:
+                return []
+            top_ids = [chunk_id for chunk_id, _ in top]
+            rows = conn.execute(
+                f"SELECT chunk_id, content, metadata FROM chunks WHERE chunk_id IN ({','.join('?' * len(top_ids))})",
+                top_ids,
+            ).fetchall()
+        stored = {chunk_id: (content, metadata) for chunk_id, content, metadata in rows}
+        return [
+            Document(id=chunk_id, page_content=stored[chunk_id][0], metadata=json.loads(stored[chunk_id][1]))
+            for chunk_id in top_ids
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            conn = self._connection()
+            chunks = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            postings = conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+        return {"chunks": chunks, "postings": postings}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class LexicalIndex(ChunkPostingsIndex):
+    """
+    A persistent BM25 inverted index of chunks stored in SQLite. Terms come from tokenize()
+    and posting weights are term frequencies.
+    """
+
+    def __init__(self, path: str = './lexical_index.sqlite3', k1: float = 1.2, b: float = 0.75):
+        super().__init__(path)
+        self.k1 = k1
+        self.b = b
+        print(f"LexicalIndex initialized at {path} with k1={k1}, b={b}")
+
+    def upsert(self, documents: List[Document], ids: List[str]) -> None:
+        """
+        Indexes chunks, replacing any previous version stored under the same IDs.
+
+        Args:
+            documents (List[Document]): Chunks with user_id and document_id metadata.
+            ids (List[str]): One chunk ID per document, as used in the vector store.
+        """
+        if len(documents) != len(ids):
+            raise ValueError("The number of documents must match the number of IDs.")
+        self._write(documents, ids, [dict(Counter(tokenize(doc.page_content))) for doc in documents])
+
+    def search(self, query: str, user_id: str, document_id: str, k: int = 10) -> List[Document]:
+        """
+        Ranks the chunks of one user's document against the query with BM25.
+
+        Args:
+            query (str): The question.
+            user_id (str): The owner of the document.
+            document_id (str): The document to search.
+            k (int): The number of chunks to return.
+
+        Returns:
+            List[Document]: Up to k chunks, best first, with their stored metadata and ID.
+        """
+        return self._search(list(dict.fromkeys(tokenize(query))), user_id, document_id, k, self._bm25)
+
+    def _bm25(self, postings: List[Posting], total: int, average_length: float) -> Dict[str, float]:
+        document_frequency = Counter(term for term, _, _, _ in postings)
+        scores: Dict[str, float] = {}
+        for term, chunk_id, tf, length in postings:
+            df = document_frequency[term]
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return scores
@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+
+@dataclass
+class _EncodeRequest:
+    texts: List[str]
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class MicroBatcher:
+    """
+    Collects concurrent encode requests into a single model call.
+
+    A background thread waits for the first request, then keeps gathering requests for up to
+    max_wait_ms or until max_batch_size texts are pending, runs encode_fn once on all of them
+    and hands each caller back its own rows.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[_EncodeRequest | None]" = queue.Queue()
+        self._metrics_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._requests = 0
+        self._max_batch = 0
+        self._total_delay = 0.0
+        self._max_delay = 0.0
+        self._thread = threading.Thread(target=self._run, name="embedding-micro-batcher", daemon=True)
+        self._thread.start()
+        print(f"MicroBatcher started with max_batch_size={self.max_batch_size}, max_wait_ms={max_wait_ms}")
+
+    def submit(self, texts: List[str]) -> np.ndarray:
+        """
+        Queues texts for the next batch and blocks until their embeddings are ready.
+
+        Returns:
+            np.ndarray: One row per input text, in order.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        request = _EncodeRequest(texts=list(texts))
+        self._queue.put(request)
+        return request.future.result()
+
+    def close(self) -> None:
+        """Stops the background thread after the pending requests are served."""
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            batches = self._batches or 1
+            requests = self._requests or 1
+            return {
+                "batches": self._batches,
+                "requests": self._requests,
+                "items": self._items,
+                "avg_batch_size": self._items / batches,
+                "max_batch_size": self._max_batch,
+                "avg_queue_delay_ms": self._total_delay / requests * 1000.0,
+                "max_queue_delay_ms": self._max_delay * 1000.0,
+            }
+
+    def _collect(self, first: _EncodeRequest) -> List[_EncodeRequest]:
+        batch = [first]
+        pending = len(first.texts)
+        deadline = time.perf_counter() + self.max_wait
+        while pending < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Re-queue the sentinel so the run loop exits after this batch.
+                self._queue.put(None)
+                break
+            batch.append(request)
+            pending += len(request.texts)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            started = time.perf_counter()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                vectors = self.encode_fn(texts)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            offset = 0
+            for request in batch:
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+            self._record(batch, len(texts), started)
+
+    def _record(self, batch: List[_EncodeRequest], size: int, started: float) -> None:
+        with self._metrics_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._items += size
+            self._max_batch = max(self._max_batch, size)
+            for request in batch:
+                delay = started - request.enqueued_at
+                self._total_delay += delay
+                self._max_delay = max(self._max_delay, delay)
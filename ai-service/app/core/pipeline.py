@@ -1,35 +1,121 @@
 import json
 import os
+import threading
 import asyncio
+import functools
+import hashlib
+import time
 import httpx
-from typing import List, Dict, Any, Tuple, Optional
+import numpy as np
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, List, Dict, Any, Tuple, Optional, Callable, Set
 from langchain_core.documents import Document
-from langchain_google_genai import ChatGoogleGenerativeAI
 
-from app.core.document_loader import load_from_source
+from app.core.document_loader import load_from_source, lazy_load_from_source
 from app.core.embedding_service import EmbeddingService
 from app.core.text_splitter import TextSplitterService
 from app.core.vector_store import VectorStoreService
-from sentence_transformers.cross_encoder import CrossEncoder
+from app.core.inference_scheduler import InferenceScheduler, Priority
+from app.core.answer_cache import AnswerCache
+from app.core.semantic_answer_cache import SemanticAnswerCache
+from app.core.rerank_cache import RerankScoreCache
+from app.core.lexical_index import LexicalIndex
+from app.core.sparse_index import SparseIndex, SparseWeights
+from app.core.document_vector_cache import DocumentVectorCache
+from app.core.rank_fusion import reciprocal_rank_fusion
+from app.core.lazy_imports import lazy_imports
 import textwrap
+
+if TYPE_CHECKING:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from sentence_transformers.cross_encoder import CrossEncoder
+
+_load, __getattr__ = lazy_imports(globals(), {"CrossEncoder": ("sentence_transformers.cross_encoder", "CrossEncoder")})
+
+
+def load_cross_encoder(model_name: str = 'cross-encoder/ms-marco-MiniLM-L-6-v2') -> 'CrossEncoder':
+    """Loads the reranking model."""
+    return _load("CrossEncoder")(model_name)
+
+
+@dataclass
+class IngestionReport:
+    """Chunk counts for one ingestion run, plus the stored hashes used for incremental diffing."""
+    added: int = 0
+    kept: int = 0
+    removed: int = 0
+    existing_hashes: Optional[Dict[str, Optional[str]]] = field(default=None, repr=False)
+    seen_ids: Set[str] = field(default_factory=set, repr=False)
+
+    def to_dict(self) -> Dict[str, int]:
+        return {"added": self.added, "kept": self.kept, "removed": self.removed}
+
+
 class ProcessingPipeline:
     
-    def __init__(self,text_splitter: TextSplitterService,embedding_service: EmbeddingService, vector_store_service: VectorStoreService): 
+    def __init__(
+        self,
+        text_splitter: TextSplitterService,
+        embedding_service: EmbeddingService,
+        vector_store_service: VectorStoreService,
+        io_executor: Optional[Executor] = None,
+        cpu_executor: Optional[Executor] = None,
+        streaming: bool = False,
+        batch_size: int = 64,
+        embed_batch_size: int = 32,
+        incremental: bool = False,
+        document_listeners: Optional[List[Callable[[str, str], None]]] = None,
+        lexical_index: Optional[LexicalIndex] = None,
+        sparse_index: Optional[SparseIndex] = None,
+    ): 
         self.text_splitter = text_splitter
         self.embedding_service = embedding_service
         self.vector_store_service = vector_store_service
+        # Blocking stages run off the event loop: downloads/disk reads on the I/O pool,
+        # parsing, splitting and encoding on the CPU pool. None means the loop's default executor.
+        self.io_executor = io_executor
+        self.cpu_executor = cpu_executor
+        # Streaming mode bounds memory by document size: pages flow through split/upsert in batches.
+        self.streaming = streaming
+        self.batch_size = max(1, batch_size)
+        # The pipeline owns embedding; the vector store only receives precomputed vectors.
+        self.embed_batch_size = max(1, embed_batch_size)
+        # Incremental mode diffs chunk hashes against what is stored for the file_id.
+        self.incremental = incremental
+        # Called with (user_id, document_id) after chunks of a document are written or deleted,
+        # so caches and indexes derived from the store can drop what they hold for it.
+        self.document_listeners = list(document_listeners or [])
+        # The BM25 index for hybrid retrieval is kept in step with the vector store.
+        self.lexical_index = lexical_index
+        # With a sparse index, chunks are encoded once for both dense vectors and BGE-M3 sparse weights.
+        self.sparse_index = sparse_index
         print(f"ProcessingPipeline initialized with TextSplitterService and VectorStoreService.")
+
+    async def _run_stage(self, executor: Optional[Executor], func: Callable[..., Any], *args: Any) -> Any:
+        """Runs a blocking pipeline stage on the given executor without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args))
+    def _notify_document_changed(self, user_id: str, document_id: str) -> None:
+        for listener in self.document_listeners:
+            try:
+                listener(user_id, document_id)
+            except Exception as e:
+                print(f'Document listener failed for document_id: {document_id}: {e}')
+
     def _prepare_documents_for_store(
         self,
         chunks: List[Document],
         file_id: str,
         user_id: str,
-        document_id: str
+        document_id: str,
+        start_index: int = 0
     ) -> Tuple[List[Document], List[str]]:
         """        Prepares lists of IDs, metadatas, and document contents from chunks.
+        start_index offsets the chunk numbers so streamed batches keep stable IDs.
         """
         ids = []
-        for i, chunk in enumerate(chunks):
+        for i, chunk in enumerate(chunks, start=start_index):
             
             chunk_id = f'{file_id}_chunk_{i}'
             ids.append(chunk_id)
@@ -38,13 +124,138 @@ class ProcessingPipeline:
             chunk.metadata['user_id'] = user_id
             chunk.metadata['document_id'] = document_id
             chunk.metadata['chunk_number'] = i
+            chunk.metadata['content_hash'] = self._chunk_hash(chunk)
             
             
         return chunks, ids
+
+    @staticmethod
+    def _chunk_hash(chunk: Document) -> str:
+        """Hashes a chunk's text and metadata so any change forces a re-embed."""
+        metadata = {k: v for k, v in chunk.metadata.items() if k != 'content_hash'}
+        payload = json.dumps(metadata, sort_keys=True, default=str) + '\x00' + chunk.page_content
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+            
+    async def _ingest(self, file_id: str, user_id: str, document_id: str, source_type: str, source_location: str, report: IngestionReport) -> None:
+        """Loads, splits and upserts the whole document in one pass."""
+        loaded_docs = await self._run_stage(self.io_executor, load_from_source, source_type, source_location)
+        if loaded_docs:
+            
+            chunks = await self._run_stage(self.cpu_executor, self.text_splitter.split_documents, loaded_docs)
+            
+            prepared_docs, doc_ids = self._prepare_documents_for_store(chunks, file_id, user_id,document_id)
+            
+            await self._upsert_batch(prepared_docs, doc_ids, report)
+
+    async def _ingest_streaming(self, file_id: str, user_id: str, document_id: str, source_type: str, source_location: str, report: IngestionReport) -> None:
+        """
+        Streams the document page by page: each page is split as it arrives and chunks are
+        upserted in fixed-size batches, so at most one page and one batch are held in memory.
+        """
+        pages = lazy_load_from_source(source_type, source_location)
+        pending: List[Document] = []
+        next_index = 0
+        while True:
+            page = await self._run_stage(self.io_executor, next, pages, None)
+            if page is None:
+                break
+            pending.extend(await self._run_stage(self.cpu_executor, self.text_splitter.split_documents, [page]))
+            while len(pending) >= self.batch_size:
+                batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+                prepared_docs, doc_ids = self._prepare_documents_for_store(batch, file_id, user_id, document_id, start_index=next_index)
+                await self._upsert_batch(prepared_docs, doc_ids, report)
+                next_index += len(batch)
+        if pending:
+            prepared_docs, doc_ids = self._prepare_documents_for_store(pending, file_id, user_id, document_id, start_index=next_index)
+            await self._upsert_batch(prepared_docs, doc_ids, report)
+            next_index += len(pending)
+        print(f'Streamed {next_index} chunks for file_id: {file_id}')
+
+    def _embed_documents(self, documents: List[Document]) -> np.ndarray:
+        """Embeds chunk texts in slices of embed_batch_size and returns a float32 matrix."""
+        texts = [doc.page_content for doc in documents]
+        vectors = [
+            self.embedding_service.embed_documents_array(texts[i:i + self.embed_batch_size])
+            for i in range(0, len(texts), self.embed_batch_size)
+        ]
+        # A single slice is passed through as-is; only multiple slices need a copy.
+        return vectors[0] if len(vectors) == 1 else np.concatenate(vectors)
+
+    def _embed_documents_with_sparse(self, documents: List[Document]) -> Tuple[np.ndarray, List[SparseWeights]]:
+        """Like _embed_documents, also returning each chunk's sparse weights from the same forward pass."""
+        texts = [doc.page_content for doc in documents]
+        parts = [
+            self.embedding_service.embed_documents_with_sparse(texts[i:i + self.embed_batch_size])
+            for i in range(0, len(texts), self.embed_batch_size)
+        ]
+        vectors = parts[0][0] if len(parts) == 1 else np.concatenate([part[0] for part in parts])
+        return vectors, [weights for part in parts for weights in part[1]]
+
+    def _update_lexical_index(self, documents: List[Document], ids: List[str], changed_ids: Set[str]) -> None:
+        """Indexes the changed chunks, plus unchanged ones the lexical index lacks (e.g. stored before it existed)."""
+        missing = set(self.lexical_index.missing_ids(ids))
+        selected = [(doc, doc_id) for doc, doc_id in zip(documents, ids) if doc_id in changed_ids or doc_id in missing]
+        if selected:
+            self.lexical_index.upsert([doc for doc, _ in selected], [doc_id for _, doc_id in selected])
+
+    async def _upsert_batch(self, documents: List[Document], ids: List[str], report: IngestionReport) -> None:
+        """
+        Embeds a batch on the CPU pool, then writes the vectors to the store on the I/O pool.
+        The lexical index is written last, so a failed embed or vector write never leaves it
+        with hits for chunks the vector store does not have.
+        """
+        report.seen_ids.update(ids)
+        batch_documents, batch_ids = documents, ids
+        if report.existing_hashes is not None:
+            sparse_missing: Set[str] = set()
+            if self.sparse_index is not None:
+                # Unchanged chunks the sparse index lacks (stored before it was enabled) need a forward pass for their weights.
+                sparse_missing = set(await self._run_stage(self.io_executor, self.sparse_index.missing_ids, ids))
+            changed = [
+                (doc, doc_id) for doc, doc_id in zip(documents, ids)
+                if report.existing_hashes.get(doc_id) != doc.metadata.get('content_hash') or doc_id in sparse_missing
+            ]
+            report.kept += len(documents) - len(changed)
+            documents = [doc for doc, _ in changed]
+            ids = [doc_id for _, doc_id in changed]
+        if not documents:
+            if self.lexical_index is not None:
+                await self._run_stage(self.io_executor, self._update_lexical_index, batch_documents, batch_ids, set())
+            return
+        report.added += len(documents)
+        started = time.perf_counter()
+        if self.sparse_index is not None:
+            embeddings, sparse_weights = await self._run_stage(self.cpu_executor, self._embed_documents_with_sparse, documents)
+        else:
+            embeddings = await self._run_stage(self.cpu_executor, self._embed_documents, documents)
+        embedded = time.perf_counter()
+        await self._run_stage(
+            self.io_executor,
+            functools.partial(self.vector_store_service.upsert_embeddings, documents=documents, ids=ids, embeddings=embeddings),
+        )
+        if self.sparse_index is not None:
+            await self._run_stage(self.io_executor, self.sparse_index.upsert, documents, ids, sparse_weights)
+        if self.lexical_index is not None:
+            await self._run_stage(self.io_executor, self._update_lexical_index, batch_documents, batch_ids, set(ids))
+        written = time.perf_counter()
+        print(f'Batch of {len(documents)} chunks: embed {embedded - started:.3f}s, write {written - embedded:.3f}s')
+        self._notify_document_changed(documents[0].metadata.get('user_id'), documents[0].metadata.get('document_id'))
+            
+    async def _remove_orphans(self, report: IngestionReport, user_id: str, document_id: str) -> None:
+        """Deletes stored chunks that the new version of the file no longer produces."""
+        orphan_ids = [doc_id for doc_id in report.existing_hashes if doc_id not in report.seen_ids]
+        if orphan_ids:
+            await self._run_stage(self.io_executor, self.vector_store_service.delete_documents, orphan_ids, user_id, document_id)
+            if self.lexical_index is not None:
+                await self._run_stage(self.io_executor, self.lexical_index.delete, orphan_ids)
+            if self.sparse_index is not None:
+                await self._run_stage(self.io_executor, self.sparse_index.delete, orphan_ids)
+        report.removed = len(orphan_ids)
             
-    async def execute(self, file_id: str, user_id: str,document_id:str, source_type: str, source_location: str,webhook_url: Optional[str]):
+    async def execute(self, file_id: str, user_id: str,document_id:str, source_type: str, source_location: str,webhook_url: Optional[str]) -> Dict[str, Any]:
         status_to_report = 'READY'
         error_msg = None
+        report = IngestionReport()
         try:
             
             print(f"Processing pipeline started for file_id: {file_id}")
@@ -52,21 +263,27 @@ class ProcessingPipeline:
             print(f'Processing pipeline started for user_id: {user_id}')
             # in future need process image file
             
-            loaded_docs =  load_from_source(source_type, source_location)
-            if loaded_docs:
-                
-                chunks =  self.text_splitter.split_documents(loaded_docs)
-                
-                prepared_docs, doc_ids = self._prepare_documents_for_store(chunks, file_id, user_id,document_id)
-                
-                self.vector_store_service.upsert_documents(
-                    documents=prepared_docs,
-                    ids=doc_ids,
-                )
+            if self.incremental:
+                report.existing_hashes = await self._run_stage(self.io_executor, self.vector_store_service.get_chunk_hashes, file_id, user_id, document_id)
+            if self.streaming:
+                await self._ingest_streaming(file_id, user_id, document_id, source_type, source_location, report)
+            else:
+                await self._ingest(file_id, user_id, document_id, source_type, source_location, report)
+            if report.existing_hashes:
+                await self._remove_orphans(report, user_id, document_id)
+                if report.removed:
+                    self._notify_document_changed(user_id, document_id)
+            print(f'Chunks for file_id {file_id}: {report.to_dict()}')
             
             print(f'Processing pipeline finished for file_id: {file_id}')
             # print(self.vector_store_service.peek_collection())
             
+        except asyncio.CancelledError:
+            # Shutdown cancelled the job mid-way; report it as failed, not READY.
+            status_to_report = 'ERROR'
+            error_msg = "Processing was cancelled because the service shut down."
+            print(f'Pipeline CANCELLED for file_id: {file_id}')
+            raise
         except Exception as e:
             status_to_report = 'ERROR'
             error_msg = str(e)
@@ -74,45 +291,153 @@ class ProcessingPipeline:
             
         finally:
             if webhook_url:
-                print(f"Sending status {status_to_report} back to webhook: {webhook_url}")
-                try:
-                    async with httpx.AsyncClient() as client:
-                        await client.patch(webhook_url, json={
-                            "fileId": file_id,
-                            "status": status_to_report,
-                            "errorMessage": error_msg
-                        })
-                except Exception as callback_error:
-                    print(f'FATAL: Could not send status update to webhook for file {file_id}: {callback_error}')
-            
+                await self.notify_webhook(webhook_url, file_id, status_to_report, error_msg)
+        return {"file_id": file_id, "status": status_to_report, "error": error_msg, "chunks": report.to_dict()}
+
+    async def notify_webhook(self, webhook_url: str, file_id: str, status_to_report: str, error_msg: Optional[str]) -> None:
+        """Sends the file's processing status back to the backend. Failures are logged, not raised."""
+        print(f"Sending status {status_to_report} back to webhook: {webhook_url}")
+        try:
+            async with httpx.AsyncClient() as client:
+                await client.patch(webhook_url, json={
+                    "fileId": file_id,
+                    "status": status_to_report,
+                    "errorMessage": error_msg
+                })
+        except Exception as callback_error:
+            print(f'FATAL: Could not send status update to webhook for file {file_id}: {callback_error}')
+
         
         
+NO_ANSWER = "I cannot find the answer in the provided documents."
+
+
+class LLMNotConfiguredError(Exception):
+    """Raised when a question is asked but the pipeline has no LLM (e.g. GOOGLE_API_KEY is not set)."""
+
+
+@dataclass
+class PreparedAnswer:
+    """One question's state between retrieval/reranking and the LLM call."""
+    user_id: str
+    document_id: str
+    question: str
+    settings: Tuple
+    index: int = 0
+    cache_key: Any = None
+    generation: Optional[int] = None
+    query_vector: Optional[np.ndarray] = field(default=None, repr=False)
+    semantic_generation: Optional[int] = None
+    final_docs: List[Document] = field(default_factory=list, repr=False)
+    prompt: Optional[str] = field(default=None, repr=False)
+    # Set when the answer is known without the LLM (cache hit, nothing retrieved).
+    result: Optional[Dict[str, Any]] = None
+
+
 class RagPipeline:
     
-    def __init__(self,vector_store: VectorStoreService,llm: Optional[ChatGoogleGenerativeAI] = None, cross_encoder_model_name: str = 'cross-encoder/ms-marco-MiniLM-L-6-v2'): 
+    def __init__(self,vector_store: VectorStoreService,llm: Optional['ChatGoogleGenerativeAI'] = None, cross_encoder_model_name: str = 'cross-encoder/ms-marco-MiniLM-L-6-v2', scheduler: Optional[InferenceScheduler] = None, lazy_load: bool = False, answer_cache: Optional[AnswerCache] = None, semantic_cache: Optional[SemanticAnswerCache] = None, embedding_service: Optional[EmbeddingService] = None, rerank_cache: Optional[RerankScoreCache] = None, lexical_index: Optional[LexicalIndex] = None, sparse_index: Optional[SparseIndex] = None, vector_cache: Optional[DocumentVectorCache] = None, llm_concurrency: int = 8, executor: Optional[Executor] = None, cross_encoder: Optional['CrossEncoder'] = None): 
         self.vector_store = vector_store
         self.llm = llm
-        self.cross_encoder = CrossEncoder(cross_encoder_model_name)
+        # Final answers are cached per (user, document, question, settings) when a cache is given.
+        self.answer_cache = answer_cache
+        # Paraphrases are matched by question embedding; that needs the embedding service.
+        self.semantic_cache = semantic_cache if embedding_service is not None else None
+        self.embedding_service = embedding_service
+        # Cross-encoder scores per (question, chunk); only uncached pairs are scored.
+        self.rerank_cache = rerank_cache
+        # With a lexical index, BM25 results are fused with the dense ones (hybrid retrieval).
+        self.lexical_index = lexical_index
+        # With a sparse index, BGE-M3 sparse weights of the question are matched too; needs the embedding service.
+        self.sparse_index = sparse_index if embedding_service is not None else None
+        # Hot documents are searched exactly in memory instead of through the filtered global index.
+        self.vector_cache = vector_cache if embedding_service is not None else None
+        # Upper bound on LLM calls in flight: per batch query, and across the async query path.
+        self.llm_concurrency = max(1, llm_concurrency)
+        self._llm_slots = asyncio.Semaphore(self.llm_concurrency)
+        # The async path runs embedding, retrieval and reranking here. None means the loop's default executor.
+        self.executor = executor
+        self.cross_encoder_model_name = cross_encoder_model_name
+        # With lazy_load the cross encoder is loaded by load()/warmup() or on the first rerank.
+        # A given one (e.g. the inference sidecar's, see app.core.sidecar) is used as is.
+        self._cross_encoder: Optional['CrossEncoder'] = cross_encoder
+        self._cross_encoder_lock = threading.Lock()
+        if not lazy_load:
+            self.load()
+        # Reranking is interactive work: it runs ahead of ingestion on the shared scheduler.
+        self.scheduler = scheduler
         print(f"RagePipeline initialized with VectorStoreService cross encoder ${cross_encoder_model_name}.")
     
+    @property
+    def cross_encoder(self) -> 'CrossEncoder':
+        if self._cross_encoder is None:
+            self.load()
+        return self._cross_encoder
+    
+    def load(self) -> None:
+        """Loads the cross encoder if it is not loaded yet. Safe to call from several threads."""
+        with self._cross_encoder_lock:
+            if self._cross_encoder is None:
+                self._cross_encoder = load_cross_encoder(self.cross_encoder_model_name)
+    
+    def warmup(self) -> None:
+        """Loads the cross encoder and scores one pair so the first query skips the one-off setup cost."""
+        self.load()
+        self.cross_encoder.predict([["warmup", "warmup"]])
+    
     def _reranker_docuements(self, question: str, retrieve_docs: List[Document], top_n: int = 3 ) -> List[Document]:
-        if not retrieve_docs:
-            return []
-        print(f'---Starting Re-ranking for {len(retrieve_docs)} documents ---')
-        
-        pairs = [[question, doc.page_content] for doc in retrieve_docs]
-        
-        scores = self.cross_encoder.predict(pairs)
+        return self._rerank_many([question], [retrieve_docs], top_n=top_n)[0]
+    
+    def _rerank_many(self, questions: List[str], docs_lists: List[List[Document]], top_n: int = 3) -> List[List[Document]]:
+        """
+        Reranks each question's retrieved chunks. The (question, chunk) pairs of all questions
+        that miss the score cache are scored in one cross-encoder batch.
+        """
+        total = sum(len(docs) for docs in docs_lists)
+        if not total:
+            return [[] for _ in docs_lists]
+        print(f'---Starting Re-ranking for {total} documents ---')
         
-        ranked_docs = sorted(
-            zip(scores, retrieve_docs),
-            key = lambda x : x[0],
-            reverse=True
-        )
+        keys_lists: List[Optional[List[Any]]] = []
+        scores_lists: List[List[Optional[float]]] = []
+        for question, docs in zip(questions, docs_lists):
+            if self.rerank_cache is None:
+                keys_lists.append(None)
+                scores_lists.append([None] * len(docs))
+            else:
+                keys = self.rerank_cache.make_keys(self.cross_encoder_model_name, question, docs)
+                keys_lists.append(keys)
+                scores_lists.append(self.rerank_cache.get_many(keys))
+        missing = [(item, i) for item, scores in enumerate(scores_lists) for i, score in enumerate(scores) if score is None]
+        if missing:
+            new_scores = self._score_pairs([[questions[item], docs_lists[item][i].page_content] for item, i in missing])
+            for (item, i), score in zip(missing, new_scores):
+                scores_lists[item][i] = float(score)
+            if self.rerank_cache is not None:
+                self.rerank_cache.put_many(
+                    [keys_lists[item][i] for item, i in missing],
+                    [scores_lists[item][i] for item, i in missing],
+                    [docs_lists[item][i].metadata.get('document_id') for item, i in missing],
+                )
+        if self.rerank_cache is not None:
+            print(f'Rerank score cache: {total - len(missing)} hit(s), {len(missing)} miss(es).')
         
-        top_docs = [doc for score, doc in ranked_docs[:top_n]]
-        print(f'--- Re ranking finished. Selected top {len(top_docs)} documents. ---')
-        return top_docs
+        top_docs_lists = []
+        for scores, docs in zip(scores_lists, docs_lists):
+            ranked_docs = sorted(
+                zip(scores, docs),
+                key = lambda x : x[0],
+                reverse=True
+            )
+            top_docs_lists.append([doc for score, doc in ranked_docs[:top_n]])
+        print(f'--- Re ranking finished. Selected top {sum(len(docs) for docs in top_docs_lists)} documents. ---')
+        return top_docs_lists
+    
+    def _score_pairs(self, pairs: List[List[str]]) -> Any:
+        if self.scheduler is not None:
+            return self.scheduler.run(self.cross_encoder.predict, pairs, priority=Priority.INTERACTIVE)
+        return self.cross_encoder.predict(pairs)
+    
     def _build_prompt(self, question: str, context_docs: List[Document]) -> str:
         """
         Builds a high-efficiency prompt for the LLM using best practices.
@@ -185,43 +510,314 @@ class RagPipeline:
         
         return "\n".join(prompt_lines)
 
-    def get_answer(self, user_id: str,document_id: str, question: str) -> Dict[str, Any]:
-        
-        # first step retrieval k=10
-        retriever = self.vector_store.get_retriever(search_kwargs={'k': 10,"filter": {'$and':[{"user_id": {'$eq':user_id}},{"document_id":{'$eq':document_id}}]}})
+    def _search_document_vectors(self, user_id: str, document_id: str, query_vector: np.ndarray, search_filter: Dict[str, Any], k: int = 10) -> Optional[List[Document]]:
+        """Exact search over the document's cached embedding matrix; None means search the vector store."""
+        try:
+            return self.vector_cache.search(
+                user_id, document_id, query_vector, k,
+                loader=lambda: self.vector_store.get_document_vectors(search_filter, user_id=user_id, document_id=document_id),
+                version=lambda: self.vector_store.get_document_version(search_filter, user_id=user_id, document_id=document_id),
+            )
+        except Exception as e:
+            print(f"Document vector cache failed for document_id: {document_id}, using the vector store: {e}")
+            return None
+    
+    def _hybrid_search(
+        self,
+        user_id: str,
+        document_id: str,
+        question: str,
+        dense_docs: List[Document],
+        query_weights: Optional[SparseWeights] = None,
+        k: int = 10,
+    ) -> List[Document]:
+        """
+        Fuses the dense results with BM25 and/or BGE-M3 sparse results by reciprocal rank.
+        A lexical search that fails is left out, so the dense results always get through.
+        """
+        rankings = [dense_docs]
+        searches = []
+        if self.lexical_index is not None:
+            searches.append(("Lexical", lambda: self.lexical_index.search(question, user_id, document_id, k=k)))
+        if query_weights is not None:
+            searches.append(("Sparse", lambda: self.sparse_index.search(query_weights, user_id, document_id, k=k)))
+        for name, search in searches:
+            try:
+                rankings.append(search())
+            except Exception as e:
+                print(f"{name} search failed for document_id: {document_id}, leaving it out of the fusion: {e}")
+        if len(rankings) == 1:
+            return dense_docs
+        return reciprocal_rank_fusion(rankings, limit=k)
+    
+    def _answer_settings(self) -> Tuple:
+        """Everything besides the question that changes the answer; part of the answer cache key."""
+        return (
+            getattr(self.llm, 'model', None),
+            getattr(self.llm, 'temperature', None),
+            self.cross_encoder_model_name,
+        )
+    
+    def _embed_questions(self, questions: List[str]) -> Tuple[List[Optional[np.ndarray]], List[Optional[SparseWeights]]]:
+        """
+        Embeds a batch of questions in one encode call, with sparse weights in sparse mode.
+        Empty questions get no vector and are retrieved by text.
+        """
+        vectors: List[Optional[np.ndarray]] = [None] * len(questions)
+        weights: List[Optional[SparseWeights]] = [None] * len(questions)
+        positions = [i for i, question in enumerate(questions) if question]
+        if self.embedding_service is None or not positions:
+            return vectors, weights
+        texts = [questions[i] for i in positions]
+        if self.sparse_index is not None:
+            dense, sparse = self.embedding_service.embed_queries_with_sparse(texts)
+            for i, vector, question_weights in zip(positions, dense, sparse):
+                vectors[i], weights[i] = vector, question_weights
+        else:
+            for i, vector in zip(positions, self.embedding_service.embed_queries_array(texts)):
+                vectors[i] = vector
+        return vectors, weights
+    
+    def _retrieve(self, user_id: str, document_id: str, question: str, query_vector: Optional[np.ndarray], query_weights: Optional[SparseWeights]) -> List[Document]:
+        """First stage: the 10 best chunks of the document, dense or fused with lexical/sparse results."""
+        search_filter = {'$and':[{"user_id": {'$eq':user_id}},{"document_id":{'$eq':document_id}}]}
+        retrieved_docs = None
+        if self.vector_cache is not None and query_vector is not None:
+            retrieved_docs = self._search_document_vectors(user_id, document_id, query_vector, search_filter)
+        if retrieved_docs is None and query_vector is not None:
+            # The question is already embedded; search with that vector.
+            retrieved_docs = self.vector_store.similarity_search_by_vector(query_vector, k=10, filter=search_filter, user_id=user_id, document_id=document_id)
+        elif retrieved_docs is None:
+            retriever = self.vector_store.get_retriever(search_kwargs={'k': 10,"filter": search_filter}, user_id=user_id, document_id=document_id)
+            retrieved_docs = retriever.invoke(question)
+        if self.lexical_index is not None or query_weights is not None:
+            retrieved_docs = self._hybrid_search(user_id, document_id, question, retrieved_docs, query_weights)
+        return retrieved_docs
+    
+    @staticmethod
+    def _make_result(generated_answer: str, final_docs: List[Document]) -> Dict[str, Any]:
+        sources = [
+            {
+                "page_content": doc.page_content,
+                "metadata": doc.metadata,
+            }
+            for doc in final_docs
+        ] 
+        return {"answer": generated_answer, "sources": sources}
+    
+    def _store_answer(self, user_id: str, document_id: str, question: str, result: Dict[str, Any], settings: Tuple, cache_key: Any, generation: Optional[int], query_vector: Optional[np.ndarray], semantic_generation: Optional[int]) -> None:
+        if cache_key is not None:
+            self.answer_cache.put(cache_key, document_id, result, generation)
+        if self.semantic_cache is not None and query_vector is not None:
+            self.semantic_cache.put(user_id, document_id, query_vector, result, semantic_generation, settings, question=question)
+    
+    def _prepare_answer(self, user_id: str, document_id: str, question: str) -> PreparedAnswer:
+        """
+        Everything before the LLM call: cache lookups, retrieval, reranking and the prompt.
+        Blocking; the async path runs it on the query executor.
+        """
+        settings = self._answer_settings()
+        prepared = PreparedAnswer(user_id=user_id, document_id=document_id, question=question, settings=settings)
+        if self.answer_cache is not None:
+            prepared.cache_key = self.answer_cache.make_key(user_id, document_id, question, settings)
+            cached = self.answer_cache.get(prepared.cache_key)
+            if cached is not None:
+                print(f"Answer cache hit for document_id: {document_id}")
+                prepared.result = cached
+                return prepared
+            # Read before retrieval: if the document changes meanwhile, this answer is not cached.
+            prepared.generation = self.answer_cache.generation(document_id)
         
+        query_weights = None
+        if self.sparse_index is not None and question:
+            # One forward pass gives the dense vector (search, semantic cache) and the sparse weights.
+            prepared.query_vector, query_weights = self.embedding_service.embed_query_with_sparse(question)
+        elif (self.semantic_cache is not None or self.vector_cache is not None) and question:
+            prepared.query_vector = self.embedding_service.embed_query_array(question)
+        if self.semantic_cache is not None and prepared.query_vector is not None:
+            prepared.semantic_generation = self.semantic_cache.generation(document_id)
+            match = self.semantic_cache.get(user_id, document_id, prepared.query_vector, settings, question=question)
+            if match is not None:
+                cached, similarity = match
+                print(f"Semantic answer cache hit for document_id: {document_id} (similarity {similarity:.3f})")
+                prepared.result = cached
+                return prepared
         
-        retrieved_docs = retriever.invoke(question)
+        # first step retrieval k=10
+        retrieved_docs = self._retrieve(user_id, document_id, question, prepared.query_vector, query_weights)
         
         if not retrieved_docs:
-            return {"answer": "I cannot find the answer in the provided documents.", "sources": []}
+            prepared.result = {"answer": NO_ANSWER, "sources": []}
+            return prepared
         
         
         # second step re ranking n =3
-        final_docs = self._reranker_docuements(question,retrieved_docs, top_n=3)
+        prepared.final_docs = self._reranker_docuements(question,retrieved_docs, top_n=3)
         
         #  insert finaldocs to prompt
         # prompt = self._build_prompt(question, final_docs)
-        prompt = self._create_llm_prompt(question, final_docs)
-        print(f'Prompt Template:\n{prompt}')   
+        prepared.prompt = self._create_llm_prompt(question, prepared.final_docs)
+        print(f'Prompt Template:\n{prepared.prompt}')   
         # print(f'Retrive Docs: {retrieved_docs}')
-        llm = self.llm
-        response =  llm.invoke(prompt)
-        generated_answer = response.content
-        
-        sources = [
-            {
-                "page_content": doc.page_content,
-                "metadata": doc.metadata,
-            }
-            for doc in final_docs
-        ] 
+        return prepared
+    
+    def _finish_answer(self, prepared: PreparedAnswer, generated_answer: str) -> Dict[str, Any]:
+        """Builds the result from the LLM's answer and stores it in the answer caches."""
         print(f"Generated Answer: {generated_answer}")
-        # print(f"Sources: {type(sources)}")
-        # print(f"Sources: {sources[0]}")
-        result = {"answer": generated_answer, "sources": sources}
+        result = self._make_result(generated_answer, prepared.final_docs)
+        self._store_answer(
+            prepared.user_id, prepared.document_id, prepared.question, result, prepared.settings,
+            prepared.cache_key, prepared.generation, prepared.query_vector, prepared.semantic_generation,
+        )
         # response_ans = json.dumps(result, indent=2, ensure_ascii=False)
         return result
+    
+    def _require_llm(self) -> None:
+        if self.llm is None:
+            raise LLMNotConfiguredError("LLM not configured: set GOOGLE_API_KEY to answer questions.")
+    
+    def get_answer(self, user_id: str,document_id: str, question: str) -> Dict[str, Any]:
+        self._require_llm()
+        prepared = self._prepare_answer(user_id, document_id, question)
+        if prepared.result is not None:
+            return prepared.result
+        llm = self.llm
+        response =  llm.invoke(prepared.prompt)
+        return self._finish_answer(prepared, response.content)
+    
+    async def aget_answer(self, user_id: str, document_id: str, question: str) -> Dict[str, Any]:
+        """
+        Async get_answer. Embedding, retrieval and reranking run on the query executor and the
+        LLM is called through its async API, so a query waiting on the LLM holds no thread.
+        At most llm_concurrency LLM calls are in flight; further queries wait on the event loop.
+
+        Raises:
+            LLMNotConfiguredError: If the pipeline has no LLM.
+        """
+        self._require_llm()
+        prepared = await self._run_blocking(self._prepare_answer, user_id, document_id, question)
+        if prepared.result is not None:
+            return prepared.result
+        async with self._llm_slots:
+            response = await self.llm.ainvoke(prepared.prompt)
+        return self._finish_answer(prepared, response.content)
+    
+    async def _run_blocking(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Runs blocking query work on the query executor without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+    
+    def _prepare_answers(self, user_id: str, document_id: str, questions: List[str]) -> Tuple[List[Optional[Dict[str, Any]]], List[PreparedAnswer]]:
+        """
+        The batch counterpart of _prepare_answer. Returns the results known without the LLM
+        (cache hits, retrieval errors, no chunks), with None for the rest, and the prepared
+        answers that still need an LLM call.
+        """
+        settings = self._answer_settings()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+        prepared: Dict[int, PreparedAnswer] = {}
+        for i, question in enumerate(questions):
+            prepared[i] = PreparedAnswer(user_id=user_id, document_id=document_id, question=question, settings=settings, index=i)
+            if self.answer_cache is not None:
+                prepared[i].cache_key = self.answer_cache.make_key(user_id, document_id, question, settings)
+                cached = self.answer_cache.get(prepared[i].cache_key)
+                if cached is not None:
+                    results[i] = cached
+                    del prepared[i]
+                    continue
+                prepared[i].generation = self.answer_cache.generation(document_id)
+        
+        pending = list(prepared)
+        vectors, weights = self._embed_questions([questions[i] for i in pending])
+        query_weights = dict(zip(pending, weights))
+        for i, vector in zip(pending, vectors):
+            prepared[i].query_vector = vector
+        if self.semantic_cache is not None:
+            semantic_generation = self.semantic_cache.generation(document_id)
+            for i in pending:
+                prepared[i].semantic_generation = semantic_generation
+                vector = prepared[i].query_vector
+                match = self.semantic_cache.get(user_id, document_id, vector, settings, question=questions[i]) if vector is not None else None
+                if match is not None:
+                    results[i] = match[0]
+                    del prepared[i]
+        
+        retrieved: Dict[int, List[Document]] = {}
+        for i in list(prepared):
+            try:
+                retrieved_docs = self._retrieve(user_id, document_id, questions[i], prepared[i].query_vector, query_weights[i])
+            except Exception as e:
+                print(f"Retrieval failed for question {i} of the batch for document_id: {document_id}: {e}")
+                results[i] = {"error": f"Retrieval failed: {e}"}
+                del prepared[i]
+                continue
+            if retrieved_docs:
+                retrieved[i] = retrieved_docs
+            else:
+                results[i] = {"answer": NO_ANSWER, "sources": []}
+                del prepared[i]
+        
+        answerable = list(retrieved)
+        final_docs_lists = self._rerank_many([questions[i] for i in answerable], [retrieved[i] for i in answerable], top_n=3)
+        for i, final_docs in zip(answerable, final_docs_lists):
+            prepared[i].final_docs = final_docs
+            prepared[i].prompt = self._create_llm_prompt(questions[i], final_docs)
+        return results, [prepared[i] for i in answerable]
+    
+    def _finish_answers(self, results: List[Optional[Dict[str, Any]]], prepared: List[PreparedAnswer], responses: List[Any]) -> List[Dict[str, Any]]:
+        """Fills in the LLM answers, or an error entry for each failed LLM call."""
+        for item, response in zip(prepared, responses):
+            if isinstance(response, Exception):
+                print(f"LLM call failed for question {item.index} of the batch for document_id: {item.document_id}: {response}")
+                results[item.index] = {"error": f"LLM call failed: {response}"}
+            else:
+                results[item.index] = self._finish_answer(item, response.content)
+        return results
+    
+    def get_answers(self, user_id: str, document_id: str, questions: List[str]) -> List[Dict[str, Any]]:
+        """
+        Answers several questions about one document in one round-trip. Cached answers are
+        served as in get_answer. The other questions are embedded in one encode call, all their
+        (question, chunk) pairs are reranked in one cross-encoder batch, and their LLM calls run
+        concurrently, at most llm_concurrency at a time.
+
+        Args:
+            user_id (str): The owner of the document.
+            document_id (str): The document to ask about.
+            questions (List[str]): The questions, answered independently.
+
+        Returns:
+            List[Dict[str, Any]]: One entry per question, in order: {"answer", "sources"}, or
+            {"error": message} when that question's retrieval or LLM call failed.
+
+        Raises:
+            LLMNotConfiguredError: If the pipeline has no LLM.
+        """
+        self._require_llm()
+        results, prepared = self._prepare_answers(user_id, document_id, questions)
+        responses = []
+        if prepared:
+            print(f"Batch of {len(prepared)} LLM calls for document_id: {document_id}, at most {self.llm_concurrency} at a time.")
+            responses = self.llm.batch([item.prompt for item in prepared], config={"max_concurrency": self.llm_concurrency}, return_exceptions=True)
+        return self._finish_answers(results, prepared, responses)
+    
+    async def aget_answers(self, user_id: str, document_id: str, questions: List[str]) -> List[Dict[str, Any]]:
+        """
+        Async get_answers: the preparation runs on the query executor and the LLM calls go
+        through the LLM's async API. They share the llm_concurrency limit with aget_answer.
+        """
+        self._require_llm()
+        results, prepared = await self._run_blocking(self._prepare_answers, user_id, document_id, questions)
+        
+        async def generate(item: PreparedAnswer) -> Any:
+            async with self._llm_slots:
+                return await self.llm.ainvoke(item.prompt)
+        
+        responses = []
+        if prepared:
+            print(f"Batch of {len(prepared)} async LLM calls for document_id: {document_id}, at most {self.llm_concurrency} at a time.")
+            responses = await asyncio.gather(*(generate(item) for item in prepared), return_exceptions=True)
+        return self._finish_answers(results, prepared, responses)
 
 if __name__ == "__main__":
     
@@ -0,0 +1,40 @@
+from typing import Dict, List, Sequence
+
+from langchain_core.documents import Document
+
+
+def chunk_key(doc: Document) -> str:
+    """A chunk's identity across retrievers: its store ID, else file_id/chunk_number, else its text."""
+    if getattr(doc, 'id', None):
+        return doc.id
+    metadata = doc.metadata or {}
+    if metadata.get('file_id') is not None and metadata.get('chunk_number') is not None:
+        return f"{metadata['file_id']}_chunk_{metadata['chunk_number']}"
+    return doc.page_content
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Document]], k: int = 60, limit: int = 10) -> List[Document]:
+    """
+    Merges ranked result lists with reciprocal rank fusion: each chunk scores
+    sum(1 / (k + rank)) over the lists it appears in, so no score calibration between
+    retrievers is needed.
+
+    Args:
+        rankings: Result lists, each best first.
+        k (int): The RRF damping constant; 60 is the usual choice.
+        limit (int): The number of chunks to return.
+
+    Returns:
+        List[Document]: The fused ranking, best first. A chunk found by several retrievers
+        is returned once, as the Document of the first list that has it.
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = chunk_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(key, doc)
+    # sorted() is stable, so ties keep first-seen order (dense results first).
+    ordered = sorted(scores, key=lambda key: scores[key], reverse=True)
+    return [documents[key] for key in ordered[:limit]]
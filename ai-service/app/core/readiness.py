@@ -0,0 +1,63 @@
+import asyncio
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Optional
+
+
+class ServiceReadiness:
+    """
+    Tracks background loading and warmup of the models, so liveness (/health) can be
+    reported as soon as the process is up and readiness (/ready) only once every
+    component is loaded and warm.
+    """
+
+    def __init__(self):
+        self.components: Dict[str, str] = {}
+        self.errors: Dict[str, str] = {}
+        self.started_at = time.time()
+        self.ready_at: Optional[float] = None
+
+    def mark_failed(self, name: str, error: str) -> None:
+        """Records a component that cannot become ready, e.g. because of missing configuration."""
+        self.components[name] = 'failed'
+        self.errors[name] = error
+        print(f"Readiness: {name} failed: {error}")
+
+    async def load(self, loaders: Dict[str, Callable[[], Any]], executor: Optional[Executor] = None) -> bool:
+        """
+        Runs every loader in parallel on the executor and records the outcome per component.
+
+        Args:
+            loaders: Maps a component name to a blocking load/warmup callable.
+            executor: Executor for the loaders. Defaults to the event loop's default executor.
+
+        Returns:
+            bool: True if the service is ready afterwards.
+        """
+        for name in loaders:
+            self.components[name] = 'loading'
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(executor, loader) for loader in loaders.values()),
+            return_exceptions=True,
+        )
+        for name, result in zip(loaders, results):
+            if isinstance(result, Exception):
+                self.mark_failed(name, str(result))
+            else:
+                self.components[name] = 'ready'
+        if self.is_ready:
+            self.ready_at = time.time()
+            print(f"Readiness: all components ready after {self.ready_at - self.started_at:.1f}s")
+        return self.is_ready
+
+    @property
+    def is_ready(self) -> bool:
+        return bool(self.components) and all(status == 'ready' for status in self.components.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.is_ready else ("failed" if self.errors else "loading"),
+            "components": dict(self.components),
+            "errors": dict(self.errors),
+        }
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.documents import Document
+
+from app.core.answer_cache import AnswerCache
+
+
+class RerankScoreCache:
+    """
+    A bounded in-process LRU cache of cross-encoder scores.
+
+    Scores are keyed by (model, normalized question hash, chunk ID, chunk content hash), so a
+    rewritten chunk never reuses an old score; on top of that a document's scores are dropped
+    as soon as it is re-ingested (see on_document_changed, wired to the ProcessingPipeline's
+    document listeners) instead of waiting to fall out of the LRU.
+    """
+
+    def __init__(self, max_entries: int = 8192):
+        self.max_entries = max(1, max_entries)
+        self._scores: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._document_of: Dict[Hashable, Optional[str]] = {}
+        self._keys_by_document: Dict[Optional[str], Set[Hashable]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        print(f"RerankScoreCache initialized with max_entries={max_entries}")
+
+    @staticmethod
+    def question_hash(question: str) -> str:
+        normalized = AnswerCache.normalize_question(question)
+        return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+    @staticmethod
+    def chunk_identity(doc: Document) -> Tuple[str, str]:
+        """(chunk ID, content hash) of a retrieved chunk, from the metadata written at ingestion when present."""
+        metadata = doc.metadata or {}
+        chunk_id = getattr(doc, 'id', None)
+        if not chunk_id and metadata.get('file_id') is not None and metadata.get('chunk_number') is not None:
+            chunk_id = f"{metadata['file_id']}_chunk_{metadata['chunk_number']}"
+        content_hash = metadata.get('content_hash') or hashlib.sha256(doc.page_content.encode('utf-8')).hexdigest()
+        return chunk_id or '', content_hash
+
+    def make_keys(self, model_name: str, question: str, docs: Sequence[Document]) -> List[Tuple]:
+        question_key = self.question_hash(question)
+        return [(model_name, question_key) + self.chunk_identity(doc) for doc in docs]
+
+    def get_many(self, keys: Sequence[Hashable]) -> List[Optional[float]]:
+        """Returns the cached score for each key, or None where it is missing."""
+        with self._lock:
+            scores = []
+            for key in keys:
+                score = self._scores.get(key)
+                if score is None:
+                    self.misses += 1
+                else:
+                    self._scores.move_to_end(key)
+                    self.hits += 1
+                scores.append(score)
+            return scores
+
+    def put_many(self, keys: Sequence[Hashable], scores: Sequence[float], document_ids: Sequence[Optional[str]]) -> None:
+        """
+        Stores scores, evicting the least recently used ones beyond max_entries.
+
+        Args:
+            keys: Keys from make_keys.
+            scores: One cross-encoder score per key.
+            document_ids: The document each scored chunk belongs to, for invalidation.
+        """
+        with self._lock:
+            for key, score, document_id in zip(keys, scores, document_ids):
+                if key in self._scores:
+                    self._remove(key)
+                self._scores[key] = float(score)
+                self._document_of[key] = document_id
+                self._keys_by_document.setdefault(document_id, set()).add(key)
+            while len(self._scores) > self.max_entries:
+                self._remove(next(iter(self._scores)))
+
+    def invalidate_document(self, document_id: str) -> int:
+        """Drops every score of the document's chunks. Returns the number dropped."""
+        with self._lock:
+            keys = self._keys_by_document.pop(document_id, set())
+            for key in keys:
+                self._scores.pop(key, None)
+                self._document_of.pop(key, None)
+            self.invalidations += 1
+        return len(keys)
+
+    def on_document_changed(self, user_id: str, document_id: str) -> None:
+        """ProcessingPipeline document listener."""
+        self.invalidate_document(document_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._scores),
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        """Removes one entry; the caller must hold the lock."""
+        del self._scores[key]
+        document_id = self._document_of.pop(key, None)
+        keys = self._keys_by_document.get(document_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_document[document_id]
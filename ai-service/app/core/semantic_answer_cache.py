@@ -0,0 +1,180 @@
+import copy
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+_NEGATION = re.compile(r"n't\b|\b(?:not|no|never|without|except)\b|ไม่", re.IGNORECASE)
+
+
+def question_signature(question: str) -> Tuple:
+    """
+    The parts of a question that embeddings barely see but that change its answer: the
+    numbers it mentions ("total in 2566?" vs "total in 2567?") and whether it is negated.
+    Two questions may only share a cached answer when their signatures are equal.
+    """
+    return tuple(_NUMBER.findall(question or "")), bool(_NEGATION.search(question or ""))
+
+
+@dataclass
+class _QuestionIndex:
+    """The cached questions of one (user, document, settings) scope: unit vectors and their answers."""
+    vectors: np.ndarray
+    values: List[Any] = field(default_factory=list)
+    expires_at: List[float] = field(default_factory=list)
+    last_used: List[float] = field(default_factory=list)
+    signatures: List[Tuple] = field(default_factory=list)
+
+
+class SemanticAnswerCache:
+    """
+    An in-process cache of final RAG answers looked up by question similarity instead of
+    exact text, so paraphrases of an answered question reuse its answer.
+
+    Each (user_id, document_id, settings) scope keeps a small matrix of normalized question
+    embeddings; a lookup is one matrix-vector product and a hit needs a cosine similarity of
+    at least `threshold` and the same numbers and negation as the cached question (see
+    question_signature), since those flip the answer without moving the embedding much.
+    Scopes never mix, so users are isolated from each other. Like AnswerCache, a document's
+    entries are dropped when it is re-ingested and a per-document generation counter keeps
+    answers computed during re-ingestion out of the cache.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        max_entries_per_document: int = 256,
+        ttl_seconds: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError(f"threshold must be in (0, 1], got {threshold}.")
+        self.threshold = threshold
+        self.max_entries_per_document = max(1, max_entries_per_document)
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._indexes: Dict[Tuple, _QuestionIndex] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        print(f"SemanticAnswerCache initialized with threshold={threshold}, max_entries_per_document={max_entries_per_document}, ttl_seconds={ttl_seconds}")
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    def generation(self, document_id: str) -> int:
+        """The document's current generation; read it before computing an answer and pass it to put()."""
+        with self._lock:
+            return self._generations.get(document_id, 0)
+
+    def get(self, user_id: str, document_id: str, vector: np.ndarray, settings: Tuple = (), question: str = "") -> Optional[Tuple[Any, float]]:
+        """
+        Looks up the most similar cached question of the user on the document.
+
+        Args:
+            user_id (str): The asking user; only their own questions can match.
+            document_id (str): The document the question is about.
+            vector (np.ndarray): The question embedding.
+            settings (Tuple): Model settings the answer depends on.
+            question (str): The question text; only cached questions with the same signature can match.
+
+        Returns:
+            Optional[Tuple[Any, float]]: A copy of the cached answer and its similarity, or None.
+        """
+        query = self._normalize(vector)
+        signature = question_signature(question)
+        with self._lock:
+            index = self._indexes.get((user_id, document_id, settings))
+            if index is not None:
+                self._drop_expired(index)
+            if index is None or not index.values or index.vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            similarities = index.vectors @ query
+            similarities[[i for i, other in enumerate(index.signatures) if other != signature]] = -np.inf
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+            index.last_used[best] = self._clock()
+            self.hits += 1
+            return copy.deepcopy(index.values[best]), similarity
+
+    def put(self, user_id: str, document_id: str, vector: np.ndarray, value: Any, generation: int, settings: Tuple = (), question: str = "") -> bool:
+        """
+        Stores an answer under its question embedding unless the document changed since
+        `generation` was read. The least recently used entry of the scope is evicted when full.
+
+        Returns:
+            bool: True if the answer was cached.
+        """
+        row = self._normalize(vector)
+        now = self._clock()
+        with self._lock:
+            if self._generations.get(document_id, 0) != generation:
+                return False
+            key = (user_id, document_id, settings)
+            index = self._indexes.get(key)
+            if index is None or index.vectors.shape[1] != row.shape[0]:
+                index = self._indexes[key] = _QuestionIndex(vectors=np.empty((0, row.shape[0]), dtype=np.float32))
+            self._drop_expired(index)
+            if len(index.values) >= self.max_entries_per_document:
+                self._drop(index, [int(np.argmin(index.last_used))])
+            index.vectors = np.vstack([index.vectors, row[np.newaxis, :]])
+            index.values.append(copy.deepcopy(value))
+            index.expires_at.append(now + self.ttl_seconds)
+            index.last_used.append(now)
+            index.signatures.append(question_signature(question))
+            return True
+
+    def invalidate_document(self, document_id: str) -> int:
+        """Drops every answer about the document, for all users, and bumps its generation. Returns the number dropped."""
+        with self._lock:
+            self._generations[document_id] = self._generations.get(document_id, 0) + 1
+            keys = [key for key in self._indexes if key[1] == document_id]
+            dropped = sum(len(self._indexes.pop(key).values) for key in keys)
+            self.invalidations += 1
+        if dropped:
+            print(f"SemanticAnswerCache invalidated {dropped} answer(s) for document_id: {document_id}")
+        return dropped
+
+    def on_document_changed(self, user_id: str, document_id: str) -> None:
+        """ProcessingPipeline document listener."""
+        self.invalidate_document(document_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": sum(len(index.values) for index in self._indexes.values()),
+                "invalidations": self.invalidations,
+                "threshold": self.threshold,
+            }
+
+    def _drop_expired(self, index: _QuestionIndex) -> None:
+        """Removes the scope's expired entries; the caller must hold the lock."""
+        now = self._clock()
+        expired = [i for i, expires_at in enumerate(index.expires_at) if expires_at <= now]
+        if expired:
+            self._drop(index, expired)
+
+    @staticmethod
+    def _drop(index: _QuestionIndex, positions: List[int]) -> None:
+        dropped = set(positions)
+        keep = [i for i in range(len(index.values)) if i not in dropped]
+        index.vectors = index.vectors[keep]
+        index.values = [index.values[i] for i in keep]
+        index.expires_at = [index.expires_at[i] for i in keep]
+        index.last_used = [index.last_used[i] for i in keep]
+        index.signatures = [index.signatures[i] for i in keep]
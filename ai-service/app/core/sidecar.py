@@ -0,0 +1,381 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict, deque
+from multiprocessing.connection import Client, Connection, Listener
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.core.inference_scheduler import InferenceScheduler, Priority
+from app.core.sparse_index import SparseWeights
+
+if TYPE_CHECKING:
+    from sentence_transformers.cross_encoder import CrossEncoder
+    from app.core.embedding_service import EmbeddingService
+
+
+class SidecarError(RuntimeError):
+    """Raised in an API worker when the sidecar is unreachable or a call failed there."""
+
+
+class SidecarServer:
+    """
+    The one process per host that holds the models for every API worker (see gunicorn.conf.py).
+
+    It serves the embedding service and the cross encoder over a Unix socket, so N workers
+    share one copy of the weights, one inference scheduler (a query from any worker runs
+    ahead of every worker's ingestion), one micro-batcher and one embedding cache. It also
+    keeps the state the workers must agree on: the status of every ingestion job, so any
+    worker can answer /jobs/{job_id}, and a feed of document changes, so every worker drops
+    what it cached for a document that another worker re-ingested.
+
+    Each connection is served on its own thread; SidecarClient keeps one per calling thread.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        embedding_service: 'EmbeddingService',
+        cross_encoder_loader: Callable[[], 'CrossEncoder'],
+        scheduler: Optional[InferenceScheduler] = None,
+        authkey: Optional[bytes] = None,
+        max_jobs: int = 10000,
+        max_changes: int = 10000,
+    ):
+        self.address = address
+        self.authkey = authkey
+        self.embedding_service = embedding_service
+        self._cross_encoder_loader = cross_encoder_loader
+        self._cross_encoder: Optional['CrossEncoder'] = None
+        self._cross_encoder_lock = threading.Lock()
+        # Reranks run at interactive priority on the same scheduler as the embedder.
+        self.scheduler = scheduler
+        self.max_jobs = max(1, max_jobs)
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # A new epoch per sidecar start tells followers that sequence numbers restarted.
+        self.epoch = uuid.uuid4().hex
+        self._changes: Deque[Tuple[int, str, str, str]] = deque(maxlen=max(1, max_changes))
+        self._sequence = 0
+        self._state_lock = threading.Lock()
+        self._listener: Optional[Listener] = None
+        self._accept_thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._methods: Dict[str, Callable[..., Any]] = {
+            "embed_documents_array": embedding_service.embed_documents_array,
+            "embed_query_array": embedding_service.embed_query_array,
+            "embed_queries_array": embedding_service.embed_queries_array,
+            "embed_documents_with_sparse": embedding_service.embed_documents_with_sparse,
+            "embed_query_with_sparse": embedding_service.embed_query_with_sparse,
+            "embed_queries_with_sparse": embedding_service.embed_queries_with_sparse,
+            "embedding_load": embedding_service.load,
+            "embedding_warmup": embedding_service.warmup,
+            "embedding_stats": embedding_service.stats,
+            "rerank": self.rerank,
+            "put_job": self.put_job,
+            "get_job": self.get_job,
+            "publish_document_changed": self.publish_document_changed,
+            "document_changes": self.document_changes,
+        }
+
+    @property
+    def cross_encoder(self) -> 'CrossEncoder':
+        with self._cross_encoder_lock:
+            if self._cross_encoder is None:
+                self._cross_encoder = self._cross_encoder_loader()
+            return self._cross_encoder
+
+    def start(self) -> None:
+        """Binds the socket and serves connections on a background thread."""
+        if os.path.exists(self.address):
+            # Left behind by a sidecar that did not shut down cleanly.
+            os.unlink(self.address)
+        self._listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        self._accept_thread = threading.Thread(target=self._accept_loop, name="sidecar-accept", daemon=True)
+        self._accept_thread.start()
+        print(f"Inference sidecar listening on {self.address}")
+
+    def warmup(self) -> None:
+        """Loads both models and runs one small call through each."""
+        self.embedding_service.warmup()
+        self.rerank([["warmup", "warmup"]])
+
+    def close(self) -> None:
+        self._closed = True
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def rerank(self, pairs: List[List[str]]) -> np.ndarray:
+        """Scores (question, passage) pairs with the cross encoder."""
+        cross_encoder = self.cross_encoder
+        if self.scheduler is not None:
+            return self.scheduler.run(cross_encoder.predict, pairs, priority=Priority.INTERACTIVE)
+        return cross_encoder.predict(pairs)
+
+    def put_job(self, job: Dict[str, Any]) -> None:
+        """Records the latest status of a job; the oldest records are dropped beyond max_jobs."""
+        with self._state_lock:
+            self._jobs.pop(job["job_id"], None)
+            self._jobs[job["job_id"]] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._state_lock:
+            return self._jobs.get(job_id)
+
+    def publish_document_changed(self, origin: str, user_id: str, document_id: str) -> None:
+        with self._state_lock:
+            self._sequence += 1
+            self._changes.append((self._sequence, origin, user_id, document_id))
+
+    def document_changes(self, since: int) -> Tuple[str, int, List[Tuple[str, str, str]]]:
+        """
+        Returns the epoch, the latest sequence number and the (origin, user_id, document_id)
+        changes published after `since`.
+        """
+        with self._state_lock:
+            changes = [(origin, user_id, document_id) for sequence, origin, user_id, document_id in self._changes if sequence > since]
+            return self.epoch, self._sequence, changes
+
+    def _accept_loop(self) -> None:
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except Exception as e:
+                if self._closed:
+                    return
+                print(f"Inference sidecar: rejected a connection: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(connection,), name="sidecar-connection", daemon=True).start()
+
+    def _serve(self, connection: Connection) -> None:
+        with connection:
+            while True:
+                try:
+                    method, args = connection.recv()
+                except (EOFError, OSError):
+                    return
+                handler = self._methods.get(method)
+                try:
+                    if handler is None:
+                        raise ValueError(f"Unknown sidecar method: {method}")
+                    reply = ("ok", handler(*args))
+                except Exception as e:
+                    reply = ("error", f"{type(e).__name__}: {e}")
+                try:
+                    connection.send(reply)
+                except (OSError, ValueError):
+                    return
+
+
+class SidecarClient:
+    """
+    An API worker's connection to the sidecar. Calls block the calling thread; each thread
+    gets its own connection, opened on its first call and reopened once if it broke.
+    """
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None):
+        self.address = address
+        self.authkey = authkey
+        # Identifies this worker's own document changes in the shared feed.
+        self.origin = uuid.uuid4().hex
+        self._local = threading.local()
+        self._connections: List[Connection] = []
+        self._lock = threading.Lock()
+
+    def _connection(self) -> Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _drop_connection(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            with self._lock:
+                if connection in self._connections:
+                    self._connections.remove(connection)
+            connection.close()
+
+    def call(self, method: str, *args: Any) -> Any:
+        """
+        Runs a sidecar method and returns its result.
+
+        Raises:
+            SidecarError: If the sidecar cannot be reached or the method raised there.
+        """
+        for attempt in range(2):
+            try:
+                connection = self._connection()
+                connection.send((method, args))
+                status, value = connection.recv()
+                break
+            except (EOFError, OSError) as e:
+                self._drop_connection()
+                if attempt:
+                    raise SidecarError(f"Inference sidecar at {self.address} is unreachable: {e}") from e
+        if status == "error":
+            raise SidecarError(f"Inference sidecar call {method} failed: {value}")
+        return value
+
+    def put_job(self, job: Dict[str, Any]) -> None:
+        self.call("put_job", job)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.call("get_job", job_id)
+
+    def publish_document_changed(self, user_id: str, document_id: str) -> None:
+        """ProcessingPipeline document listener: tells the other workers about the change."""
+        self.call("publish_document_changed", self.origin, user_id, document_id)
+
+    def document_changes(self, since: int) -> Tuple[str, int, List[Tuple[str, str, str]]]:
+        return self.call("document_changes", since)
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+
+
+class RemoteEmbeddingService(Embeddings):
+    """
+    The EmbeddingService API of an API worker in sidecar mode: every call runs on the
+    sidecar's EmbeddingService, with its scheduler, micro-batcher, cache and process pool.
+    """
+
+    def __init__(self, client: SidecarClient, sparse: bool = False):
+        self.client = client
+        self.sparse = sparse
+        print(f"RemoteEmbeddingService initialized with sidecar at {client.address} (sparse={sparse})")
+
+    def load(self) -> None:
+        self.client.call("embedding_load")
+
+    def warmup(self) -> None:
+        self.client.call("embedding_warmup")
+
+    def stats(self) -> Dict[str, Any]:
+        return self.client.call("embedding_stats")
+
+    def close(self) -> None:
+        pass
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Required by LangChain; a list wrapper around embed_documents_array."""
+        if not texts: return []
+        return self.embed_documents_array(texts).tolist()
+
+    def embed_documents_array(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return self.client.call("embed_documents_array", texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Required by LangChain; a list wrapper around embed_query_array."""
+        if not text: return []
+        return self.embed_query_array(text).tolist()
+
+    def embed_query_array(self, text: str) -> np.ndarray:
+        if not text:
+            return np.empty((0,), dtype=np.float32)
+        return self.client.call("embed_query_array", text)
+
+    def embed_queries_array(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return self.client.call("embed_queries_array", texts)
+
+    def embed_documents_with_sparse(self, texts: List[str]) -> Tuple[np.ndarray, List[SparseWeights]]:
+        self._require_sparse("embed_documents_with_sparse")
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32), []
+        return self.client.call("embed_documents_with_sparse", texts)
+
+    def embed_query_with_sparse(self, text: str) -> Tuple[np.ndarray, SparseWeights]:
+        self._require_sparse("embed_query_with_sparse")
+        return self.client.call("embed_query_with_sparse", text)
+
+    def embed_queries_with_sparse(self, texts: List[str]) -> Tuple[np.ndarray, List[SparseWeights]]:
+        self._require_sparse("embed_queries_with_sparse")
+        return self.client.call("embed_queries_with_sparse", texts)
+
+    def _require_sparse(self, method: str) -> None:
+        if not self.sparse:
+            raise ValueError(f"{method} requires sparse mode (EMBEDDING_SPARSE) on the API worker and the sidecar.")
+
+
+class RemoteCrossEncoder:
+    """Stands in for a CrossEncoder in an API worker; predict() runs on the sidecar's model."""
+
+    def __init__(self, client: SidecarClient):
+        self.client = client
+
+    def predict(self, pairs: List[List[str]]) -> np.ndarray:
+        return self.client.call("rerank", [list(pair) for pair in pairs])
+
+
+class DocumentChangeFeed:
+    """
+    Follows the sidecar's document-change feed on a background thread and calls the worker's
+    own document listeners for changes made by other workers, so cached answers, rerank
+    scores and hot-index vectors are dropped in every worker within interval_seconds.
+    """
+
+    def __init__(self, client: SidecarClient, listeners: List[Callable[[str, str], None]], interval_seconds: float = 1.0):
+        self.client = client
+        self.listeners = list(listeners)
+        self.interval_seconds = interval_seconds
+        self._epoch: Optional[str] = None
+        self._since = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="document-change-feed", daemon=True)
+        self._thread.start()
+
+    def poll(self) -> int:
+        """Applies the changes published since the last poll. Returns how many were applied."""
+        epoch, latest, changes = self.client.document_changes(self._since)
+        if self._epoch is None:
+            # Nothing is cached yet when the worker starts; only later changes matter.
+            self._epoch, self._since = epoch, latest
+            return 0
+        if epoch != self._epoch:
+            # The sidecar restarted and its sequence numbers with it; take everything it has.
+            self._epoch, self._since = epoch, 0
+            epoch, latest, changes = self.client.document_changes(0)
+        self._since = latest
+        applied = 0
+        for origin, user_id, document_id in changes:
+            if origin == self.client.origin:
+                continue
+            applied += 1
+            for listener in self.listeners:
+                try:
+                    listener(user_id, document_id)
+                except Exception as e:
+                    print(f'Document listener failed for document_id: {document_id}: {e}')
+        return applied
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.poll()
+            except SidecarError as e:
+                print(f"DocumentChangeFeed: {e}")
+            if self._stop.wait(self.interval_seconds):
+                return
@@ -0,0 +1,129 @@
+import re
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+Span = Tuple[int, int]
+SpanLength = Callable[[int, int], float]
+
+
+class SpanSplitter:
+    """
+    Recursive separator-based splitting that works on (start, end) character spans of the
+    original text instead of substrings.
+
+    The algorithm follows LangChain's RecursiveCharacterTextSplitter with its defaults
+    (literal separators kept at the start of each piece, whitespace stripped from chunks),
+    so every chunk is a contiguous slice of the input and the output is identical. Each
+    separator's positions are found with one scan per text and looked up by bisection at
+    every recursion level, and no intermediate strings are built. Span lengths come from a
+    pluggable span_length(start, end), which lets a token-count length be answered from
+    offsets computed once per document instead of re-tokenizing every candidate piece.
+    """
+
+    def __init__(self, chunk_size: float, chunk_overlap: float, separators: Sequence[str] = ("\n\n", "\n", " ", "")):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must not be larger than chunk_size ({chunk_size}).")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators)
+        self._patterns = [re.compile(re.escape(separator)) if separator else None for separator in self.separators]
+
+    def split(self, text: str, span_length: Optional[SpanLength] = None) -> List[Span]:
+        """
+        Splits text into chunk spans.
+
+        Args:
+            text (str): The text to split.
+            span_length: Length of text[start:end]. Defaults to its character count.
+
+        Returns:
+            List[Span]: (start, end) offsets of each chunk in text, in order.
+        """
+        # Separator index -> start offsets of its matches in text, filled on first use.
+        matches: Dict[int, List[int]] = {}
+        return self._split(text, 0, len(text), 0, span_length, matches)
+
+    def _match_starts(self, text: str, start: int, end: int, index: int, matches: Dict[int, List[int]]) -> List[int]:
+        """Starts of the separator's matches inside [start, end), as a scan of just that span would find them."""
+        pattern = self._patterns[index]
+        if index not in matches:
+            matches[index] = [match.start() for match in pattern.finditer(text)]
+        starts = matches[index]
+        width = len(self.separators[index])
+        first = bisect_left(starts, start)
+        if first > 0 and starts[first - 1] + width > start:
+            # A match straddles the span start, so a scan of the span alone could align differently.
+            return [match.start() for match in pattern.finditer(text, start, end)]
+        return starts[first:bisect_right(starts, end - width)]
+
+    def _split(self, text: str, start: int, end: int, first_separator: int, length: Optional[SpanLength], matches: Dict[int, List[int]]) -> List[Span]:
+        # Pick the first remaining separator that occurs in the span.
+        separator_index = len(self.separators) - 1
+        next_separator = len(self.separators)
+        for i in range(first_separator, len(self.separators)):
+            if self._patterns[i] is None:
+                separator_index = i
+                break
+            if self._match_starts(text, start, end, i, matches):
+                separator_index = i
+                next_separator = i + 1
+                break
+        if self._patterns[separator_index] is None:
+            pieces = [(i, i + 1) for i in range(start, end)]
+        else:
+            cuts = self._match_starts(text, start, end, separator_index, matches)
+            # Cut before every match, keeping the separator at the start of each piece.
+            bounds = [start] + cuts + [end]
+            pieces = [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+        chunks: List[Span] = []
+        good: List[Tuple[int, int, float]] = []
+        for piece_start, piece_end in pieces:
+            piece_length = length(piece_start, piece_end) if length is not None else piece_end - piece_start
+            if piece_length < self.chunk_size:
+                good.append((piece_start, piece_end, piece_length))
+                continue
+            if good:
+                chunks.extend(self._merge(text, good))
+                good = []
+            if next_separator >= len(self.separators):
+                chunks.append((piece_start, piece_end))
+            else:
+                chunks.extend(self._split(text, piece_start, piece_end, next_separator, length, matches))
+        if good:
+            chunks.extend(self._merge(text, good))
+        return chunks
+
+    def _merge(self, text: str, pieces: List[Tuple[int, int, float]]) -> List[Span]:
+        """Greedily merges consecutive pieces into chunks of up to chunk_size, carrying chunk_overlap forward."""
+        chunks: List[Span] = []
+        # The current chunk is pieces[head:tail]; dropping pieces from the front only moves head.
+        head = 0
+        total = 0.0
+        for tail, piece in enumerate(pieces):
+            piece_length = piece[2]
+            if total + piece_length > self.chunk_size and tail > head:
+                chunk = self._strip(text, pieces[head][0], pieces[tail - 1][1])
+                if chunk is not None:
+                    chunks.append(chunk)
+                while head < tail and (total > self.chunk_overlap or (total + piece_length > self.chunk_size and total > 0)):
+                    total -= pieces[head][2]
+                    head += 1
+                if head == tail:
+                    # Guard against float residue from fractional (scaled token) lengths.
+                    total = 0.0
+            total += piece_length
+        if head < len(pieces):
+            chunk = self._strip(text, pieces[head][0], pieces[-1][1])
+            if chunk is not None:
+                chunks.append(chunk)
+        return chunks
+
+    @staticmethod
+    def _strip(text: str, start: int, end: int) -> Optional[Span]:
+        """The span without leading/trailing whitespace (as str.strip), or None if nothing is left."""
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        return (start, end) if end > start else None
@@ -0,0 +1,62 @@
+from typing import Dict, List
+
+from langchain_core.documents import Document
+
+from app.core.lexical_index import ChunkPostingsIndex, Posting
+
+SparseWeights = Dict[int, float]
+
+
+class SparseIndex(ChunkPostingsIndex):
+    """
+    A persistent inverted index of BGE-M3 sparse (lexical) weights, stored in SQLite next to
+    the Chroma collection.
+
+    Each chunk keeps only the vocabulary tokens the model's sparse head weighted above zero,
+    as (token ID, weight) postings. A query is scored as in BGE-M3's lexical matching: the
+    sum of query weight x chunk weight over the tokens they share. The weights come from the
+    same forward pass as the dense vectors (EmbeddingService.embed_documents_with_sparse), so
+    no second model or tokenizer is involved.
+    """
+
+    def __init__(self, path: str = './vector_store_db/documents_sparse.sqlite3'):
+        super().__init__(path)
+        print(f"SparseIndex initialized at {path}")
+
+    @staticmethod
+    def _terms(weights: SparseWeights) -> Dict[str, float]:
+        return {str(token_id): float(weight) for token_id, weight in weights.items() if weight > 0}
+
+    def upsert(self, documents: List[Document], ids: List[str], weights: List[SparseWeights]) -> None:
+        """
+        Indexes chunks with their sparse weights, replacing any previous version stored under the same IDs.
+
+        Args:
+            documents (List[Document]): Chunks with user_id and document_id metadata.
+            ids (List[str]): One chunk ID per document, as used in the vector store.
+            weights (List[SparseWeights]): Token ID -> weight for each chunk.
+        """
+        self._write(documents, ids, [self._terms(chunk_weights) for chunk_weights in weights])
+
+    def search(self, query_weights: SparseWeights, user_id: str, document_id: str, k: int = 10) -> List[Document]:
+        """
+        Ranks the chunks of one user's document by their sparse dot product with the query.
+
+        Args:
+            query_weights (SparseWeights): Token ID -> weight of the question.
+            user_id (str): The owner of the document.
+            document_id (str): The document to search.
+            k (int): The number of chunks to return.
+
+        Returns:
+            List[Document]: Up to k chunks, best first, with their stored metadata and ID.
+        """
+        terms = self._terms(query_weights)
+
+        def dot_product(postings: List[Posting], total: int, average_length: float) -> Dict[str, float]:
+            scores: Dict[str, float] = {}
+            for term, chunk_id, weight, _ in postings:
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + terms[term] * weight
+            return scores
+
+        return self._search(list(terms), user_id, document_id, k, dot_product)
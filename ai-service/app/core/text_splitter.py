@@ -1,21 +1,147 @@
+import copy
+import threading
+from bisect import bisect_left
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List
+from typing import Any, Callable, Dict, List, Optional
 from langchain_core.documents import Document
 
 from app.core.document_loader import load_from_source
+from app.core.lazy_imports import lazy_imports
+from app.core.span_splitter import SpanSplitter
+
+_load, __getattr__ = lazy_imports(globals(), {"AutoTokenizer": ("transformers", "AutoTokenizer")})
+
+SPLIT_MODES = ('chars', 'tokens')
+SPLIT_ENGINES = ('span', 'langchain')
+
+
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def _copy_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """A per-chunk copy of the page metadata: a plain dict copy when every value is immutable, else a deep copy."""
+    if all(isinstance(value, _SCALAR_TYPES) for value in metadata.values()):
+        return dict(metadata)
+    return copy.deepcopy(metadata)
+
+
+class TokenCounter:
+    """
+    Token counts for arbitrary character spans of one text, from a single tokenization.
+
+    A span's count is the number of tokens that start inside it. This matches re-tokenizing
+    the substring up to tokens straddling its edges, at the cost of one bisect per lookup.
+    """
+
+    def __init__(self, token_starts: List[int]):
+        self.token_starts = token_starts
+
+    def count(self, start: int, end: int) -> int:
+        return bisect_left(self.token_starts, end) - bisect_left(self.token_starts, start)
+
 
 class TextSplitterService:
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
-        
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        mode: str = 'chars',
+        embed_tokenizer_name: str = 'BAAI/bge-m3',
+        embed_token_budget: int = 512,
+        rerank_tokenizer_name: Optional[str] = 'cross-encoder/ms-marco-MiniLM-L-6-v2',
+        rerank_token_budget: Optional[int] = 448,
+        token_overlap: int = 64,
+        engine: str = 'span',
+    ):
+        """
+        Args:
+            chunk_size, chunk_overlap: Chunk size and overlap in characters ('chars' mode).
+            mode: 'chars' (RecursiveCharacterTextSplitter by character count) or 'tokens'
+                (the same recursive splitting, measured in model tokens).
+            embed_tokenizer_name, embed_token_budget: Tokenizer of the embedding model and the
+                most tokens a chunk may have for it ('tokens' mode).
+            rerank_tokenizer_name, rerank_token_budget: Tokenizer of the cross encoder and the
+                most tokens a chunk may have for it. Keep it below the cross encoder's window
+                minus room for the question and special tokens, or chunks get truncated when
+                reranked. None disables the rerank budget.
+            token_overlap: Overlap between chunks in embedding tokens ('tokens' mode).
+            engine: 'span' (single-pass SpanSplitter, adds start_index/end_index to the chunk
+                metadata) or 'langchain' (RecursiveCharacterTextSplitter, 'chars' mode only).
+                Both produce the same chunk texts.
+        """
+        if mode not in SPLIT_MODES:
+            raise ValueError(f"Unsupported split mode: {mode}. Expected one of {SPLIT_MODES}.")
+        if engine not in SPLIT_ENGINES or (engine == 'langchain' and mode != 'chars'):
+            raise ValueError(f"Unsupported split engine: {engine} for mode {mode}.")
+        self.mode = mode
+        self.engine = engine
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             length_function=len,
             separators=["\n\n", "\n", " ", ""]
         )
-        print(f"TextSplitterService initialized with chunk_size={chunk_size}, chunk_overlap={chunk_overlap}")
-        
+        self.embed_tokenizer_name = embed_tokenizer_name
+        self.embed_token_budget = embed_token_budget
+        self.rerank_tokenizer_name = rerank_tokenizer_name if rerank_token_budget else None
+        self.rerank_token_budget = rerank_token_budget
+        self.char_splitter = SpanSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        # Lengths are in embedding tokens; rerank tokens are scaled onto the same budget.
+        self.token_splitter = SpanSplitter(chunk_size=embed_token_budget, chunk_overlap=token_overlap)
+        self._tokenizers: Dict[str, Any] = {}
+        self._tokenizer_lock = threading.Lock()
+        if mode == 'tokens':
+            print(f"TextSplitterService initialized in token mode with embed_token_budget={embed_token_budget}, rerank_token_budget={rerank_token_budget}, token_overlap={token_overlap}")
+        else:
+            print(f"TextSplitterService initialized with chunk_size={chunk_size}, chunk_overlap={chunk_overlap}, engine={engine}")
+    
+    def _tokenizer(self, name: str) -> Any:
+        with self._tokenizer_lock:
+            if name not in self._tokenizers:
+                self._tokenizers[name] = _load("AutoTokenizer").from_pretrained(name)
+            return self._tokenizers[name]
+    
+    def _token_counters(self, name: str, texts: List[str]) -> List[TokenCounter]:
+        """Tokenizes all texts in one batched call of the fast tokenizer and indexes the token offsets."""
+        encoded = self._tokenizer(name)(
+            texts,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+            verbose=False,
+        )
+        return [TokenCounter(sorted(start for start, _ in offsets)) for offsets in encoded['offset_mapping']]
+    
+    def _span_lengths(self, texts: List[str]) -> List[Optional[Callable[[int, int], float]]]:
+        """One span length function per text: None (characters) in 'chars' mode, token counts in 'tokens' mode."""
+        if self.mode == 'chars':
+            return [None] * len(texts)
+        embed_counters = self._token_counters(self.embed_tokenizer_name, texts)
+        if not self.rerank_tokenizer_name:
+            return [counter.count for counter in embed_counters]
+        rerank_counters = self._token_counters(self.rerank_tokenizer_name, texts)
+        scale = self.embed_token_budget / self.rerank_token_budget
+        # A chunk must fit both budgets: take whichever is closer to its limit.
+        return [
+            lambda start, end, e=embed_counter, r=rerank_counter: max(e.count(start, end), r.count(start, end) * scale)
+            for embed_counter, rerank_counter in zip(embed_counters, rerank_counters)
+        ]
+    
+    def _split_documents_by_spans(self, documents: List[Document]) -> List[Document]:
+        """Splits each document into slices of its text and records each slice's character offsets."""
+        texts = [doc.page_content for doc in documents]
+        splitter = self.token_splitter if self.mode == 'tokens' else self.char_splitter
+        chunks = []
+        for doc, text, span_length in zip(documents, texts, self._span_lengths(texts)):
+            for start, end in splitter.split(text, span_length):
+                metadata = _copy_metadata(doc.metadata)
+                metadata["start_index"] = start
+                metadata["end_index"] = end
+                chunks.append(Document(page_content=text[start:end], metadata=metadata))
+        return chunks
+    
     def split_documents(self, documents: List[Document]) -> List[Document]:
         """
         Split a list of documents into smaller chunks.
@@ -29,7 +155,10 @@ class TextSplitterService:
         if not documents:
             return []
         print(f"Splitting {len(documents)} documents into chunks...")
-        chunks = self.text_splitter.split_documents(documents)
+        if self.engine == 'span':
+            chunks = self._split_documents_by_spans(documents)
+        else:
+            chunks = self.text_splitter.split_documents(documents)
         print(f"Created {len(chunks)} chunks from {len(documents)} documents.")
         return chunks
     
@@ -1,37 +1,283 @@
 
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import chromadb
+import numpy as np
+from chromadb.errors import NotFoundError
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import RunnableLambda
 
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Optional, Tuple
 
 # refactored code to use Chroma as the vector store
 
+PARTITION_MODES = ("user", "document")
+
+
 class VectorStoreService:
-    """Service for managing a vector store using Chroma."""
+    """
+    Service for managing a vector store using Chroma.
+
+    With partition_by set, chunks are routed to one collection per user ("user") or per
+    user's document ("document") instead of the single base collection, so index size and
+    filter cost follow the tenant's data rather than the whole platform's. Partition
+    collections are created by the first upsert for their user or document (reads and
+    deletes of a partition that was never written see it as empty), kept in an LRU of at
+    most max_open_partitions handles, and closed after partition_idle_seconds without use.
+    Calls that do not name a user keep using the base collection.
+
+    With server_host set, the collections live in a Chroma server instead of the embedded
+    store in persist_directory; that is what lets several API worker processes share them.
+    """
     
     _vector_store: Chroma
     
-    def __init__(self,embedding_function: Embeddings, persist_directory: str ='./chroma_db', collection_name: str = 'default_collection'):
+    def __init__(
+        self,
+        embedding_function: Embeddings,
+        persist_directory: str ='./chroma_db',
+        collection_name: str = 'default_collection',
+        partition_by: Optional[str] = None,
+        max_open_partitions: int = 64,
+        partition_idle_seconds: float = 600,
+        clock: Callable[[], float] = time.monotonic,
+        server_host: Optional[str] = None,
+        server_port: int = 8000,
+    ):
+        if partition_by is not None and partition_by not in PARTITION_MODES:
+            raise ValueError(f"partition_by must be one of {PARTITION_MODES} or None, got {partition_by!r}")
+        # Our own client, shared by the base collection and every partition, so partition
+        # management does not depend on langchain_chroma's internals.
+        if server_host:
+            self._client = chromadb.HttpClient(host=server_host, port=server_port)
+        else:
+            self._client = chromadb.PersistentClient(path=persist_directory)
         self._vector_store = Chroma(
             collection_name=collection_name,
             embedding_function=embedding_function,
-            persist_directory=persist_directory  # Where to save data locally, remove if not necessary
+            client=self._client,
         )
-        print(f'LangChian Chroma vector store initialized with collection: {collection_name}')
+        self._embedding_function = embedding_function
+        self.collection_name = collection_name
+        self.partition_by = partition_by
+        self.max_open_partitions = max(1, max_open_partitions)
+        self.partition_idle_seconds = partition_idle_seconds
+        self._clock = clock
+        # Collection name -> (handle, last used); most recently used last.
+        self._partitions: "OrderedDict[str, Tuple[Chroma, float]]" = OrderedDict()
+        self._partition_lock = threading.Lock()
+        self.partitions_opened = 0
+        self.partitions_closed = 0
+        print(f'LangChian Chroma vector store initialized with collection: {collection_name}' + (f', partitioned by {partition_by}' if partition_by else '') + (f', on server {server_host}:{server_port}' if server_host else ''))
+
+    def partition_name(self, user_id: str, document_id: Optional[str] = None) -> str:
+        """
+        Returns the collection that holds a user's (or a user's document's) chunks.
+
+        IDs are hashed so any user or document ID yields a valid Chroma collection name.
+        """
+        key = user_id if self.partition_by == "user" else f"{user_id}\x00{document_id}"
+        return f"{self.collection_name}_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:24]}"
+
+    def _collection(self, user_id: Optional[str] = None, document_id: Optional[str] = None, create: bool = True) -> Optional[Chroma]:
+        """
+        Returns the collection for the user/document, opening its partition on first use.
+
+        With create=False a partition that does not exist yet is not created and None is
+        returned, so reads for unknown users or documents leave no empty collections behind.
+        """
+        if self.partition_by is None or user_id is None:
+            return self._vector_store
+        if self.partition_by == "document" and document_id is None:
+            raise ValueError("A document_id is required when the vector store is partitioned by document.")
+        name = self.partition_name(user_id, document_id)
+        now = self._clock()
+        with self._partition_lock:
+            entry = self._partitions.pop(name, None)
+            if entry is None:
+                if not create:
+                    try:
+                        self._client.get_collection(name)
+                    except NotFoundError:
+                        return None
+                # All partitions share one client, so opening one is cheap.
+                handle = Chroma(
+                    collection_name=name,
+                    embedding_function=self._embedding_function,
+                    client=self._client,
+                )
+                self.partitions_opened += 1
+            else:
+                handle = entry[0]
+            self._partitions[name] = (handle, now)
+            self._close_idle_partitions(now)
+        return handle
+
+    def _close_idle_partitions(self, now: float) -> None:
+        """Drops idle and least recently used handles; the caller must hold the lock."""
+        while self._partitions:
+            name, (_, last_used) = next(iter(self._partitions.items()))
+            if len(self._partitions) <= self.max_open_partitions and now - last_used < self.partition_idle_seconds:
+                break
+            del self._partitions[name]
+            self.partitions_closed += 1
+
+    def _get(self, user_id: Optional[str], document_id: Optional[str], **kwargs: Any) -> Dict[str, Any]:
+        """Chroma get() on the user/document's collection; a partition that was never written reads as empty."""
+        collection = self._collection(user_id, document_id, create=False)
+        if collection is None:
+            return {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+        return collection.get(**kwargs)
+
+    def _group_by_partition(self, documents: List[Document]) -> Dict[Tuple[Optional[str], Optional[str]], List[int]]:
+        """Groups document positions by the (user_id, document_id) that selects their collection."""
+        groups: Dict[Tuple[Optional[str], Optional[str]], List[int]] = {}
+        for i, doc in enumerate(documents):
+            metadata = doc.metadata or {}
+            key = (None, None)
+            if self.partition_by is not None and metadata.get('user_id') is not None:
+                key = (metadata['user_id'], metadata.get('document_id') if self.partition_by == "document" else None)
+            groups.setdefault(key, []).append(i)
+        return groups
+
+    def stats(self) -> Dict[str, Any]:
+        with self._partition_lock:
+            return {
+                "partition_by": self.partition_by,
+                "open_partitions": len(self._partitions),
+                "opened": self.partitions_opened,
+                "closed": self.partitions_closed,
+            }
         
     def upsert_documents(self, documents: List[Document], ids: List[str]) ->None:
         
         if not (len(documents) == len(ids)):
             raise ValueError("The number of documents must match the number of IDs.")
         try:
-            self._vector_store.add_documents(documents=documents, 
-                                         ids=ids)
+            for (user_id, document_id), positions in self._group_by_partition(documents).items():
+                self._collection(user_id, document_id).add_documents(
+                    documents=[documents[i] for i in positions],
+                    ids=[ids[i] for i in positions],
+                )
             print(f"Upserted {len(documents)} documents into the vector store.")
         except Exception as e:
             print(f"Error upserting documents: {e}")
             raise
         
+    def upsert_embeddings(self, documents: List[Document], ids: List[str], embeddings: np.ndarray) -> None:
+        """
+        Upserts documents together with precomputed embeddings, bypassing the store's
+        embedding_function so the caller owns the embedding step. In a partitioned store each
+        document goes to the collection of its user_id/document_id metadata.
+
+        Args:
+            documents (List[Document]): The documents to store.
+            ids (List[str]): One ID per document.
+            embeddings (np.ndarray): A (len(documents), dim) float32 array of vectors.
+        """
+        # No-op for the float32 arrays the pipeline produces; only other inputs are copied.
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if not (len(documents) == len(ids) == len(embeddings)):
+            raise ValueError("The number of documents, IDs and embeddings must match.")
+        if not documents:
+            return
+        try:
+            for (user_id, document_id), positions in self._group_by_partition(documents).items():
+                self._collection(user_id, document_id)._collection.upsert(
+                    ids=[ids[i] for i in positions],
+                    embeddings=embeddings[positions] if len(positions) < len(documents) else embeddings,
+                    documents=[documents[i].page_content for i in positions],
+                    metadatas=[documents[i].metadata or None for i in positions],
+                )
+            print(f"Upserted {len(documents)} documents with precomputed embeddings into the vector store.")
+        except Exception as e:
+            print(f"Error upserting embeddings: {e}")
+            raise
+        
+    def get_chunk_hashes(self, file_id: str, user_id: Optional[str] = None, document_id: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """
+        Returns the stored chunk IDs of a file mapped to their content_hash metadata.
+
+        Args:
+            file_id (str): The file whose chunks to look up.
+            user_id (str, optional): The file's owner; selects the partition.
+            document_id (str, optional): The file's document; selects the partition.
+
+        Returns:
+            Dict[str, Optional[str]]: Chunk ID -> content hash (None for chunks stored without one).
+        """
+        data = self._get(user_id, document_id, where={"file_id": file_id}, include=["metadatas"])
+        metadatas = data.get('metadatas') or [None] * len(data['ids'])
+        return {
+            chunk_id: (metadata or {}).get('content_hash')
+            for chunk_id, metadata in zip(data['ids'], metadatas)
+        }
+
+    def get_document_vectors(self, where: Dict[str, Any], user_id: Optional[str] = None, document_id: Optional[str] = None) -> Tuple[List[Document], np.ndarray]:
+        """
+        Returns every stored chunk matching a metadata filter together with its embedding.
+
+        Args:
+            where (Dict[str, Any]): A Chroma metadata filter, e.g. one user's document.
+            user_id (str, optional): Selects the partition to read.
+            document_id (str, optional): Selects the partition to read.
+
+        Returns:
+            Tuple[List[Document], np.ndarray]: The chunks (with their IDs) and a (n, dim) float32 matrix.
+        """
+        data = self._get(user_id, document_id, where=where, include=["embeddings", "documents", "metadatas"])
+        ids = data.get('ids') or []
+        if not ids:
+            return [], np.empty((0, 0), dtype=np.float32)
+        metadatas = data.get('metadatas') or [None] * len(ids)
+        documents = [
+            Document(id=chunk_id, page_content=content or "", metadata=metadata or {})
+            for chunk_id, content, metadata in zip(ids, data['documents'], metadatas)
+        ]
+        return documents, np.ascontiguousarray(data['embeddings'], dtype=np.float32)
+
+    def get_document_version(self, where: Dict[str, Any], user_id: Optional[str] = None, document_id: Optional[str] = None) -> str:
+        """
+        Returns a fingerprint of the stored chunks matching a metadata filter: a hash of their
+        IDs and content hashes. It changes whenever a chunk is added, removed or rewritten,
+        and only reads metadata, so it is much cheaper than get_document_vectors.
+
+        Args:
+            where (Dict[str, Any]): A Chroma metadata filter, e.g. one user's document.
+            user_id (str, optional): Selects the partition to read.
+            document_id (str, optional): Selects the partition to read.
+
+        Returns:
+            str: The fingerprint; the same for the same stored chunks.
+        """
+        data = self._get(user_id, document_id, where=where, include=["metadatas"])
+        ids = data.get('ids') or []
+        metadatas = data.get('metadatas') or [None] * len(ids)
+        chunks = sorted((chunk_id, (metadata or {}).get('content_hash') or "") for chunk_id, metadata in zip(ids, metadatas))
+        digest = hashlib.sha256()
+        for chunk_id, content_hash in chunks:
+            digest.update(f"{chunk_id}\x00{content_hash}\x00".encode('utf-8'))
+        return digest.hexdigest()
+
+    def delete_documents(self, ids: List[str], user_id: Optional[str] = None, document_id: Optional[str] = None) -> None:
+        """Deletes documents by ID in a single bulk call, from the user/document's partition if given."""
+        if not ids:
+            return
+        try:
+            collection = self._collection(user_id, document_id, create=False)
+            if collection is None:
+                return
+            collection.delete(ids=ids)
+            print(f"Deleted {len(ids)} documents from the vector store.")
+        except Exception as e:
+            print(f"Error deleting documents: {e}")
+            raise
+        
     def similarity_search(self, query: str, k: int = 3) -> List[Document]:
         try:
             results = self._vector_store.similarity_search(query, k=k)
@@ -40,18 +286,61 @@ class VectorStoreService:
             print(f"Error searching vector store: {e}")
             return []
 
-    def get_retriever(self, search_kwargs: Dict[str, Any] = None) -> Any:
+    def similarity_search_by_vector(
+        self,
+        embedding: np.ndarray,
+        k: int = 10,
+        filter: Optional[Dict[str, Any]] = None,
+        user_id: Optional[str] = None,
+        document_id: Optional[str] = None,
+    ) -> List[Document]:
+        """
+        Searches with an already computed query embedding, so callers that embedded the
+        question for something else do not pay for a second embedding. The float32 vector
+        goes to the Chroma collection as an array, without a round-trip through a list.
+
+        Args:
+            embedding (np.ndarray): The query vector.
+            k (int): The number of documents to return.
+            filter (Dict[str, Any], optional): A Chroma metadata filter.
+            user_id (str, optional): Selects the partition to search.
+            document_id (str, optional): Selects the partition to search.
+
+        Returns:
+            List[Document]: The k most similar documents.
+        """
+        collection = self._collection(user_id, document_id, create=False)
+        if collection is None:
+            return []
+        results = collection._collection.query(
+            query_embeddings=np.ascontiguousarray(embedding, dtype=np.float32).reshape(1, -1),
+            n_results=k,
+            where=filter,
+            include=["documents", "metadatas"],
+        )
+        return [
+            Document(id=chunk_id, page_content=content or "", metadata=metadata or {})
+            for chunk_id, content, metadata in zip(results['ids'][0], results['documents'][0], results['metadatas'][0])
+        ]
+
+    def get_retriever(self, search_kwargs: Dict[str, Any] = None, user_id: Optional[str] = None, document_id: Optional[str] = None) -> Any:
         """
         Returns a retriever for the vector store.
 
         Args:
             search_kwargs (Dict[str, Any], optional): Additional search parameters.
+            user_id (str, optional): Selects the partition to search.
+            document_id (str, optional): Selects the partition to search.
 
         Returns:
             Any: A retriever object.
         """
         try:
-            retriever = self._vector_store.as_retriever(search_kwargs=search_kwargs)
+            collection = self._collection(user_id, document_id, create=False)
+            if collection is None:
+                # Nothing was stored for this user/document yet.
+                return RunnableLambda(lambda _: [])
+            retriever = collection.as_retriever(search_kwargs=search_kwargs)
             return retriever
         except Exception as e:
             print(f"Error creating retriever: {e}")
@@ -1,18 +1,113 @@
 import os
-import getpass
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, Request
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
+from typing import Optional, Tuple
 
 from app.core.embedding_service import EmbeddingService
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from app.core.embedding_cache import EmbeddingCache
+from app.core.embedding_pool import EmbeddingPool
+from app.core.inference_scheduler import InferenceScheduler
 from app.core.text_splitter import TextSplitterService
 from app.core.vector_store import VectorStoreService
 from app.core.pipeline import ProcessingPipeline, RagPipeline
+from app.core.job_queue import JobQueue
+from app.core.answer_cache import AnswerCache
+from app.core.semantic_answer_cache import SemanticAnswerCache
+from app.core.rerank_cache import RerankScoreCache
+from app.core.lexical_index import LexicalIndex
+from app.core.sparse_index import SparseIndex
+from app.core.document_vector_cache import DocumentVectorCache
+from app.core.lazy_imports import lazy_imports
+from app.core.readiness import ServiceReadiness
+from app.core.sidecar import DocumentChangeFeed, RemoteCrossEncoder, RemoteEmbeddingService, SidecarClient
 
 
 from app.api.v1 import endpoints as v1_endpoints
 
+# The Gemini client pulls in the google-genai stack; import it only when the lifespan builds it.
+_load, __getattr__ = lazy_imports(globals(), {"ChatGoogleGenerativeAI": ("langchain_google_genai", "ChatGoogleGenerativeAI")})
+
+def _env_int(name: str, default: int) -> int:
+    """Reads an integer setting from the environment, falling back to the default."""
+    try:
+        return int(os.getenv(name, str(default)))
+    except (TypeError, ValueError):
+        return default
+
+def _env_float(name: str, default: float) -> float:
+    """Reads a float setting from the environment, falling back to the default."""
+    try:
+        return float(os.getenv(name, str(default)))
+    except (TypeError, ValueError):
+        return default
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    """Reads a boolean flag ('1', 'true', 'yes') from the environment."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes")
+
+def build_embedding_service() -> Tuple[EmbeddingService, InferenceScheduler, Optional[EmbeddingPool], Optional[EmbeddingCache]]:
+    """
+    Builds the embedding service, with its cache, process pool and the inference scheduler
+    shared by every model, from the environment. Used by the API lifespan and by the
+    inference sidecar (app.sidecar).
+
+    Returns:
+        Tuple: The embedding service, the scheduler, the pool and the cache (None when disabled).
+    """
+    embedding_cache = None
+    if _env_bool("EMBEDDING_CACHE_ENABLED", True):
+        embedding_cache = EmbeddingCache(
+            path=os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3"),
+            max_size_mb=_env_int("EMBEDDING_CACHE_MAX_MB", 512),
+        )
+    # One scheduler for every model so queries and reranks preempt ingestion batches.
+    inference_scheduler = InferenceScheduler(
+        max_bulk_wait_ms=_env_int("INFERENCE_MAX_BULK_WAIT_MS", 2000),
+        max_interactive_streak=_env_int("INFERENCE_MAX_INTERACTIVE_STREAK", 16),
+    )
+    embedding_pool = None
+    if _env_int("EMBED_POOL_WORKERS", 0) > 0:
+        embedding_pool = EmbeddingPool(
+            num_workers=_env_int("EMBED_POOL_WORKERS", 0),
+            threads_per_worker=_env_int("EMBED_POOL_THREADS", 1),
+            backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+            onnx_file_name=os.getenv("EMBEDDING_ONNX_FILE") or None,
+            batch_size=_env_int("EMBED_ENCODE_BATCH_SIZE", 16),
+            min_texts=_env_int("EMBED_POOL_MIN_TEXTS", 32),
+        )
+    embeddings = EmbeddingService(
+        cache=embedding_cache,
+        batch_window_ms=_env_int("EMBED_BATCH_WINDOW_MS", 5),
+        max_batch_size=_env_int("EMBED_MAX_BATCH_SIZE", 32),
+        scheduler=inference_scheduler,
+        bulk_slice_size=_env_int("EMBED_BULK_SLICE_SIZE", 16),
+        sort_by_length=_env_bool("EMBED_SORT_BY_LENGTH", True),
+        encode_batch_size=_env_int("EMBED_ENCODE_BATCH_SIZE", 16),
+        max_batch_tokens=_env_int("EMBED_MAX_BATCH_TOKENS", 8192),
+        backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+        onnx_file_name=os.getenv("EMBEDDING_ONNX_FILE") or None,
+        pool=embedding_pool,
+        sparse=_env_bool("EMBEDDING_SPARSE"),
+        # Loaded and warmed up in the background by the caller, so serving starts right away.
+        lazy_load=True,
+    )
+    return embeddings, inference_scheduler, embedding_pool, embedding_cache
+
+def close_embedding_service(embeddings, inference_scheduler, embedding_pool, embedding_cache) -> None:
+    """Closes what build_embedding_service built."""
+    embeddings.close()
+    inference_scheduler.close()
+    if embedding_pool is not None:
+        embedding_pool.close()
+    if embedding_cache is not None:
+        embedding_cache.close()
+
 @asynccontextmanager
 
 async def lifespan(app: FastAPI):
@@ -21,36 +116,162 @@ async def lifespan(app: FastAPI):
     load_dotenv()
     
     print("Initializing Core Service...")
+    readiness = ServiceReadiness()
     
     try:
-        if not os.getenv("GOOGLE_API_KEY"):
-            os.environ["GOOGLE_API_KEY"] = getpass.getpass("Enter API key for Google Gemini: ")
         # embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-        embeddings = EmbeddingService()
-        text_splitter_service = TextSplitterService(chunk_size=1000, chunk_overlap=200)
+        sidecar = None
+        inference_scheduler = embedding_pool = embedding_cache = None
+        if _env_bool("INFERENCE_SIDECAR"):
+            # Under gunicorn (see gunicorn.conf.py) one sidecar process holds the models for
+            # every worker; this worker only talks to it.
+            sidecar_socket = os.getenv("INFERENCE_SIDECAR_SOCKET")
+            if not sidecar_socket:
+                raise ValueError("INFERENCE_SIDECAR is set but INFERENCE_SIDECAR_SOCKET is not.")
+            sidecar = SidecarClient(sidecar_socket, authkey=(os.getenv("INFERENCE_SIDECAR_AUTHKEY") or "").encode() or None)
+            embeddings = RemoteEmbeddingService(sidecar, sparse=_env_bool("EMBEDDING_SPARSE"))
+        else:
+            embeddings, inference_scheduler, embedding_pool, embedding_cache = build_embedding_service()
+        text_splitter_service = TextSplitterService(
+            chunk_size=1000,
+            chunk_overlap=200,
+            mode=os.getenv("TEXT_SPLIT_MODE", "chars"),
+            embed_token_budget=_env_int("EMBED_CHUNK_TOKENS", 512),
+            rerank_token_budget=_env_int("RERANK_CHUNK_TOKENS", 448),
+            token_overlap=_env_int("CHUNK_TOKEN_OVERLAP", 64),
+            engine=os.getenv("TEXT_SPLIT_ENGINE", "span"),
+        )
+        vector_partition = os.getenv("VECTOR_PARTITION", "none").strip().lower()
         vector_store_service = VectorStoreService(
             embedding_function=embeddings,
             persist_directory=os.getenv("CHROMA_DB_PATH", "./vector_store_db"),
             collection_name="documents",
+            # "user" or "document" gives each tenant (or tenant's document) its own collection.
+            # Chunks already in the shared collection are not moved; re-ingest them after switching.
+            partition_by=None if vector_partition in ("", "none") else vector_partition,
+            max_open_partitions=_env_int("VECTOR_MAX_OPEN_PARTITIONS", 64),
+            partition_idle_seconds=_env_float("VECTOR_PARTITION_IDLE_S", 600),
+            # Required with several API workers: the embedded store is single-process.
+            server_host=os.getenv("CHROMA_SERVER_HOST") or None,
+            server_port=_env_int("CHROMA_SERVER_PORT", 8000),
         )
     except Exception as e:
         print(f"FATAL: Could not initialize services. Check .env file. Error: {e}")
         raise
     
     print("initializing pipelines...")
+    # Dedicated pools so one ingestion cannot starve the event loop or each other's stages.
+    io_executor = ThreadPoolExecutor(max_workers=_env_int("INGEST_IO_WORKERS", 4), thread_name_prefix="ingest-io")
+    cpu_executor = ThreadPoolExecutor(max_workers=_env_int("INGEST_CPU_WORKERS", 2), thread_name_prefix="ingest-cpu")
+    # Queries embed, search and rerank here and await the LLM on the event loop, so
+    # LLM_MAX_CONCURRENCY, not the thread count, bounds the queries in flight.
+    query_executor = ThreadPoolExecutor(max_workers=_env_int("QUERY_WORKERS", 4), thread_name_prefix="query")
+    answer_cache = None
+    document_listeners = []
+    if _env_bool("ANSWER_CACHE_ENABLED", True):
+        answer_cache = AnswerCache(
+            max_entries=_env_int("ANSWER_CACHE_MAX_ENTRIES", 1024),
+            ttl_seconds=_env_int("ANSWER_CACHE_TTL_S", 3600),
+        )
+        # Re-ingesting a document drops its cached answers.
+        document_listeners.append(answer_cache.on_document_changed)
+    semantic_cache = None
+    if _env_bool("SEMANTIC_CACHE_ENABLED", False):
+        semantic_cache = SemanticAnswerCache(
+            threshold=_env_float("SEMANTIC_CACHE_THRESHOLD", 0.92),
+            max_entries_per_document=_env_int("SEMANTIC_CACHE_MAX_ENTRIES", 256),
+            ttl_seconds=_env_int("ANSWER_CACHE_TTL_S", 3600),
+        )
+        document_listeners.append(semantic_cache.on_document_changed)
+    rerank_cache = None
+    if _env_bool("RERANK_CACHE_ENABLED", True):
+        rerank_cache = RerankScoreCache(max_entries=_env_int("RERANK_CACHE_MAX_ENTRIES", 8192))
+        document_listeners.append(rerank_cache.on_document_changed)
+    vector_cache = None
+    if _env_bool("HOT_INDEX_ENABLED", True):
+        vector_cache = DocumentVectorCache(
+            max_bytes=_env_int("HOT_INDEX_MAX_MB", 256) * 1024 * 1024,
+            revalidate_seconds=_env_float("HOT_INDEX_REVALIDATE_S", 30),
+        )
+        document_listeners.append(vector_cache.on_document_changed)
+    change_feed = None
+    if sidecar is not None:
+        # Other workers cache the same documents: tell them about our changes, and apply theirs.
+        change_feed = DocumentChangeFeed(sidecar, list(document_listeners), interval_seconds=_env_float("DOCUMENT_CHANGE_POLL_S", 1))
+        document_listeners.append(sidecar.publish_document_changed)
+    lexical_index = None
+    if _env_bool("HYBRID_SEARCH_ENABLED", True):
+        lexical_index = LexicalIndex(path=os.getenv("LEXICAL_INDEX_PATH", "./lexical_index.sqlite3"))
+    sparse_index = None
+    if _env_bool("EMBEDDING_SPARSE"):
+        # BGE-M3 sparse weights live next to the Chroma collection.
+        sparse_index = SparseIndex(path=os.path.join(os.getenv("CHROMA_DB_PATH", "./vector_store_db"), "documents_sparse.sqlite3"))
     processing_pipline = ProcessingPipeline(
         text_splitter=text_splitter_service,
         embedding_service = embeddings,
-        vector_store_service=vector_store_service
+        vector_store_service=vector_store_service,
+        io_executor=io_executor,
+        cpu_executor=cpu_executor,
+        streaming=_env_bool("INGEST_STREAMING"),
+        batch_size=_env_int("INGEST_BATCH_SIZE", 64),
+        embed_batch_size=_env_int("EMBED_BATCH_SIZE", 64),
+        incremental=_env_bool("INGEST_INCREMENTAL", True),
+        document_listeners=document_listeners,
+        lexical_index=lexical_index,
+        sparse_index=sparse_index,
+    )
+    llm = None
+    if os.getenv("GOOGLE_API_KEY"):
+        llm = _load("ChatGoogleGenerativeAI")(model="gemini-2.0-flash", temperature=0.2)
+    else:
+        readiness.mark_failed("llm", "GOOGLE_API_KEY is not set.")
+    rag_pipeline = RagPipeline(vector_store=vector_store_service, llm=llm, scheduler=inference_scheduler, lazy_load=True, answer_cache=answer_cache, semantic_cache=semantic_cache, embedding_service=embeddings, rerank_cache=rerank_cache, lexical_index=lexical_index, sparse_index=sparse_index, vector_cache=vector_cache, llm_concurrency=_env_int("LLM_MAX_CONCURRENCY", 8), executor=query_executor, cross_encoder=RemoteCrossEncoder(sidecar) if sidecar is not None else None)
+    
+    job_queue = JobQueue(
+        num_workers=_env_int("PROCESS_WORKERS", 2),
+        max_queue_size=_env_int("PROCESS_QUEUE_SIZE", 100),
+        # Job states go through the sidecar so any worker can answer /jobs/{job_id}.
+        status_store=sidecar,
     )
-    rag_pipeline = RagPipeline(vector_store=vector_store_service,llm=ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.2))
+    await job_queue.start()
+    if change_feed is not None:
+        change_feed.start()
     
     app.state.processing_pipeline = processing_pipline
     app.state.rag_pipeline = rag_pipeline
+    app.state.job_queue = job_queue
+    app.state.embedding_service = embeddings
+    app.state.answer_cache = answer_cache
+    app.state.semantic_cache = semantic_cache
+    app.state.rerank_cache = rerank_cache
+    app.state.vector_cache = vector_cache
+    app.state.vector_store = vector_store_service
+    app.state.readiness = readiness
+    # Both models load in parallel; /ready reports ready once they are loaded (and warm).
+    warmup = _env_bool("MODEL_WARMUP", True)
+    model_loading = asyncio.create_task(readiness.load({
+        "embedding_model": embeddings.warmup if warmup else embeddings.load,
+        "cross_encoder": rag_pipeline.warmup if warmup else rag_pipeline.load,
+    }))
     print('AI Service initialized successfully.')
     yield
     
     print('AI Service shutting down...')
+    model_loading.cancel()
+    await job_queue.stop(drain_timeout=_env_float("JOB_DRAIN_TIMEOUT_S", 10))
+    if change_feed is not None:
+        change_feed.close()
+    if sidecar is not None:
+        sidecar.close()
+    else:
+        close_embedding_service(embeddings, inference_scheduler, embedding_pool, embedding_cache)
+    if lexical_index is not None:
+        lexical_index.close()
+    if sparse_index is not None:
+        sparse_index.close()
+    io_executor.shutdown(wait=False, cancel_futures=True)
+    cpu_executor.shutdown(wait=False, cancel_futures=True)
+    query_executor.shutdown(wait=False, cancel_futures=True)
     
 app = FastAPI(title="My FastAPI Application",
               description="A service for processing and documents and answering questions using RAG.",
@@ -1,8 +1,12 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List,Dict,Any
+from pydantic import BaseModel, Field, StringConstraints
+from typing import Annotated, Optional, List,Dict,Any
 class HealthCheckResponse(BaseModel):
     status: str = Field(..., description="Health status of the service")
     message: Optional[str] = Field(None, description="Optional message providing additional information about the health status")
+class ReadinessResponse(BaseModel):
+    status: str = Field(..., description="One of 'ready', 'loading' or 'failed'")
+    components: Dict[str, str] = Field(default_factory=dict, description="Load state of each model or dependency")
+    errors: Dict[str, str] = Field(default_factory=dict)
 class ProcessRequest(BaseModel):
     
     file_id: str = Field(..., description="Unique identifier for the file to be processed")
@@ -16,6 +20,17 @@ class ProcessResponse(BaseModel):
     status: str
     message: str
     file_id: str
+    job_id: Optional[str] = Field(None, description="ID of the background job, poll /jobs/{job_id} for its status")
+
+class JobStatusResponse(BaseModel):
+    """Model representing the state of a background processing job."""
+    job_id: str
+    status: str = Field(..., description="One of 'queued', 'running', 'finished' or 'failed'")
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
     
 class SourceDocument(BaseModel):
     """Model representing a source document."""
@@ -31,4 +46,30 @@ class QueryRequest(BaseModel):
     
 class QueryResponse(BaseModel):
     answer: str = Field(..., description="The answer to the query")
-    sources: List[SourceDocument] = Field(..., description="List of sources used to generate the answer")
\ No newline at end of file
+    sources: List[SourceDocument] = Field(..., description="List of sources used to generate the answer")
+
+class BatchQueryRequest(BaseModel):
+    """Model for batch query requests: several questions about one document."""
+    user_id: str = Field(None, description="Optional user identifier for tracking purposes")
+    document_id: str
+    questions: List[Annotated[str, StringConstraints(min_length=1, strip_whitespace=True)]] = Field(..., min_length=1, max_length=100, description="The questions to be answered, at most 100, none of them blank")
+
+class BatchQueryItem(BaseModel):
+    """The answer to one question of a batch, or the error that prevented it."""
+    question: str
+    answer: Optional[str] = Field(None, description="The answer, absent if this question failed")
+    sources: List[SourceDocument] = Field(default_factory=list, description="List of sources used to generate the answer")
+    error: Optional[str] = Field(None, description="Why this question could not be answered")
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryItem] = Field(..., description="One result per question, in request order")
+
+class MetricsResponse(BaseModel):
+    """Runtime metrics of the service components."""
+    embedding: Optional[Dict[str, Any]] = Field(None, description="Embedding cache and micro-batching metrics")
+    jobs: Optional[Dict[str, Any]] = Field(None, description="Background job queue counters")
+    answers: Optional[Dict[str, Any]] = Field(None, description="Answer cache hit/miss counters")
+    semantic_answers: Optional[Dict[str, Any]] = Field(None, description="Semantic (paraphrase) answer cache hit/miss counters")
+    rerank: Optional[Dict[str, Any]] = Field(None, description="Cross-encoder score cache hit/miss counters")
+    hot_index: Optional[Dict[str, Any]] = Field(None, description="Per-document in-memory vector index counters and size")
+    vector_store: Optional[Dict[str, Any]] = Field(None, description="Vector store partitioning mode and open/closed partition counts")
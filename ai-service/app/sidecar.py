@@ -0,0 +1,56 @@
+"""
+The inference sidecar: one process that loads the embedding and reranking models and serves
+them to the API workers over a Unix socket (see app.core.sidecar).
+
+    INFERENCE_SIDECAR_SOCKET=/tmp/ai-service.sock python -m app.sidecar
+
+gunicorn.conf.py starts it before the workers; run it by hand only to serve several
+`uvicorn` processes, started with INFERENCE_SIDECAR=true and the same socket and authkey.
+"""
+import os
+import signal
+import threading
+
+from dotenv import load_dotenv
+
+from app.core.pipeline import load_cross_encoder
+from app.core.sidecar import SidecarServer
+from app.main import _env_bool, build_embedding_service, close_embedding_service
+
+
+def _warmup(server: SidecarServer) -> None:
+    try:
+        server.warmup()
+        print("Inference sidecar: models loaded and warmed up.")
+    except Exception as e:
+        print(f"Inference sidecar: warmup failed, models load on first use: {e}")
+
+
+def main() -> None:
+    load_dotenv()
+    address = os.getenv("INFERENCE_SIDECAR_SOCKET")
+    if not address:
+        raise SystemExit("INFERENCE_SIDECAR_SOCKET is not set.")
+    services = build_embedding_service()
+    embeddings, inference_scheduler = services[0], services[1]
+    server = SidecarServer(
+        address,
+        embedding_service=embeddings,
+        cross_encoder_loader=load_cross_encoder,
+        scheduler=inference_scheduler,
+        authkey=(os.getenv("INFERENCE_SIDECAR_AUTHKEY") or "").encode() or None,
+    )
+    stopping = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopping.set())
+    server.start()
+    if _env_bool("MODEL_WARMUP", True):
+        threading.Thread(target=_warmup, args=(server,), name="sidecar-warmup", daemon=True).start()
+    stopping.wait()
+    print("Inference sidecar shutting down...")
+    server.close()
+    close_embedding_service(*services)
+
+
+if __name__ == "__main__":
+    main()
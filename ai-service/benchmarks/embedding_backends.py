@@ -0,0 +1,61 @@
+"""
+Parity check and throughput benchmark for the embedding inference backends.
+
+Every candidate backend is compared against the fp32 'torch' backend on the same chunks.
+The script exits non-zero when a backend's minimum cosine similarity falls below --min-cosine,
+so it can gate a deployment's EMBEDDING_BACKEND choice.
+
+Run from the ai-service directory:
+    python -m benchmarks.embedding_backends path/to/a.pdf --backends torch-int8 onnx --min-cosine 0.99
+"""
+import argparse
+import sys
+import time
+
+from app.core.embedding_service import SUPPORTED_BACKENDS, EmbeddingService, embedding_parity
+from benchmarks.embedding_batching import DEFAULT_PDF, load_chunks
+
+
+def measure(service, texts, repeat):
+    service.embed_documents_array(texts[:4])  # warm up
+    best = float("inf")
+    vectors = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        vectors = service.embed_documents_array(texts)
+        best = min(best, time.perf_counter() - started)
+    return best, vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", default=[DEFAULT_PDF])
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    parser.add_argument("--backends", nargs="+", default=["torch-int8"], choices=[b for b in SUPPORTED_BACKENDS if b != "torch"])
+    parser.add_argument("--onnx-file", default=None, help="ONNX file inside the model repo for the 'onnx' backend")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = load_chunks(args.pdfs, chunk_size=1000, chunk_overlap=200)
+    print(f"{len(texts)} chunks from {len(args.pdfs)} PDF(s)")
+
+    reference_time, reference = measure(EmbeddingService(model_name=args.model), texts, args.repeat)
+    print(f"{'torch (fp32)':<14} {len(texts) / reference_time:8.1f} chunks/s  (reference)")
+
+    failed = False
+    for backend in args.backends:
+        service = EmbeddingService(model_name=args.model, backend=backend, onnx_file_name=args.onnx_file)
+        elapsed, vectors = measure(service, texts, args.repeat)
+        parity = embedding_parity(reference, vectors)
+        ok = parity["min_cosine"] >= args.min_cosine
+        failed = failed or not ok
+        print(
+            f"{backend:<14} {len(texts) / elapsed:8.1f} chunks/s  speedup {reference_time / elapsed:.2f}x  "
+            f"mean cos {parity['mean_cosine']:.5f}  min cos {parity['min_cosine']:.5f}  {'OK' if ok else 'FAIL'}"
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
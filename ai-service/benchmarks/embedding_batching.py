@@ -0,0 +1,75 @@
+"""
+Benchmark: document-order vs length-sorted batching in EmbeddingService.embed_documents.
+
+Run from the ai-service directory:
+    python -m benchmarks.embedding_batching path/to/a.pdf path/to/b.pdf --batch-size 16 --max-batch-tokens 8192
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from langchain_community.document_loaders import PyPDFLoader
+
+from app.core.embedding_service import EmbeddingService
+from app.core.text_splitter import TextSplitterService
+
+DEFAULT_PDF = os.path.join(os.path.dirname(__file__), "..", "app", "core", "dummy_docs", "report-001.pdf")
+
+
+def load_chunks(pdf_paths, chunk_size, chunk_overlap):
+    splitter = TextSplitterService(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    pages = [page for path in pdf_paths for page in PyPDFLoader(path).load()]
+    return [chunk.page_content for chunk in splitter.split_documents(pages)]
+
+
+def time_embedding(service, texts, repeat):
+    best = float("inf")
+    vectors = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        vectors = np.asarray(service.embed_documents(texts), dtype=np.float32)
+        best = min(best, time.perf_counter() - started)
+    return best, vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", default=[DEFAULT_PDF])
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-batch-tokens", type=int, default=8192)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = load_chunks(args.pdfs, args.chunk_size, args.chunk_overlap)
+    print(f"{len(texts)} chunks from {len(args.pdfs)} PDF(s)")
+
+    service = EmbeddingService(model_name=args.model)
+    service.embed_documents(texts[:4])  # warm up
+
+    # Baseline: slices of batch_size in document order, as the pipeline used to send them.
+    def document_order(batch):
+        return [v for i in range(0, len(batch), args.batch_size) for v in service._model_encode(batch[i:i + args.batch_size])]
+
+    baseline_time = float("inf")
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        baseline = np.asarray(document_order(texts), dtype=np.float32)
+        baseline_time = min(baseline_time, time.perf_counter() - started)
+
+    service.sort_by_length = True
+    service.encode_batch_size = args.batch_size
+    service.max_batch_tokens = args.max_batch_tokens
+    sorted_time, sorted_vectors = time_embedding(service, texts, args.repeat)
+
+    max_diff = float(np.max(np.abs(baseline - sorted_vectors))) if len(texts) else 0.0
+    print(f"document order : {baseline_time:.3f}s ({len(texts) / baseline_time:.1f} chunks/s)")
+    print(f"length sorted  : {sorted_time:.3f}s ({len(texts) / sorted_time:.1f} chunks/s)")
+    print(f"speedup        : {baseline_time / sorted_time:.2f}x, max |diff| = {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark: dense-only vs BM25-only vs hybrid (reciprocal rank fusion) retrieval.
+
+Indexes the given PDFs' chunks plus synthetic "catalogue" chunks, each naming a product
+code and a Thai sentence, into a temporary Chroma collection and LexicalIndex. Every
+query asks for one product code; the report shows per-path latency and how often the chunk
+with that code is in the top k, which is where dense retrieval alone struggles.
+
+Run from the ai-service directory:
+    python -m benchmarks.hybrid_retrieval path/to/a.pdf --products 500 --queries 200
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+
+from app.core.embedding_service import EmbeddingService
+from app.core.lexical_index import LexicalIndex
+from app.core.rank_fusion import reciprocal_rank_fusion
+from app.core.text_splitter import TextSplitterService
+from app.core.vector_store import VectorStoreService
+from benchmarks.embedding_batching import DEFAULT_PDF
+
+USER_ID = "bench-user"
+DOCUMENT_ID = "bench-document"
+THAI_SENTENCES = [
+    "สินค้ารุ่นนี้มีการรับประกันสองปีและจัดส่งภายในสามวันทำการ",
+    "กรุณาตรวจสอบรหัสสินค้าก่อนลงทะเบียนรับประกัน",
+    "ศูนย์บริการเปิดทุกวันจันทร์ถึงวันศุกร์",
+]
+
+
+def build_chunks(pdf_paths, products, seed):
+    rng = random.Random(seed)
+    pages = [page for path in pdf_paths for page in PyPDFLoader(path).load()]
+    chunks = TextSplitterService(chunk_size=1000, chunk_overlap=200).split_documents(pages)
+    codes = []
+    for i in range(products):
+        code = f"{rng.choice('ABCDEFGHKMNPRSTX')}{rng.choice('ABCDEFGHKMNPRSTX')}-{rng.randint(1000, 9999)}"
+        codes.append(code)
+        text = (
+            f"Catalogue entry {i}. Product {code} is a standard model. "
+            f"Warranty: {rng.randint(1, 5)} years. {rng.choice(THAI_SENTENCES)}"
+        )
+        chunks.append(Document(page_content=text, metadata={}))
+    ids = []
+    for i, chunk in enumerate(chunks):
+        chunk.metadata.update({"user_id": USER_ID, "document_id": DOCUMENT_ID, "file_id": "bench", "chunk_number": i})
+        ids.append(f"bench_chunk_{i}")
+    return chunks, ids, codes
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", default=[DEFAULT_PDF])
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    chunks, ids, codes = build_chunks(args.pdfs, args.products, args.seed)
+    print(f"{len(chunks)} chunks ({args.products} catalogue entries)")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        embeddings = EmbeddingService(model_name=args.model)
+        vector_store = VectorStoreService(embedding_function=embeddings, persist_directory=f"{workdir}/chroma", collection_name="bench")
+        lexical_index = LexicalIndex(path=f"{workdir}/lexical.sqlite3")
+
+        started = time.perf_counter()
+        vector_store.upsert_embeddings(chunks, ids, embeddings.embed_documents_array([chunk.page_content for chunk in chunks]))
+        dense_index_time = time.perf_counter() - started
+        started = time.perf_counter()
+        lexical_index.upsert(chunks, ids)
+        lexical_index_time = time.perf_counter() - started
+
+        search_filter = {"$and": [{"user_id": {"$eq": USER_ID}}, {"document_id": {"$eq": DOCUMENT_ID}}]}
+        retriever = vector_store.get_retriever(search_kwargs={"k": args.k, "filter": search_filter})
+        rng = random.Random(args.seed + 1)
+        first_catalogue_chunk = len(chunks) - args.products
+        timings = {"dense": [], "lexical": [], "hybrid": []}
+        found = {"dense": 0, "lexical": 0, "hybrid": 0}
+        for _ in range(args.queries):
+            product = rng.randrange(args.products)
+            target = ids[first_catalogue_chunk + product]
+            question = f"How long is the warranty of product {codes[product]}?"
+
+            started = time.perf_counter()
+            dense = retriever.invoke(question)
+            dense_time = time.perf_counter() - started
+            started = time.perf_counter()
+            lexical = lexical_index.search(question, USER_ID, DOCUMENT_ID, k=args.k)
+            lexical_time = time.perf_counter() - started
+            started = time.perf_counter()
+            hybrid = reciprocal_rank_fusion([dense, lexical], limit=args.k)
+            fusion_time = time.perf_counter() - started
+
+            # The hybrid path runs both searches, then fuses.
+            for name, docs, elapsed in (
+                ("dense", dense, dense_time),
+                ("lexical", lexical, lexical_time),
+                ("hybrid", hybrid, dense_time + lexical_time + fusion_time),
+            ):
+                timings[name].append(elapsed)
+                found[name] += any(doc.id == target for doc in docs)
+        lexical_index.close()
+
+    print(f"Index build: dense {dense_index_time:.2f}s (embedding included), lexical {lexical_index_time:.2f}s")
+    print(f"{'path':<8} {'p50 ms':>8} {'p95 ms':>8} {'hit@' + str(args.k):>8}")
+    for name in ("dense", "lexical", "hybrid"):
+        print(
+            f"{name:<8} {statistics.median(timings[name]) * 1000:8.2f} {percentile(timings[name], 0.95) * 1000:8.2f}"
+            f" {found[name] / args.queries:8.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark and parity check: span engine vs RecursiveCharacterTextSplitter in TextSplitterService.
+
+The reference corpus is the given PDFs plus a synthetic book (the same pages repeated to
+--book-pages pages, with Thai paragraphs mixed in). Chunk texts and metadata must match
+exactly, apart from the start_index/end_index the span engine adds; the script exits
+non-zero on any difference.
+
+Run from the ai-service directory:
+    python -m benchmarks.text_splitting path/to/a.pdf --chunk-size 1000 --chunk-overlap 200
+"""
+import argparse
+import sys
+import time
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+
+from app.core.text_splitter import TextSplitterService
+from benchmarks.embedding_batching import DEFAULT_PDF
+
+THAI_PARAGRAPH = "ระบบนี้ช่วยตอบคำถามจากเอกสารที่ผู้ใช้อัปโหลด โดยค้นหาข้อความที่เกี่ยวข้องแล้วสรุปคำตอบ\n"
+
+
+def build_corpus(pdf_paths, book_pages):
+    pages = [page for path in pdf_paths for page in PyPDFLoader(path).load()]
+    book = []
+    for i in range(book_pages):
+        page = pages[i % len(pages)]
+        text = page.page_content + "\n\n" + THAI_PARAGRAPH * (i % 5)
+        book.append(Document(page_content=text, metadata={**page.metadata, "page": i}))
+    return pages + book
+
+
+def time_split(service, documents, repeat):
+    best = float("inf")
+    chunks = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        chunks = service.split_documents(documents)
+        best = min(best, time.perf_counter() - started)
+    return best, chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", default=[DEFAULT_PDF])
+    parser.add_argument("--book-pages", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    documents = build_corpus(args.pdfs, args.book_pages)
+    characters = sum(len(doc.page_content) for doc in documents)
+    print(f"{len(documents)} pages, {characters / 1e6:.1f}M characters")
+
+    langchain_time, expected = time_split(
+        TextSplitterService(args.chunk_size, args.chunk_overlap, engine='langchain'), documents, args.repeat
+    )
+    span_time, actual = time_split(
+        TextSplitterService(args.chunk_size, args.chunk_overlap, engine='span'), documents, args.repeat
+    )
+
+    mismatches = 0
+    if len(actual) != len(expected):
+        print(f"Chunk count differs: {len(actual)} vs {len(expected)}")
+        mismatches += 1
+    for got, want in zip(actual, expected):
+        metadata = {k: v for k, v in got.metadata.items() if k not in ("start_index", "end_index")}
+        if got.page_content != want.page_content or metadata != want.metadata:
+            mismatches += 1
+
+    print(f"langchain: {langchain_time:.3f}s  span: {span_time:.3f}s  speedup {langchain_time / span_time:.2f}x")
+    print(f"{len(actual)} chunks, {mismatches} mismatch(es)")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
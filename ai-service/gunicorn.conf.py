@@ -0,0 +1,89 @@
+"""
+Multi-worker serving with one inference sidecar: gunicorn starts `python -m app.sidecar`,
+which loads the embedding and reranking models once, then WEB_CONCURRENCY uvicorn workers
+that hold no models and call the sidecar over a Unix socket, so N workers do not mean N
+copies of BGE-M3.
+
+    CHROMA_SERVER_HOST=chroma gunicorn -c gunicorn.conf.py app.main:app
+
+What the workers must share goes through shared services instead of per-process state:
+- the vector store is a Chroma server (CHROMA_SERVER_HOST/PORT), required with more than
+  one worker, since the embedded store in CHROMA_DB_PATH supports a single process;
+- the embedding cache and the inference scheduler live in the sidecar only;
+- job states are kept in the sidecar, so /jobs/{job_id} works on any worker;
+- each worker's answer, semantic, rerank and hot-index caches are invalidated through the
+  sidecar's document-change feed, polled every DOCUMENT_CHANGE_POLL_S seconds;
+- the lexical and sparse indexes are SQLite files in WAL mode, which several processes on
+  one host can read and write.
+The sidecar is restarted if it dies; workers reconnect on their next call.
+"""
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+# The workers load no models, so there is nothing to share by preloading.
+preload_app = False
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+
+if workers > 1 and not os.getenv("CHROMA_SERVER_HOST"):
+    raise RuntimeError("WEB_CONCURRENCY > 1 needs a Chroma server: set CHROMA_SERVER_HOST (and CHROMA_SERVER_PORT).")
+
+# How long gunicorn waits for the sidecar to bind its socket; loading models happens after.
+SIDECAR_START_TIMEOUT_S = float(os.getenv("INFERENCE_SIDECAR_START_TIMEOUT_S", "60"))
+
+_sidecar = None
+_stopping = threading.Event()
+
+
+def _start_sidecar():
+    global _sidecar
+    socket_path = os.environ["INFERENCE_SIDECAR_SOCKET"]
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    _sidecar = subprocess.Popen([sys.executable, "-m", "app.sidecar"])
+    deadline = time.monotonic() + SIDECAR_START_TIMEOUT_S
+    while not os.path.exists(socket_path):
+        if _sidecar.poll() is not None:
+            raise RuntimeError(f"The inference sidecar exited with code {_sidecar.returncode} on startup.")
+        if time.monotonic() > deadline:
+            _sidecar.kill()
+            raise RuntimeError(f"The inference sidecar did not open {socket_path} within {SIDECAR_START_TIMEOUT_S}s.")
+        time.sleep(0.1)
+
+
+def _watch_sidecar(server):
+    while not _stopping.wait(1):
+        if _sidecar.poll() is None:
+            continue
+        server.log.error(f"Inference sidecar exited with code {_sidecar.returncode}, restarting it.")
+        try:
+            _start_sidecar()
+        except RuntimeError as e:
+            server.log.error(str(e))
+
+
+def on_starting(server):
+    """Starts the sidecar before any worker, and hands its socket and authkey to the workers."""
+    os.environ["INFERENCE_SIDECAR"] = "true"
+    os.environ.setdefault("INFERENCE_SIDECAR_SOCKET", os.path.join(tempfile.mkdtemp(prefix="ai-service-"), "inference.sock"))
+    os.environ["INFERENCE_SIDECAR_AUTHKEY"] = secrets.token_hex(16)
+    _start_sidecar()
+    threading.Thread(target=_watch_sidecar, args=(server,), name="sidecar-watchdog", daemon=True).start()
+
+
+def on_exit(server):
+    _stopping.set()
+    if _sidecar is not None and _sidecar.poll() is None:
+        _sidecar.terminate()
+        try:
+            _sidecar.wait(timeout=graceful_timeout)
+        except subprocess.TimeoutExpired:
+            _sidecar.kill()
@@ -0,0 +1,104 @@
+import pytest
+
+from app.core.answer_cache import AnswerCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+## Test Cases ##
+
+def test_put_and_get_with_normalized_question(clock):
+    """Tests that questions differing only in case and whitespace share one entry."""
+    # ARRANGE
+    cache = AnswerCache(clock=clock)
+    key = cache.make_key("u1", "d1", "What is  the deadline?", ("gemini", 0.2))
+    generation = cache.generation("d1")
+
+    # ACT
+    stored = cache.put(key, "d1", {"answer": "Friday", "sources": []}, generation)
+    result = cache.get(cache.make_key("u1", "d1", "what is the DEADLINE? ", ("gemini", 0.2)))
+
+    # ASSERT
+    assert stored is True
+    assert result == {"answer": "Friday", "sources": []}
+    assert cache.stats()["hits"] == 1
+
+def test_settings_and_user_are_part_of_the_key(clock):
+    cache = AnswerCache(clock=clock)
+    cache.put(cache.make_key("u1", "d1", "q", ("gemini", 0.2)), "d1", {"answer": "a"}, 0)
+
+    assert cache.get(cache.make_key("u1", "d1", "q", ("gemini", 0.7))) is None
+    assert cache.get(cache.make_key("u2", "d1", "q", ("gemini", 0.2))) is None
+    assert cache.stats()["misses"] == 2
+
+def test_entries_expire_after_ttl(clock):
+    cache = AnswerCache(ttl_seconds=10, clock=clock)
+    key = cache.make_key("u1", "d1", "q")
+    cache.put(key, "d1", {"answer": "a"}, 0)
+
+    clock.now = 9.9
+    assert cache.get(key) is not None
+    clock.now = 10.0
+    assert cache.get(key) is None
+    assert cache.stats()["entries"] == 0
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = AnswerCache(max_entries=2, clock=clock)
+    first, second, third = (cache.make_key("u", "d", q) for q in ("one", "two", "three"))
+    cache.put(first, "d", "1", 0)
+    cache.put(second, "d", "2", 0)
+    cache.get(first)
+
+    cache.put(third, "d", "3", 0)
+
+    assert cache.get(second) is None
+    assert cache.get(first) == "1"
+    assert cache.get(third) == "3"
+
+def test_document_change_invalidates_only_that_document(clock):
+    """Tests that re-ingesting a document drops its answers and keeps others."""
+    # ARRANGE
+    cache = AnswerCache(clock=clock)
+    key_d1 = cache.make_key("u1", "d1", "q")
+    key_d2 = cache.make_key("u1", "d2", "q")
+    cache.put(key_d1, "d1", "a1", 0)
+    cache.put(key_d2, "d2", "a2", 0)
+
+    # ACT
+    cache.on_document_changed("u1", "d1")
+
+    # ASSERT
+    assert cache.get(key_d1) is None
+    assert cache.get(key_d2) == "a2"
+    assert cache.stats()["invalidations"] == 1
+
+def test_answer_computed_during_reingestion_is_not_cached(clock):
+    """Tests that an answer whose generation is outdated by an invalidation is dropped."""
+    cache = AnswerCache(clock=clock)
+    key = cache.make_key("u1", "d1", "q")
+    generation = cache.generation("d1")
+
+    cache.invalidate_document("d1")
+    stored = cache.put(key, "d1", "stale", generation)
+
+    assert stored is False
+    assert cache.get(key) is None
+
+def test_cached_values_are_copies(clock):
+    cache = AnswerCache(clock=clock)
+    key = cache.make_key("u1", "d1", "q")
+    cache.put(key, "d1", {"sources": []}, 0)
+
+    cache.get(key)["sources"].append("mutated")
+
+    assert cache.get(key) == {"sources": []}
@@ -1,6 +1,6 @@
 import pytest
 from langchain_core.documents import Document
-from app.core.document_loader import load_from_source
+from app.core.document_loader import load_from_source, lazy_load_from_source
 from langchain_community.document_loaders import PyPDFLoader, WebBaseLoader
 # Add this inside tests/test_loader.py
 
@@ -69,4 +69,22 @@ def test_load_from_source_unsupported_source_type():
     Tests that ValueError is raised for an unsupported source_type.
     """
     with pytest.raises(ValueError, match="Unsupported source type: ftp"):
-        load_from_source(source_type='ftp', source_location='ftp://example.com')
\ No newline at end of file
+        load_from_source(source_type='ftp', source_location='ftp://example.com')
+
+
+def test_lazy_load_from_source_yields_pages(mocker):
+    """
+    Tests that lazy_load_from_source streams pages from the loader's lazy_load.
+    """
+    # ARRANGE
+    fake_pages = [Document(page_content="page 1"), Document(page_content="page 2")]
+    mock_loader = mocker.patch('app.core.document_loader.WebBaseLoader')
+    mock_loader.return_value.lazy_load.return_value = iter(fake_pages)
+
+    # ACT
+    pages = lazy_load_from_source(source_type='url', source_location='http://example.com')
+
+    # ASSERT: nothing is loaded until the generator is consumed
+    mock_loader.assert_not_called()
+    assert list(pages) == fake_pages
+    mock_loader.return_value.load.assert_not_called()
@@ -0,0 +1,148 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from app.core.document_vector_cache import DocumentVectorCache
+
+
+def _loader(vectors, calls=None):
+    def load():
+        if calls is not None:
+            calls.append(1)
+        documents = [Document(id=f"c{i}", page_content=f"t{i}") for i in range(len(vectors))]
+        return documents, np.array(vectors, dtype=np.float32)
+    return load
+
+## Test Cases ##
+
+def test_search_returns_exact_top_k_and_loads_once():
+    """Tests that a document is loaded on its first query and then ranked by dot product from memory."""
+    # ARRANGE
+    cache = DocumentVectorCache()
+    calls = []
+    loader = _loader([[1.0, 0.0], [0.0, 1.0], [0.6, 0.8]], calls)
+
+    # ACT
+    first = cache.search("u1", "d1", np.array([0.0, 1.0]), 2, loader)
+    second = cache.search("u1", "d1", np.array([1.0, 0.0]), 5, loader)
+
+    # ASSERT
+    assert [doc.id for doc in first] == ["c1", "c2"]
+    assert [doc.id for doc in second] == ["c0", "c2", "c1"]
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["loads"], stats["documents"]) == (1, 1, 1, 1)
+
+def test_least_recently_used_document_is_evicted_by_bytes():
+    # Each document: 2 x 2 float32 (16 bytes) + 4 characters of text = 20 bytes
+    cache = DocumentVectorCache(max_bytes=40)
+    query = np.array([1.0, 0.0])
+    vectors = [[1.0, 0.0], [0.0, 1.0]]
+    cache.search("u1", "d1", query, 1, _loader(vectors))
+    cache.search("u1", "d2", query, 1, _loader(vectors))
+    cache.search("u1", "d1", query, 1, _loader(vectors))
+
+    cache.search("u1", "d3", query, 1, _loader(vectors))
+
+    calls = []
+    cache.search("u1", "d1", query, 1, _loader(vectors, calls))
+    assert calls == []
+    cache.search("u1", "d2", query, 1, _loader(vectors, calls))
+    assert calls == [1]
+    assert cache.stats()["evictions"] == 2
+    assert cache.stats()["bytes"] <= 40
+
+def test_document_larger_than_budget_is_not_retried():
+    """Tests that an oversized document falls back to the vector store without reloading every query."""
+    # ARRANGE
+    cache = DocumentVectorCache(max_bytes=8)
+    calls = []
+    loader = _loader([[1.0, 0.0], [0.0, 1.0]], calls)
+
+    # ACT
+    first = cache.search("u1", "d1", np.array([1.0, 0.0]), 1, loader)
+    second = cache.search("u1", "d1", np.array([1.0, 0.0]), 1, loader)
+
+    # ASSERT
+    assert first is None and second is None
+    assert len(calls) == 1
+    assert cache.stats()["documents"] == 0
+
+def test_empty_document_is_not_cached():
+    cache = DocumentVectorCache()
+
+    result = cache.search("u1", "d1", np.array([1.0, 0.0]), 3, _loader([]))
+
+    assert result is None
+    assert cache.stats()["documents"] == 0
+
+def test_changed_document_is_reloaded():
+    """Tests that a document listener event drops the document for every user and clears its too-large mark."""
+    # ARRANGE
+    cache = DocumentVectorCache()
+    query = np.array([1.0, 0.0])
+    cache.search("u1", "d1", query, 1, _loader([[1.0, 0.0]]))
+    cache.search("u1", "d2", query, 1, _loader([[1.0, 0.0]]))
+
+    # ACT
+    cache.on_document_changed("u1", "d1")
+    calls = []
+    result = cache.search("u1", "d1", query, 1, _loader([[0.0, 1.0], [1.0, 0.0]], calls))
+
+    # ASSERT
+    assert [doc.id for doc in result] == ["c1"]
+    assert calls == [1]
+    assert cache.stats()["documents"] == 2
+
+def test_load_racing_a_change_is_used_once_but_not_kept():
+    cache = DocumentVectorCache()
+
+    def stale_loader():
+        # The document is re-ingested while its old chunks are being read.
+        cache.invalidate_document("d1")
+        return _loader([[1.0, 0.0]])()
+
+    result = cache.search("u1", "d1", np.array([1.0, 0.0]), 1, stale_loader)
+
+    assert [doc.id for doc in result] == ["c0"]
+    assert cache.stats()["documents"] == 0
+
+def test_document_changed_in_another_process_is_not_served():
+    """Tests that an entry whose stored version changed is reloaded instead of answered from old vectors."""
+    # ARRANGE
+    now = [0.0]
+    cache = DocumentVectorCache(revalidate_seconds=10, clock=lambda: now[0])
+    query = np.array([1.0, 0.0])
+    store_version = ["v1"]
+    version_calls = []
+    def version():
+        version_calls.append(1)
+        return store_version[0]
+    cache.search("u1", "d1", query, 1, _loader([[1.0, 0.0]]), version)
+
+    # ACT: re-ingested elsewhere; no listener fired in this process
+    store_version[0] = "v2"
+    now[0] = 5.0
+    within_interval = cache.search("u1", "d1", query, 1, _loader([[0.0, 1.0], [1.0, 0.0]]), version)
+    now[0] = 11.0
+    calls = []
+    after_interval = cache.search("u1", "d1", query, 1, _loader([[0.0, 1.0], [1.0, 0.0]], calls), version)
+
+    # ASSERT
+    assert [doc.id for doc in within_interval] == ["c0"]
+    assert [doc.id for doc in after_interval] == ["c1"]
+    assert calls == [1]
+    assert cache.stats()["stale"] == 1
+
+def test_unchanged_document_is_revalidated_without_reloading():
+    now = [0.0]
+    cache = DocumentVectorCache(revalidate_seconds=10, clock=lambda: now[0])
+    calls = []
+    loader = _loader([[1.0, 0.0]], calls)
+    cache.search("u1", "d1", np.array([1.0, 0.0]), 1, loader, lambda: "v1")
+
+    now[0] = 20.0
+    cache.search("u1", "d1", np.array([1.0, 0.0]), 1, loader, lambda: "v1")
+
+    assert calls == [1]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["stale"] == 0
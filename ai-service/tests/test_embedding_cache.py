@@ -0,0 +1,97 @@
+import numpy as np
+
+from app.core.embedding_cache import EmbeddingCache
+
+## Test Cases ##
+
+def test_put_and_get_round_trip(tmp_path):
+    """Tests that stored vectors come back as float32 and misses return None."""
+    # ARRANGE
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"))
+    vectors = np.array([[0.1, 0.2], [0.3, 0.4]], dtype=np.float32)
+
+    # ACT
+    cache.put_many("model-a", ["hello", "world"], vectors)
+    result = cache.get_many("model-a", ["world", "unknown", "hello"])
+
+    # ASSERT
+    np.testing.assert_array_equal(result[0], vectors[1])
+    assert result[1] is None
+    np.testing.assert_array_equal(result[2], vectors[0])
+    assert result[0].dtype == np.float32
+    assert cache.stats() == {"hits": 2, "misses": 1}
+
+def test_keys_are_normalized_and_scoped_by_model(tmp_path):
+    """Tests that whitespace differences hit the same entry but other models do not."""
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"))
+    cache.put_many("model-a", ["Legal  footer\n text"], np.ones((1, 3), dtype=np.float32))
+
+    assert cache.get_many("model-a", ["Legal footer text"])[0] is not None
+    assert cache.get_many("model-b", ["Legal footer text"])[0] is None
+
+def test_cache_persists_across_instances(tmp_path):
+    """Tests that entries survive reopening the cache file."""
+    path = str(tmp_path / "cache.sqlite3")
+    first = EmbeddingCache(path=path)
+    first.put_many("model-a", ["persisted"], np.ones((1, 2), dtype=np.float32))
+    first.close()
+
+    second = EmbeddingCache(path=path)
+
+    assert second.get_many("model-a", ["persisted"])[0] is not None
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    """Tests that size-based eviction drops the least recently used entries first."""
+    # ARRANGE: each 256-dim float32 vector is 1 KiB, the budget is ~2.5 KiB
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"), max_size_mb=2.5 / 1024)
+    vector = np.ones((1, 256), dtype=np.float32)
+    cache.put_many("m", ["old"], vector)
+    cache.put_many("m", ["recent"], vector)
+    cache.get_many("m", ["old"])  # touch "old" so "recent" becomes the LRU entry
+
+    # ACT
+    cache.put_many("m", ["new"], vector)
+
+    # ASSERT
+    assert cache.get_many("m", ["recent"])[0] is None
+    assert cache.get_many("m", ["old"])[0] is not None
+    assert cache.get_many("m", ["new"])[0] is not None
+
+def test_size_is_tracked_without_scanning_the_table(tmp_path):
+    """Tests that puts keep a running byte total (replacements included) instead of summing the table each time."""
+    # ARRANGE: each 256-dim float32 vector is 1 KiB, the budget is ~2.5 KiB
+    path = str(tmp_path / "cache.sqlite3")
+    first = EmbeddingCache(path=path, max_size_mb=2.5 / 1024)
+    vector = np.ones((1, 256), dtype=np.float32)
+    first.put_many("m", ["a"], vector)
+    first.close()
+    cache = EmbeddingCache(path=path, max_size_mb=2.5 / 1024)
+    statements = []
+    cache._connection().set_trace_callback(statements.append)
+
+    # ACT: rewriting "a" and "b" must not count twice, so nothing is evicted
+    cache.put_many("m", ["b"], vector)
+    cache.put_many("m", ["a", "b"], np.ones((2, 256), dtype=np.float32))
+    cache.put_many("m", ["b"], vector)
+
+    # ASSERT
+    assert cache._total_bytes == 2048
+    assert cache.get_many("m", ["a"])[0] is not None
+    assert "SELECT COALESCE(SUM(size), 0) FROM embeddings" not in statements
+
+def test_sparse_weights_round_trip_separately_from_vectors(tmp_path):
+    """Tests that sparse weights are cached under their own keys next to the dense vectors."""
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"))
+    cache.put_many("m", ["text"], np.ones((1, 2), dtype=np.float32))
+
+    cache.put_many_sparse("m", ["text", "empty"], [{7: 0.5, 250001: 1.25}, {}])
+
+    assert cache.get_many_sparse("m", ["text", "empty", "unknown"]) == [{7: 0.5, 250001: 1.25}, {}, None]
+    np.testing.assert_array_equal(cache.get_many("m", ["text"])[0], [1.0, 1.0])
+    assert cache.stats() == {"hits": 1, "misses": 0}
+
+def test_constructor_does_not_touch_disk(tmp_path):
+    """Tests that the SQLite file is only created on first use."""
+    path = tmp_path / "cache.sqlite3"
+    EmbeddingCache(path=str(path))
+    assert not path.exists()
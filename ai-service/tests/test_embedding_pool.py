@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+from app.core import embedding_pool
+from app.core.embedding_pool import EmbeddingPool
+
+
+class InlineExecutor:
+    """Stands in for the process pool and runs each shard in the test process."""
+
+    def __init__(self, *args, **kwargs):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, **kwargs):
+        pass
+
+
+@pytest.fixture
+def fake_worker_model(mocker):
+    """Worker model that encodes each text as [len(text), len(text)]."""
+    model = mocker.MagicMock()
+    model.encode.side_effect = lambda texts, **kwargs: np.array([[len(t), len(t)] for t in texts], dtype=np.float32)
+    mocker.patch.object(embedding_pool, '_worker_model', model)
+    return model
+
+## Test Cases ##
+
+def test_encode_shard_writes_rows_into_shared_memory(fake_worker_model):
+    """Tests that a worker writes its shard at the right offset of the shared array."""
+    # ARRANGE
+    shm = shared_memory.SharedMemory(create=True, size=4 * 2 * 4)
+    try:
+        output = np.ndarray((4, 2), dtype=np.float32, buffer=shm.buf)
+        output[:] = 0
+
+        # ACT
+        written = embedding_pool._encode_shard(["aa", "bbb"], shm.name, 1, 4, 2, 8)
+
+        # ASSERT
+        assert written == 2
+        assert output.tolist() == [[0, 0], [2, 2], [3, 3], [0, 0]]
+        fake_worker_model.encode.assert_called_once_with(["aa", "bbb"], normalize_embeddings=True, batch_size=8)
+        del output
+    finally:
+        shm.close()
+        shm.unlink()
+
+def test_encode_shards_across_workers_in_order(mocker, fake_worker_model):
+    """Tests that a request is split into one shard per worker and reassembled in order."""
+    # ARRANGE
+    mocker.patch('app.core.embedding_pool.ProcessPoolExecutor', InlineExecutor)
+    pool = EmbeddingPool(model_name='fake-model', num_workers=2)
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+
+    # ACT
+    result = pool.encode(texts, dimension=2)
+
+    # ASSERT
+    assert result.dtype == np.float32
+    assert result[:, 0].tolist() == [1, 2, 3, 4, 5]
+    assert [args[0] for args in pool._executor.submitted] == [["a", "bb", "ccc"], ["dddd", "eeeee"]]
+    assert pool.stats() == {"workers": 2, "requests": 1, "items": 5}
+
+def test_invalid_worker_count():
+    with pytest.raises(ValueError):
+        EmbeddingPool(num_workers=0)
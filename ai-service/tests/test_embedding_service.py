@@ -2,7 +2,7 @@ import pytest
 import numpy as np
 
 # Replace with the actual path to your EmbeddingService class
-from app.core.embedding_service import EmbeddingService
+from app.core.embedding_service import EmbeddingService, embedding_parity
 
 # A reusable fixture to create a mocked service for our tests
 @pytest.fixture
@@ -34,6 +34,60 @@ def test_initialization(mocker):
     # ASSERT: Check that the model was initialized with the correct name
     mock_transformer_class.assert_called_once_with('BAAI/bge-m3')
 
+def test_lazy_load_defers_model_until_warmup(mocker):
+    """Tests that a lazily loaded service builds the model only on load/warmup, once."""
+    # ARRANGE
+    mock_transformer_class = mocker.patch('app.core.embedding_service.SentenceTransformer')
+
+    # ACT
+    service = EmbeddingService(model_name='BAAI/bge-m3', lazy_load=True)
+    mock_transformer_class.assert_not_called()
+    service.warmup()
+    service.load()
+
+    # ASSERT
+    mock_transformer_class.assert_called_once_with('BAAI/bge-m3')
+    service.model.encode.assert_called_once_with(["warmup"], normalize_embeddings=True)
+
+def test_initialization_with_int8_backend(mocker):
+    """Tests that the torch-int8 backend dynamically quantizes the same model."""
+    # ARRANGE
+    mock_transformer_class = mocker.patch('app.core.embedding_service.SentenceTransformer')
+    mock_quantize = mocker.patch('torch.ao.quantization.quantize_dynamic')
+
+    # ACT
+    service = EmbeddingService(model_name='BAAI/bge-m3', backend='torch-int8')
+
+    # ASSERT
+    mock_transformer_class.assert_called_once_with('BAAI/bge-m3', device='cpu')
+    mock_quantize.assert_called_once()
+    assert service.model is mock_quantize.return_value
+
+def test_initialization_with_onnx_backend(mocker):
+    """Tests that the onnx backend keeps the model name and forwards the ONNX file."""
+    mock_transformer_class = mocker.patch('app.core.embedding_service.SentenceTransformer')
+
+    EmbeddingService(model_name='BAAI/bge-m3', backend='onnx', onnx_file_name='onnx/model.onnx')
+
+    mock_transformer_class.assert_called_once_with(
+        'BAAI/bge-m3', backend='onnx', model_kwargs={"file_name": 'onnx/model.onnx'}
+    )
+
+def test_initialization_with_unknown_backend(mocker):
+    mocker.patch('app.core.embedding_service.SentenceTransformer')
+    with pytest.raises(ValueError, match="Unsupported embedding backend"):
+        EmbeddingService(backend='tpu')
+
+def test_embedding_parity():
+    """Tests the cosine-similarity parity check between two sets of vectors."""
+    reference = np.array([[1.0, 0.0], [0.0, 1.0]])
+    candidate = np.array([[1.0, 0.0], [1.0, 1.0]])
+
+    result = embedding_parity(reference, candidate)
+
+    assert result["min_cosine"] == pytest.approx(np.sqrt(0.5))
+    assert result["mean_cosine"] == pytest.approx((1 + np.sqrt(0.5)) / 2)
+
 def test_embed_documents(mocked_embedding_service):
     """Tests embedding a list of documents."""
     # ARRANGE
@@ -60,6 +114,99 @@ def test_embed_documents_empty_list(mocked_embedding_service):
     service.model.encode.assert_not_called()
     assert result == []
 
+def test_embed_documents_uses_cache_for_hits(mocker):
+    """Tests that cached chunks bypass model.encode and only misses are encoded."""
+    # ARRANGE
+    mocker.patch('app.core.embedding_service.SentenceTransformer')
+    mock_cache = mocker.MagicMock()
+    mock_cache.get_many.return_value = [np.array([0.1, 0.2], dtype=np.float32), None]
+    service = EmbeddingService(cache=mock_cache)
+    service.model.encode.return_value = np.array([[0.3, 0.4]])
+
+    # ACT
+    result = service.embed_documents(["cached chunk", "new chunk"])
+
+    # ASSERT
+    service.model.encode.assert_called_once_with(["new chunk"], normalize_embeddings=True)
+    mock_cache.put_many.assert_called_once()
+    assert mock_cache.put_many.call_args.args[1] == ["new chunk"]
+    np.testing.assert_allclose(result, [[0.1, 0.2], [0.3, 0.4]], rtol=1e-6)
+
+def test_embed_documents_all_cached_skips_model(mocker):
+    """Tests that a fully cached batch never calls the model."""
+    mocker.patch('app.core.embedding_service.SentenceTransformer')
+    mock_cache = mocker.MagicMock()
+    mock_cache.get_many.return_value = [np.array([0.5, 0.5], dtype=np.float32)]
+    service = EmbeddingService(cache=mock_cache)
+
+    service.embed_documents(["boilerplate"])
+
+    service.model.encode.assert_not_called()
+
+def test_backends_do_not_share_cached_vectors(mocker, tmp_path):
+    """Tests that vectors cached by the int8 or ONNX backend are not served to the fp32 backend."""
+    # ARRANGE
+    from app.core.embedding_cache import EmbeddingCache
+    mock_transformer_class = mocker.patch('app.core.embedding_service.SentenceTransformer')
+    mocker.patch('torch.ao.quantization.quantize_dynamic', side_effect=lambda model, *args, **kwargs: model)
+    mock_transformer_class.return_value.encode.side_effect = lambda texts, **kwargs: np.ones((len(texts), 2), dtype=np.float32)
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"))
+    services = [
+        EmbeddingService(model_name='BAAI/bge-m3', cache=cache),
+        EmbeddingService(model_name='BAAI/bge-m3', backend='torch-int8', cache=cache),
+        EmbeddingService(model_name='BAAI/bge-m3', backend='onnx', cache=cache),
+        EmbeddingService(model_name='BAAI/bge-m3', backend='onnx', onnx_file_name='onnx/model_qint8_avx512.onnx', cache=cache),
+    ]
+
+    # ACT
+    for service in services:
+        service.embed_documents_array(["same chunk"])
+
+    # ASSERT: every backend missed once and encoded its own vector
+    assert len({service.cache_namespace for service in services}) == 4
+    assert services[0].cache_namespace == 'BAAI/bge-m3'
+    assert mock_transformer_class.return_value.encode.call_count == 4
+    assert cache.misses == 4
+
+def test_embed_documents_array_returns_contiguous_float32(mocked_embedding_service):
+    """Tests that the array API returns the model output as a contiguous float32 matrix."""
+    # ARRANGE
+    service = mocked_embedding_service
+    fake_embeddings = np.array([[0.1, 0.2], [0.3, 0.4]], dtype=np.float32)
+    service.model.encode.return_value = fake_embeddings
+
+    # ACT
+    result = service.embed_documents_array(["hello world", "this is a test"])
+
+    # ASSERT
+    assert isinstance(result, np.ndarray)
+    assert result.dtype == np.float32
+    assert result.flags['C_CONTIGUOUS']
+    # float32 model output is passed through without a copy
+    assert result is fake_embeddings
+
+def test_embed_query_array(mocked_embedding_service):
+    """Tests that a query is returned as a float32 vector."""
+    service = mocked_embedding_service
+    service.model.encode.return_value = np.array([0.5, 0.6, 0.7], dtype=np.float32)
+
+    result = service.embed_query_array("what is the meaning of life?")
+
+    assert result.dtype == np.float32
+    assert result.shape == (3,)
+
+def test_embed_queries_array_uses_one_encode_call(mocked_embedding_service):
+    """Tests that a batch of questions is embedded in a single model call, in order."""
+    service = mocked_embedding_service
+    service.model.encode.return_value = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float64)
+
+    result = service.embed_queries_array(["first?", "second?"])
+
+    service.model.encode.assert_called_once()
+    assert service.model.encode.call_args.args[0] == ["first?", "second?"]
+    assert result.dtype == np.float32
+    assert result.shape == (2, 2)
+
 def test_embed_query(mocked_embedding_service):
     """Tests embedding a single query."""
     # ARRANGE
@@ -75,6 +222,193 @@ def test_embed_query(mocked_embedding_service):
     service.model.encode.assert_called_once_with(test_query, normalize_embeddings=True)
     assert result == fake_embedding.tolist()
 
+def test_embed_query_uses_micro_batcher(mocker):
+    """Tests that queries are encoded as a one-item batch when a batching window is set."""
+    # ARRANGE
+    mocker.patch('app.core.embedding_service.SentenceTransformer')
+    service = EmbeddingService(batch_window_ms=1)
+    service.model.encode.return_value = np.array([[0.5, 0.6]])
+
+    # ACT
+    result = service.embed_query("hello")
+
+    # ASSERT
+    service.model.encode.assert_called_once_with(["hello"], normalize_embeddings=True)
+    assert result == [0.5, 0.6]
+    assert service.stats()["batcher"]["batches"] == 1
+    service.close()
+
+def test_embed_documents_runs_bulk_slices_on_scheduler(mocker):
+    """Tests that ingestion batches are split into bulk-priority slices on the scheduler."""
+    # ARRANGE
+    from app.core.inference_scheduler import Priority
+    mocker.patch('app.core.embedding_service.SentenceTransformer')
+    mock_scheduler = mocker.MagicMock()
+    mock_scheduler.run.side_effect = lambda fn, texts, priority: np.ones((len(texts), 2))
+    service = EmbeddingService(scheduler=mock_scheduler, bulk_slice_size=2)
+
+    # ACT
+    result = service.embed_documents(["a", "b", "c"])
+
+    # ASSERT
+    assert [call.args[1] for call in mock_scheduler.run.call_args_list] == [["a", "b"], ["c"]]
+    assert all(call.kwargs["priority"] == Priority.BULK for call in mock_scheduler.run.call_args_list)
+    assert len(result) == 3
+
+def test_embed_documents_uses_process_pool_for_large_requests(mocker):
+    """Tests that bulk requests above the pool threshold are sharded across worker processes."""
+    # ARRANGE
+    mocker.patch('app.core.embedding_service.SentenceTransformer')
+    mock_pool = mocker.MagicMock(min_texts=3)
+    mock_pool.encode.return_value = np.ones((3, 4), dtype=np.float32)
+    service = EmbeddingService(pool=mock_pool)
+    service.model.get_sentence_embedding_dimension.return_value = 4
+
+    # ACT
+    result = service.embed_documents_array(["a", "b", "c"])
+    service.embed_documents_array(["small"])
+
+    # ASSERT: only the large request goes to the pool
+    mock_pool.encode.assert_called_once_with(["a", "b", "c"], 4)
+    assert result.shape == (3, 4)
+    service.model.encode.assert_called_once()
+
+def test_length_sorted_batches_respect_size_and_token_budget(mocker):
+    """Tests that texts are grouped longest-first within the batch size and token budget."""
+    # ARRANGE: no tokenizer on the mock, so character length is used
+    mocker.patch('app.core.embedding_service.SentenceTransformer')
+    service = EmbeddingService(sort_by_length=True, encode_batch_size=2, max_batch_tokens=10)
+    service.model.tokenizer = None
+    service.model.max_seq_length = 512
+    texts = ["aaaa", "a", "aaaaaaaa", "aa", "aaa"]
+
+    # ACT
+    batches = service._length_sorted_batches(texts)
+
+    # ASSERT: 8 chars alone (2 x 8 > 10), then pairs of similar length
+    assert batches == [[2], [0, 4], [3, 1]]
+
+def test_embed_documents_sorted_batches_keep_original_order(mocker):
+    """Tests that length-sorted encoding returns vectors in the caller's order."""
+    # ARRANGE
+    mocker.patch('app.core.embedding_service.SentenceTransformer')
+    service = EmbeddingService(sort_by_length=True, encode_batch_size=2)
+    service.model.tokenizer = None
+    service.model.max_seq_length = 512
+    service.model.encode.side_effect = lambda texts, **kwargs: np.array([[len(t), 0.0] for t in texts])
+
+    # ACT
+    result = service.embed_documents(["bb", "a", "dddd", "ccc"])
+
+    # ASSERT
+    assert [row[0] for row in result] == [2, 1, 4, 3]
+    assert [len(call.args[0]) for call in service.model.encode.call_args_list] == [2, 2]
+    assert service.model.encode.call_args_list[0].args[0] == ["dddd", "ccc"]
+
+def test_embed_documents_with_sparse_uses_one_forward_pass(mocker):
+    """Tests that dense vectors and BGE-M3 sparse weights come from the same encode call."""
+    # ARRANGE
+    import torch
+    mock_transformer_class = mocker.patch('app.core.embedding_service.SentenceTransformer')
+    model = mock_transformer_class.return_value
+    model.tokenizer.all_special_ids = [0, 2]
+    # Token states are 2-d; the fake sparse head weights a token by its first dimension.
+    model.encode.return_value = [
+        {
+            "input_ids": torch.tensor([0, 7, 9, 7, 2, 1]),
+            "attention_mask": torch.tensor([1, 1, 1, 1, 1, 0]),
+            "token_embeddings": torch.tensor([[5.0, 0], [0.25, 0], [-1.0, 0], [0.5, 0], [5.0, 0], [9.0, 0]]),
+            "sentence_embedding": torch.tensor([0.6, 0.8]),
+        },
+    ]
+    sparse_head = torch.nn.Linear(2, 1)
+    with torch.no_grad():
+        sparse_head.weight.copy_(torch.tensor([[1.0, 0.0]]))
+        sparse_head.bias.zero_()
+    mock_load_head = mocker.patch('app.core.embedding_service.load_sparse_linear', return_value=sparse_head)
+    service = EmbeddingService(model_name='BAAI/bge-m3', sparse=True)
+
+    # ACT
+    dense, weights = service.embed_documents_with_sparse(["text"])
+
+    # ASSERT: special tokens, padding and non-positive weights are dropped; repeats keep their maximum
+    mock_load_head.assert_called_once_with('BAAI/bge-m3')
+    assert model.encode.call_count == 1
+    assert model.encode.call_args.kwargs["output_value"] is None
+    np.testing.assert_allclose(dense, [[0.6, 0.8]])
+    assert dense.dtype == np.float32
+    assert weights == [{7: 0.5}]
+
+def test_sparse_encode_normalizes_dense_vectors(mocker):
+    """Tests that the dense rows of a sparse encode are unit length even if the model does not normalize them."""
+    # ARRANGE
+    import torch
+    mock_transformer_class = mocker.patch('app.core.embedding_service.SentenceTransformer')
+    model = mock_transformer_class.return_value
+    model.tokenizer.all_special_ids = []
+    model.encode.return_value = [
+        {
+            "input_ids": torch.tensor([5]),
+            "attention_mask": torch.tensor([1]),
+            "token_embeddings": torch.tensor([[1.0, 0.0]]),
+            "sentence_embedding": torch.tensor(vector),
+        }
+        for vector in ([3.0, 4.0], [0.0, 2.0])
+    ]
+    mocker.patch('app.core.embedding_service.load_sparse_linear', return_value=torch.nn.Linear(2, 1))
+    service = EmbeddingService(model_name='BAAI/bge-m3', sparse=True)
+
+    # ACT
+    dense, _ = service.embed_queries_with_sparse(["a", "b"])
+
+    # ASSERT
+    np.testing.assert_allclose(np.linalg.norm(dense, axis=1), [1.0, 1.0], rtol=1e-6)
+    np.testing.assert_allclose(dense, [[0.6, 0.8], [0.0, 1.0]], rtol=1e-6)
+
+def test_reingesting_with_sparse_serves_both_outputs_from_the_cache(mocker, tmp_path):
+    """Tests that a second sparse ingest of the same text never calls the model."""
+    # ARRANGE
+    import torch
+    from app.core.embedding_cache import EmbeddingCache
+    mock_transformer_class = mocker.patch('app.core.embedding_service.SentenceTransformer')
+    model = mock_transformer_class.return_value
+    model.tokenizer.all_special_ids = []
+    model.encode.side_effect = lambda texts, **kwargs: [
+        {
+            "input_ids": torch.tensor([7]),
+            "attention_mask": torch.tensor([1]),
+            "token_embeddings": torch.tensor([[0.5, 0.0]]),
+            "sentence_embedding": torch.tensor([0.6, 0.8]),
+        }
+        for _ in texts
+    ]
+    sparse_head = torch.nn.Linear(2, 1)
+    with torch.no_grad():
+        sparse_head.weight.copy_(torch.tensor([[1.0, 0.0]]))
+        sparse_head.bias.zero_()
+    mocker.patch('app.core.embedding_service.load_sparse_linear', return_value=sparse_head)
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"))
+    service = EmbeddingService(model_name='BAAI/bge-m3', sparse=True, cache=cache)
+    first_dense, first_weights = service.embed_documents_with_sparse(["legal footer", "page one"])
+
+    # ACT
+    second_dense, second_weights = service.embed_documents_with_sparse(["page one", "legal footer"])
+
+    # ASSERT
+    assert model.encode.call_count == 1
+    np.testing.assert_allclose(second_dense, first_dense[[1, 0]])
+    assert second_dense.dtype == np.float32
+    assert second_weights == [first_weights[1], first_weights[0]] == [{7: 0.5}, {7: 0.5}]
+
+def test_sparse_methods_require_sparse_mode(mocker):
+    mocker.patch('app.core.embedding_service.SentenceTransformer')
+    service = EmbeddingService()
+
+    with pytest.raises(ValueError):
+        service.embed_query_with_sparse("question")
+    with pytest.raises(ValueError):
+        service.embed_queries_with_sparse(["question"])
+
 def test_embed_image_success(mocker, mocked_embedding_service):
     """Tests successful embedding of an image."""
     # ARRANGE
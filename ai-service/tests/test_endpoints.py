@@ -1,9 +1,12 @@
+import asyncio
+import threading
 import pytest
 import httpx
 from unittest.mock import AsyncMock, MagicMock
 
 # Import the app AND the lifespan function from your main file
 from app.main import app, lifespan
+from app.core.job_queue import JobQueueFullError
 
 @pytest.mark.asyncio
 class TestApiEndpoints:
@@ -18,6 +21,71 @@ class TestApiEndpoints:
         assert response.status_code == 200
         assert response.json()["status"] == "ok"
 
+    async def test_readiness_reports_model_loading(self, mocker):
+        """Tests that /ready is 503 until the models are warm, while /health stays 200."""
+        # ARRANGE
+        mocker.patch('app.main.load_dotenv')
+        mocker.patch('app.main.os.getenv', side_effect=lambda name, default=None: 'fake_api_key' if name == "GOOGLE_API_KEY" else default)
+        mock_embedding = mocker.patch('app.main.EmbeddingService')
+        mocker.patch('app.main.TextSplitterService')
+        mocker.patch('app.main.VectorStoreService')
+        mocker.patch('app.main.ProcessingPipeline')
+        mocker.patch('app.main.RagPipeline')
+        mocker.patch('app.main.ChatGoogleGenerativeAI')
+        # Hold the embedding warmup until the test releases it.
+        model_loaded = threading.Event()
+        mock_embedding.return_value.warmup.side_effect = lambda: model_loaded.wait(5)
+
+        async with lifespan(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                # ACT
+                loading = await client.get("/api/v1/ready")
+                health = await client.get("/api/v1/health")
+                model_loaded.set()
+                for _ in range(50):
+                    if app.state.readiness.is_ready:
+                        break
+                    await asyncio.sleep(0.01)
+                ready = await client.get("/api/v1/ready")
+
+        # ASSERT
+        assert loading.status_code == 503
+        assert loading.json()["status"] == "loading"
+        assert health.status_code == 200
+        assert ready.status_code == 200
+        assert ready.json()["components"] == {"embedding_model": "ready", "cross_encoder": "ready"}
+        app.state.embedding_service.warmup.assert_called_once()
+        app.state.rag_pipeline.warmup.assert_called_once()
+
+    async def test_metrics(self, mocker):
+        """Tests that /metrics reports the embedding, job queue and answer cache metrics."""
+        mocker.patch('app.main.load_dotenv')
+        mocker.patch('app.main.os.getenv', side_effect=lambda name, default=None: 'fake_api_key' if name == "GOOGLE_API_KEY" else default)
+        mocker.patch('app.main.EmbeddingService')
+        mocker.patch('app.main.TextSplitterService')
+        mocker.patch('app.main.VectorStoreService')
+        mocker.patch('app.main.ProcessingPipeline')
+        mocker.patch('app.main.RagPipeline')
+        mocker.patch('app.main.ChatGoogleGenerativeAI')
+
+        async with lifespan(app):
+            app.state.embedding_service.stats.return_value = {"cache": {"hits": 3, "misses": 1}, "batcher": None}
+            app.state.vector_store.stats.return_value = {"partition_by": "user", "open_partitions": 2, "opened": 3, "closed": 1}
+
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.get("/api/v1/metrics")
+
+        assert response.status_code == 200
+        assert response.json()["embedding"]["cache"]["hits"] == 3
+        assert response.json()["jobs"]["queued"] == 0
+        assert response.json()["answers"]["hits"] == 0
+        assert response.json()["semantic_answers"] is None
+        assert response.json()["rerank"]["entries"] == 0
+        assert response.json()["hot_index"]["documents"] == 0
+        assert response.json()["vector_store"]["open_partitions"] == 2
+
     async def test_process_document_success(self, mocker):
         """Tests the /process endpoint successfully without fixtures."""
         # ARRANGE
@@ -48,8 +116,128 @@ class TestApiEndpoints:
 
                 # ASSERT
                 assert response.status_code == 202
+                assert response.json()["job_id"]
+                await app.state.job_queue.join()
                 app.state.processing_pipeline.execute.assert_awaited_once()
 
+    async def test_query_document_awaits_async_pipeline(self, mocker):
+        """Tests that /query awaits aget_answer instead of blocking a threadpool worker on the LLM."""
+        # ARRANGE
+        mocker.patch('app.main.load_dotenv')
+        mocker.patch('app.main.os.getenv', return_value='fake_api_key')
+        mocker.patch('app.main.EmbeddingService')
+        mocker.patch('app.main.TextSplitterService')
+        mocker.patch('app.main.VectorStoreService')
+        mocker.patch('app.main.ProcessingPipeline')
+        mocker.patch('app.main.RagPipeline')
+        mocker.patch('app.main.ChatGoogleGenerativeAI')
+
+        async with lifespan(app):
+            app.state.rag_pipeline.aget_answer = AsyncMock(return_value={"answer": "Yes.", "sources": []})
+
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                # ACT
+                response = await client.post("/api/v1/query", json={"user_id": "u1", "document_id": "d1", "question": "a?"})
+
+        # ASSERT
+        assert response.status_code == 200
+        assert response.json()["answer"] == "Yes."
+        app.state.rag_pipeline.aget_answer.assert_awaited_once_with(user_id="u1", document_id="d1", question="a?")
+        app.state.rag_pipeline.get_answer.assert_not_called()
+
+    async def test_query_without_llm_returns_503(self, mocker):
+        """Tests that /query and /query/batch answer 503 when GOOGLE_API_KEY is not set."""
+        # ARRANGE: the real RagPipeline, built without an LLM
+        mocker.patch('app.main.load_dotenv')
+        mocker.patch('app.main.os.getenv', side_effect=lambda name, default=None: default)
+        mocker.patch('app.main.EmbeddingService')
+        mocker.patch('app.main.TextSplitterService')
+        mocker.patch('app.main.VectorStoreService')
+        mocker.patch('app.main.ProcessingPipeline')
+        mocker.patch('app.main.LexicalIndex')
+        mocker.patch('app.core.pipeline.CrossEncoder')
+
+        async with lifespan(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                # ACT
+                single = await client.post("/api/v1/query", json={"user_id": "u1", "document_id": "d1", "question": "a?"})
+                batch = await client.post("/api/v1/query/batch", json={"user_id": "u1", "document_id": "d1", "questions": ["a?"]})
+
+        # ASSERT
+        assert single.status_code == 503
+        assert batch.status_code == 503
+        assert "LLM not configured" in single.json()["detail"]
+
+    async def test_query_document_batch(self, mocker):
+        """Tests that /query/batch returns one result per question, in order, with per-question errors."""
+        # ARRANGE
+        mocker.patch('app.main.load_dotenv')
+        mocker.patch('app.main.os.getenv', return_value='fake_api_key')
+        mocker.patch('app.main.EmbeddingService')
+        mocker.patch('app.main.TextSplitterService')
+        mocker.patch('app.main.VectorStoreService')
+        mocker.patch('app.main.ProcessingPipeline')
+        mocker.patch('app.main.RagPipeline')
+        mocker.patch('app.main.ChatGoogleGenerativeAI')
+
+        async with lifespan(app):
+            app.state.rag_pipeline.aget_answers = AsyncMock(return_value=[
+                {"answer": "Yes.", "sources": [{"page_content": "p", "metadata": {"page": 1}}]},
+                {"error": "LLM call failed: quota exceeded"},
+            ])
+
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                # ACT
+                payload = {"user_id": "u1", "document_id": "d1", "questions": ["a?", "b?"]}
+                response = await client.post("/api/v1/query/batch", json=payload)
+                empty = await client.post("/api/v1/query/batch", json={**payload, "questions": []})
+                blank = await client.post("/api/v1/query/batch", json={**payload, "questions": ["a?", "", "  "]})
+
+        # ASSERT
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [result["question"] for result in results] == ["a?", "b?"]
+        assert results[0]["answer"] == "Yes." and results[0]["error"] is None
+        assert results[1]["answer"] is None and results[1]["error"] == "LLM call failed: quota exceeded"
+        app.state.rag_pipeline.aget_answers.assert_awaited_once_with(user_id="u1", document_id="d1", questions=["a?", "b?"])
+        assert empty.status_code == 422
+        assert blank.status_code == 422
+        assert [error["loc"] for error in blank.json()["detail"]] == [["body", "questions", 1], ["body", "questions", 2]]
+
+    async def test_get_job_status(self, mocker):
+        """Tests that a submitted job can be polled through /jobs/{job_id}."""
+        # ARRANGE
+        mocker.patch('app.main.load_dotenv')
+        mocker.patch('app.main.os.getenv', return_value='fake_api_key')
+        mocker.patch('app.main.EmbeddingService')
+        mocker.patch('app.main.TextSplitterService')
+        mocker.patch('app.main.VectorStoreService')
+        mocker.patch('app.main.ProcessingPipeline')
+        mocker.patch('app.main.RagPipeline')
+        mocker.patch('app.main.ChatGoogleGenerativeAI')
+
+        async with lifespan(app):
+            app.state.processing_pipeline.execute = AsyncMock(return_value={"file_id": "f1", "status": "READY", "error": None})
+
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                payload = {"file_id": "f1", "user_id": "u1", "document_id": "d1", "source_type": "s", "source_location": "l"}
+                job_id = (await client.post("/api/v1/process", json=payload)).json()["job_id"]
+                await app.state.job_queue.join()
+
+                # ACT
+                response = await client.get(f"/api/v1/jobs/{job_id}")
+                missing = await client.get("/api/v1/jobs/does-not-exist")
+
+                # ASSERT
+                assert response.status_code == 200
+                assert response.json()["status"] == "finished"
+                assert response.json()["result"]["status"] == "READY"
+                assert missing.status_code == 404
+
     # async def test_query_document_success(self, mocker):
     #     """Tests the /query endpoint successfully without fixtures."""
     #     # ARRANGE
@@ -83,22 +271,25 @@ class TestApiEndpoints:
     #             app.state.rag_pipeline.get_answer.assert_awaited_once()
     # เพิ่มฟังก์ชันเหล่านี้เข้าไปใน class TestApiEndpoints ของคุณ
 
-    async def test_process_document_internal_error(self, mocker):
+    async def test_process_document_queue_full(self, mocker):
         """
-        ทดสอบ /process endpoint: กรณีที่ pipeline ภายในเกิด exception
+        ทดสอบ /process endpoint: กรณีที่ job queue เต็ม ต้องตอบกลับ 503
         """
         # ARRANGE
         # 1. Mock dependencies และรัน lifespan ให้ app.state พร้อมใช้งาน
         mocker.patch('app.main.load_dotenv')
         mocker.patch('app.main.os.getenv', return_value='fake_api_key')
+        mocker.patch('app.main.EmbeddingService')
+        mocker.patch('app.main.TextSplitterService')
+        mocker.patch('app.main.VectorStoreService')
         mocker.patch('app.main.ProcessingPipeline')
+        mocker.patch('app.main.RagPipeline')
         mocker.patch('app.main.ChatGoogleGenerativeAI')
-        # ... (สามารถ mock service อื่นๆ เพิ่มเติมได้ถ้าจำเป็น)
 
         async with lifespan(app):
-            # 2. ตั้งค่าให้เมธอด execute ของ mock ที่อยู่ใน app.state เกิด Error
-            error_message = "Database connection failed"
-            app.state.processing_pipeline.execute = AsyncMock(side_effect=RuntimeError(error_message))
+            # 2. ตั้งค่าให้ job queue ปฏิเสธงานใหม่
+            error_message = "Job queue is full (100 jobs pending)."
+            mocker.patch.object(app.state.job_queue, 'submit', side_effect=JobQueueFullError(error_message))
             
             # 3. เตรียม client และ payload ที่ถูกต้อง
             transport = httpx.ASGITransport(app=app)
@@ -109,7 +300,7 @@ class TestApiEndpoints:
                 response = await client.post("/api/v1/process", json=payload)
 
                 # ASSERT
-                assert response.status_code == 500
+                assert response.status_code == 503
                 response_data = response.json()
                 assert "detail" in response_data
                 assert response_data["detail"] == f"Error processing document: {error_message}"
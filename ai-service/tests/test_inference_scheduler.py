@@ -0,0 +1,85 @@
+import threading
+import pytest
+
+from app.core.inference_scheduler import InferenceScheduler, Priority
+
+
+def _block_scheduler(scheduler):
+    """Occupies the scheduler thread until the returned event is set."""
+    started, release = threading.Event(), threading.Event()
+
+    def gate():
+        started.set()
+        release.wait()
+
+    future = scheduler.submit(gate, priority=Priority.INTERACTIVE)
+    started.wait()
+    return release, future
+
+## Test Cases ##
+
+def test_interactive_tasks_run_before_pending_bulk_tasks():
+    """Tests that a query submitted after bulk slices still runs first."""
+    # ARRANGE
+    scheduler = InferenceScheduler(max_bulk_wait_ms=60_000)
+    order = []
+    release, gate = _block_scheduler(scheduler)
+
+    bulk = [scheduler.submit(order.append, f"bulk-{i}", priority=Priority.BULK) for i in range(2)]
+    query = scheduler.submit(order.append, "query", priority=Priority.INTERACTIVE)
+
+    # ACT
+    release.set()
+    for future in [gate, query, *bulk]:
+        future.result(timeout=5)
+
+    # ASSERT
+    assert order == ["query", "bulk-0", "bulk-1"]
+    assert scheduler.stats()["executed"] == {"interactive": 2, "bulk": 2}
+    scheduler.close()
+
+def test_interactive_streak_limit_prevents_bulk_starvation():
+    """Tests that bulk work gets a turn after max_interactive_streak interactive tasks."""
+    scheduler = InferenceScheduler(max_bulk_wait_ms=60_000, max_interactive_streak=2)
+    order = []
+    release, gate = _block_scheduler(scheduler)
+
+    futures = [scheduler.submit(order.append, "bulk", priority=Priority.BULK)]
+    futures += [scheduler.submit(order.append, f"query-{i}", priority=Priority.INTERACTIVE) for i in range(3)]
+
+    release.set()
+    for future in [gate, *futures]:
+        future.result(timeout=5)
+
+    # The gate task counts as the first interactive task of the streak.
+    assert order == ["query-0", "bulk", "query-1", "query-2"]
+    assert scheduler.stats()["starvation_promotions"] == 1
+    scheduler.close()
+
+def test_bulk_task_past_max_wait_is_promoted():
+    """Tests that a bulk task that waited longer than max_bulk_wait_ms runs next."""
+    scheduler = InferenceScheduler(max_bulk_wait_ms=0, max_interactive_streak=100)
+    order = []
+    release, gate = _block_scheduler(scheduler)
+
+    bulk = scheduler.submit(order.append, "bulk", priority=Priority.BULK)
+    query = scheduler.submit(order.append, "query", priority=Priority.INTERACTIVE)
+
+    release.set()
+    for future in [gate, bulk, query]:
+        future.result(timeout=5)
+
+    assert order == ["bulk", "query"]
+    scheduler.close()
+
+def test_run_returns_result_and_raises_errors():
+    """Tests that run() blocks for the result and re-raises task exceptions."""
+    scheduler = InferenceScheduler()
+
+    def fail():
+        raise ValueError("bad input")
+
+    assert scheduler.run(lambda x: x * 2, 21, priority=Priority.INTERACTIVE) == 42
+    with pytest.raises(ValueError, match="bad input"):
+        scheduler.run(fail)
+    scheduler.close()
@@ -0,0 +1,166 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+
+from app.core.job_queue import JobQueue, JobQueueFullError
+
+
+@pytest.mark.asyncio
+class TestJobQueue:
+
+    async def test_submit_runs_job_in_background(self):
+        """Tests that a submitted job runs on a worker and records its result."""
+        # ARRANGE
+        queue = JobQueue(num_workers=1, max_queue_size=5)
+        await queue.start()
+
+        async def handler():
+            return {"status": "READY"}
+
+        # ACT
+        job = queue.submit(handler)
+        assert job.status == "queued"
+        await queue.join()
+
+        # ASSERT
+        assert queue.get(job.job_id).status == "finished"
+        assert queue.get(job.job_id).result == {"status": "READY"}
+        await queue.stop()
+
+    async def test_failed_job_records_error(self):
+        """Tests that an exception inside a job marks it as failed."""
+        queue = JobQueue(num_workers=1)
+        await queue.start()
+
+        async def handler():
+            raise RuntimeError("boom")
+
+        job = queue.submit(handler)
+        await queue.join()
+
+        assert job.status == "failed"
+        assert job.error == "boom"
+        await queue.stop()
+
+    async def test_submit_raises_when_queue_is_full(self):
+        """Tests that the bounded queue rejects jobs beyond its capacity."""
+        # ARRANGE: a single worker blocked on an event keeps the queue occupied
+        queue = JobQueue(num_workers=1, max_queue_size=1)
+        await queue.start()
+        release = asyncio.Event()
+
+        async def blocking():
+            await release.wait()
+
+        queue.submit(blocking)
+        await asyncio.sleep(0)  # let the worker pick up the first job
+        queue.submit(blocking)
+
+        # ACT & ASSERT
+        with pytest.raises(JobQueueFullError):
+            queue.submit(blocking)
+
+        release.set()
+        await queue.join()
+        await queue.stop()
+
+    async def test_finished_job_history_is_bounded(self):
+        """Tests that old finished jobs are forgotten past max_finished_jobs."""
+        queue = JobQueue(num_workers=1, max_finished_jobs=2)
+        await queue.start()
+
+        async def handler():
+            return None
+
+        jobs = [queue.submit(handler) for _ in range(3)]
+        await queue.join()
+
+        assert queue.get(jobs[0].job_id) is None
+        assert queue.get(jobs[2].job_id) is not None
+        await queue.stop()
+
+    async def test_submit_before_start_raises(self):
+        queue = JobQueue()
+        with pytest.raises(RuntimeError):
+            queue.submit(lambda: None)
+
+    async def test_handler_reporting_error_marks_job_failed(self):
+        """Tests that a pipeline result with status ERROR shows up as a failed job with its error."""
+        queue = JobQueue(num_workers=1)
+        await queue.start()
+
+        async def handler():
+            return {"file_id": "f1", "status": "ERROR", "error": "unsupported source"}
+
+        job = queue.submit(handler)
+        await queue.join()
+
+        assert job.status == "failed"
+        assert job.error == "unsupported source"
+        assert job.result["status"] == "ERROR"
+        await queue.stop()
+
+    async def test_stop_drains_queue_within_timeout(self):
+        queue = JobQueue(num_workers=1)
+        await queue.start()
+
+        async def handler():
+            await asyncio.sleep(0.01)
+            return "done"
+
+        jobs = [queue.submit(handler) for _ in range(3)]
+        await queue.stop(drain_timeout=5)
+
+        assert [job.status for job in jobs] == ["finished"] * 3
+
+    async def test_stop_fails_dropped_jobs_and_notifies_them(self):
+        """Tests that at shutdown the running job is cancelled and queued jobs are failed with their on_drop awaited."""
+        # ARRANGE
+        queue = JobQueue(num_workers=1)
+        await queue.start()
+        dropped = []
+
+        async def blocking():
+            await asyncio.Event().wait()
+
+        async def on_drop(job):
+            dropped.append(job.job_id)
+
+        running = queue.submit(blocking, on_drop=on_drop)
+        await asyncio.sleep(0)  # let the worker pick up the first job
+        queued = [queue.submit(blocking, on_drop=on_drop) for _ in range(2)]
+
+        # ACT
+        await queue.stop(drain_timeout=0.01)
+
+        # ASSERT
+        assert running.status == "failed" and "Cancelled" in running.error
+        assert all(job.status == "failed" and "Dropped" in job.error for job in queued)
+        assert dropped == [job.job_id for job in queued]
+        assert queue.stats()["failed"] == 3
+
+    async def test_status_store_shares_job_states_between_queues(self):
+        """Tests that a job queued in one process can be polled through another's status store."""
+        # ARRANGE: two queues, as in two API workers, sharing one store
+        jobs = {}
+        store = MagicMock()
+        store.put_job.side_effect = lambda job: jobs.__setitem__(job["job_id"], job)
+        store.get_job.side_effect = jobs.get
+        producer = JobQueue(num_workers=1, status_store=store)
+        poller = JobQueue(num_workers=1, status_store=store)
+        await producer.start()
+
+        async def handler():
+            return {"status": "READY"}
+
+        # ACT
+        job = producer.submit(handler)
+        queued = poller.status(job.job_id)["status"]
+        await producer.join()
+
+        # ASSERT
+        assert queued == "queued"
+        assert poller.status(job.job_id)["status"] == "finished"
+        assert poller.status(job.job_id)["result"] == {"status": "READY"}
+        assert poller.status("does-not-exist") is None
+        await producer.stop()
@@ -0,0 +1,89 @@
+import pytest
+from langchain_core.documents import Document
+
+from app.core.lexical_index import LexicalIndex, tokenize
+
+
+@pytest.fixture
+def index(tmp_path):
+    lexical_index = LexicalIndex(path=str(tmp_path / "lexical.sqlite3"))
+    yield lexical_index
+    lexical_index.close()
+
+
+def _chunk(text, user_id="u1", document_id="d1", **metadata):
+    return Document(page_content=text, metadata={"user_id": user_id, "document_id": document_id, **metadata})
+
+## Test Cases ##
+
+def test_tokenize_keeps_codes_whole_and_split():
+    assert tokenize("Order AB-1234 by 15/10/2567") == ["order", "ab-1234", "ab", "1234", "by", "15/10/2567", "15", "10", "2567"]
+
+def test_tokenize_indexes_thai_as_character_bigrams():
+    """Tests that unsegmented Thai text yields bigrams, so a Thai word matches inside a longer run."""
+    # ARRANGE
+    document_terms = set(tokenize("วันลงทะเบียนคือวันที่ 15"))
+
+    # ACT
+    query_terms = tokenize("ลงทะเบียน")
+
+    # ASSERT
+    assert query_terms == ["ลง", "งท", "ทะ", "ะเ", "เบ", "บี", "ีย", "ยน"]
+    assert set(query_terms) <= document_terms
+    assert "15" in document_terms
+
+def test_search_ranks_exact_term_matches_first(index):
+    """Tests that BM25 puts the chunk with the rare exact code above chunks with common words."""
+    # ARRANGE
+    index.upsert(
+        [
+            _chunk("The product catalogue lists every product we sell."),
+            _chunk("Product XR-7700 ships with a two year warranty."),
+            _chunk("Shipping takes three days for every product."),
+        ],
+        ["f_chunk_0", "f_chunk_1", "f_chunk_2"],
+    )
+
+    # ACT
+    results = index.search("warranty of XR-7700", "u1", "d1", k=2)
+
+    # ASSERT
+    assert results[0].id == "f_chunk_1"
+    assert results[0].page_content == "Product XR-7700 ships with a two year warranty."
+    assert results[0].metadata == {"user_id": "u1", "document_id": "d1"}
+    assert len(results) == 1
+
+def test_search_is_scoped_to_the_users_document(index):
+    index.upsert([_chunk("secret code ZZ-1", user_id="u2"), _chunk("secret code ZZ-1", document_id="d2")], ["a", "b"])
+
+    assert index.search("ZZ-1", "u1", "d1") == []
+    assert [doc.id for doc in index.search("ZZ-1", "u2", "d1")] == ["a"]
+
+def test_upsert_replaces_and_delete_removes_chunks(index):
+    # ARRANGE
+    index.upsert([_chunk("old wording"), _chunk("kept")], ["c0", "c1"])
+
+    # ACT
+    index.upsert([_chunk("new wording")], ["c0"])
+    index.delete(["c1"])
+
+    # ASSERT
+    assert index.search("old", "u1", "d1") == []
+    assert [doc.id for doc in index.search("new", "u1", "d1")] == ["c0"]
+    assert index.missing_ids(["c0", "c1"]) == ["c1"]
+    assert index.stats() == {"chunks": 1, "postings": 2}
+
+def test_index_persists_across_instances(tmp_path):
+    path = str(tmp_path / "lexical.sqlite3")
+    first = LexicalIndex(path=path)
+    first.upsert([_chunk("persistent term")], ["c0"])
+    first.close()
+
+    reopened = LexicalIndex(path=path)
+
+    assert [doc.id for doc in reopened.search("persistent", "u1", "d1")] == ["c0"]
+    reopened.close()
+
+def test_upsert_rejects_mismatched_ids(index):
+    with pytest.raises(ValueError):
+        index.upsert([_chunk("a")], [])
@@ -53,6 +53,31 @@ class TestMainAppAndLifespan:
             assert hasattr(mock_app.state, 'processing_pipeline')
             assert mock_app.state.rag_pipeline == mock_rag_pipeline.return_value
 
+    async def test_lifespan_without_api_key_does_not_prompt(self, mocker):
+        """
+        Tests that a missing GOOGLE_API_KEY is reported through readiness instead of blocking on input.
+        """
+        # ARRANGE
+        mocker.patch('app.main.load_dotenv')
+        mocker.patch('app.main.os.getenv', side_effect=lambda name, default=None: None if name == "GOOGLE_API_KEY" else default)
+        mocker.patch('app.main.EmbeddingService')
+        mocker.patch('app.main.TextSplitterService')
+        mocker.patch('app.main.VectorStoreService')
+        mocker.patch('app.main.ProcessingPipeline')
+        mock_rag_pipeline = mocker.patch('app.main.RagPipeline')
+        mock_llm = mocker.patch('app.main.ChatGoogleGenerativeAI')
+        mock_app = MagicMock()
+
+        # ACT
+        async with lifespan(mock_app):
+            readiness = mock_app.state.readiness
+
+        # ASSERT
+        mock_llm.assert_not_called()
+        assert mock_rag_pipeline.call_args.kwargs["llm"] is None
+        assert not readiness.is_ready
+        assert readiness.errors["llm"] == "GOOGLE_API_KEY is not set."
+
     async def test_lifespan_startup_failure(self, mocker):
         """
         Tests that an exception during service initialization is raised correctly.
@@ -68,4 +93,38 @@ class TestMainAppAndLifespan:
         with pytest.raises(ValueError, match="Connection to service failed"):
             async with lifespan(mock_app):
                 # This code block will not be reached
-                pass
\ No newline at end of file
+                pass
+    async def test_lifespan_in_sidecar_mode_builds_no_local_models(self, mocker):
+        """
+        Tests that a worker in sidecar mode uses the sidecar for models, job states and document changes.
+        """
+        # ARRANGE
+        env = {"INFERENCE_SIDECAR": "true", "INFERENCE_SIDECAR_SOCKET": "/tmp/inference.sock", "INFERENCE_SIDECAR_AUTHKEY": "key"}
+        mocker.patch('app.main.load_dotenv')
+        mocker.patch('app.main.os.getenv', side_effect=lambda name, default=None: env.get(name, default))
+        mock_embedding = mocker.patch('app.main.EmbeddingService')
+        mock_client = mocker.patch('app.main.SidecarClient')
+        mock_feed = mocker.patch('app.main.DocumentChangeFeed')
+        mocker.patch('app.main.TextSplitterService')
+        mocker.patch('app.main.VectorStoreService')
+        mock_proc_pipeline = mocker.patch('app.main.ProcessingPipeline')
+        mock_rag_pipeline = mocker.patch('app.main.RagPipeline')
+        mock_app = MagicMock()
+
+        # ACT
+        async with lifespan(mock_app):
+            job_queue = mock_app.state.job_queue
+
+        # ASSERT
+        mock_embedding.assert_not_called()
+        mock_client.assert_called_once_with("/tmp/inference.sock", authkey=b"key")
+        sidecar = mock_client.return_value
+        assert mock_app.state.embedding_service.client is sidecar
+        assert mock_rag_pipeline.call_args.kwargs["cross_encoder"].client is sidecar
+        assert mock_rag_pipeline.call_args.kwargs["scheduler"] is None
+        assert job_queue.status_store is sidecar
+        assert sidecar.publish_document_changed in mock_proc_pipeline.call_args.kwargs["document_listeners"]
+        assert sidecar.publish_document_changed not in mock_feed.call_args.args[1]
+        mock_feed.return_value.start.assert_called_once()
+        mock_feed.return_value.close.assert_called_once()
+        sidecar.close.assert_called_once()
@@ -0,0 +1,63 @@
+import threading
+import numpy as np
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.micro_batcher import MicroBatcher
+
+
+def fake_encode(texts):
+    """Encodes each text as [len(text), index-in-batch] so rows can be traced back."""
+    return np.array([[len(text), i] for i, text in enumerate(texts)], dtype=np.float32)
+
+## Test Cases ##
+
+def test_concurrent_requests_share_one_encode_call():
+    """Tests that requests arriving inside the window are merged into one batch."""
+    # ARRANGE
+    calls = []
+    start = threading.Barrier(4)
+
+    def encode(texts):
+        calls.append(list(texts))
+        return fake_encode(texts)
+
+    batcher = MicroBatcher(encode, max_batch_size=64, max_wait_ms=200)
+
+    def submit(text):
+        start.wait()
+        return batcher.submit([text])
+
+    # ACT
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(submit, ["a", "bb", "ccc", "dddd"]))
+
+    # ASSERT
+    assert len(calls) == 1
+    assert sorted(calls[0]) == ["a", "bb", "ccc", "dddd"]
+    # Every caller gets the row computed for its own text.
+    assert [int(row[0][0]) for row in results] == [1, 2, 3, 4]
+    stats = batcher.stats()
+    assert stats["batches"] == 1
+    assert stats["avg_batch_size"] == 4
+    batcher.close()
+
+def test_batch_is_flushed_at_max_batch_size():
+    """Tests that a full batch is encoded without waiting for the window to expire."""
+    batcher = MicroBatcher(fake_encode, max_batch_size=2, max_wait_ms=10_000)
+
+    result = batcher.submit(["x", "yy"])
+
+    np.testing.assert_array_equal(result, fake_encode(["x", "yy"]))
+    batcher.close()
+
+def test_encode_errors_are_raised_to_every_caller():
+    """Tests that a failing encode propagates the exception to the waiting callers."""
+    def broken(texts):
+        raise RuntimeError("model crashed")
+
+    batcher = MicroBatcher(broken, max_wait_ms=1)
+
+    with pytest.raises(RuntimeError, match="model crashed"):
+        batcher.submit(["text"])
+    batcher.close()
@@ -1,5 +1,6 @@
 import pytest
 import json
+import numpy as np
 from unittest.mock import MagicMock, AsyncMock
 from langchain_core.documents import Document
 
@@ -23,9 +24,11 @@ class TestProcessingPipelineScenarios:
         # ARRANGE
         mocker.patch('app.core.pipeline.load_from_source', return_value=[Document(page_content="doc")])
         mock_splitter = MagicMock()
+        mock_embedding = MagicMock()
+        mock_embedding.embed_documents_array.return_value = np.array([[0.1, 0.2]], dtype=np.float32)
         mock_vector_store = MagicMock()
-        pipeline = ProcessingPipeline(mock_splitter, MagicMock(), mock_vector_store)
-        mocker.patch.object(pipeline, '_prepare_documents_for_store', return_value=([], []))
+        pipeline = ProcessingPipeline(mock_splitter, mock_embedding, mock_vector_store)
+        mocker.patch.object(pipeline, '_prepare_documents_for_store', return_value=([Document(page_content="chunk")], ["f_chunk_0"]))
         
         webhook_url = "http://fake-webhook.com/success"
         httpx_mock.add_response(method="PATCH", url=webhook_url)
@@ -35,7 +38,7 @@ class TestProcessingPipelineScenarios:
 
         # ASSERT
         pipeline._prepare_documents_for_store.assert_called_once()
-        mock_vector_store.upsert_documents.assert_called_once()
+        mock_vector_store.upsert_embeddings.assert_called_once()
         requests = httpx_mock.get_requests()
         assert len(requests) == 1
         assert json.loads(requests[0].content)["status"] == "READY"
@@ -79,6 +82,24 @@ class TestProcessingPipelineScenarios:
         assert payload["status"] == "ERROR"
         assert payload["errorMessage"] == error_message
 
+    async def test_cancelled_pipeline_reports_error_to_webhook(self, mocker, httpx_mock):
+        """Tests that a job cancelled at shutdown reports ERROR, not READY, to the webhook."""
+        # ARRANGE
+        import asyncio
+        mocker.patch('app.core.pipeline.load_from_source', side_effect=asyncio.CancelledError())
+        webhook_url = "http://fake-webhook.com/cancelled"
+        httpx_mock.add_response(url=webhook_url)
+        pipeline = ProcessingPipeline(MagicMock(), MagicMock(), MagicMock())
+
+        # ACT
+        with pytest.raises(asyncio.CancelledError):
+            await pipeline.execute("f", "u", "d", "s", "l", webhook_url)
+
+        # ASSERT
+        payload = json.loads(httpx_mock.get_requests()[0].content)
+        assert payload["status"] == "ERROR"
+        assert "cancelled" in payload["errorMessage"]
+
     async def test_failure_on_text_splitting(self, mocker, httpx_mock):
         """ทดสอบ: กรณีที่เกิด Error ตอนตัดข้อความ (split_documents)"""
         # ARRANGE
@@ -155,7 +176,7 @@ class TestProcessingPipelineScenarios:
         # ASSERT
         # ขั้นตอนหลังจาก load ต้องไม่ถูกเรียก
         mock_splitter.split_documents.assert_not_called()
-        mock_vector_store.upsert_documents.assert_not_called()
+        mock_vector_store.upsert_embeddings.assert_not_called()
         
         # Webhook ต้องถูกยิงไปและมีสถานะ READY เพราะการไม่มีเอกสารไม่ใช่ Error
         requests = httpx_mock.get_requests()
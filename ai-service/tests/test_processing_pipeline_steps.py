@@ -1,5 +1,8 @@
 import pytest
 import json
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, AsyncMock
 from langchain_core.documents import Document
 
@@ -57,23 +60,45 @@ class TestProcessingPipelineSteps:
         assert doc_ids == ["file1_chunk_0"]
         assert prepared_docs[0].metadata['file_id'] == "file1"
 
-    # --- Step 4: ทดสอบว่า upsert_documents ถูกเรียกใช้ถูกต้อง ---
-    async def test_step4_calls_upsert_documents(self, mocker):
+    # --- Step 4: ทดสอบว่า pipeline embed เอง แล้วส่ง vector ไปยัง upsert_embeddings ---
+    async def test_step4_embeds_and_calls_upsert_embeddings(self, mocker):
         # ARRANGE
         mocker.patch('app.core.pipeline.load_from_source')
         mock_splitter = MagicMock()
+        mock_embedding = MagicMock()
+        mock_embedding.embed_documents_array.return_value = np.array([[0.1, 0.2], [0.3, 0.4]], dtype=np.float32)
         mock_vector_store = MagicMock()
         
-        pipeline = ProcessingPipeline(mock_splitter, MagicMock(), mock_vector_store)
+        pipeline = ProcessingPipeline(mock_splitter, mock_embedding, mock_vector_store)
         
         # Mock helper function เพื่อความง่าย
-        mocker.patch.object(pipeline, '_prepare_documents_for_store', return_value=([], []))
+        chunks = [Document(page_content="chunk 0"), Document(page_content="chunk 1")]
+        mocker.patch.object(pipeline, '_prepare_documents_for_store', return_value=(chunks, ["f_chunk_0", "f_chunk_1"]))
 
         # ACT
         await pipeline.execute("f", "u", "d", "s", "l", None)
 
         # ASSERT
-        mock_vector_store.upsert_documents.assert_called_once()
+        mock_embedding.embed_documents_array.assert_called_once_with(["chunk 0", "chunk 1"])
+        mock_vector_store.upsert_embeddings.assert_called_once()
+        kwargs = mock_vector_store.upsert_embeddings.call_args.kwargs
+        assert kwargs['ids'] == ["f_chunk_0", "f_chunk_1"]
+        assert kwargs['embeddings'].dtype == np.float32
+        assert kwargs['embeddings'].shape == (2, 2)
+
+    async def test_step4_embeds_in_slices_of_embed_batch_size(self, mocker):
+        # ARRANGE
+        mock_embedding = MagicMock()
+        mock_embedding.embed_documents_array.side_effect = lambda texts: np.tile(np.array([1.0, 0.0], dtype=np.float32), (len(texts), 1))
+        pipeline = ProcessingPipeline(MagicMock(), mock_embedding, MagicMock(), embed_batch_size=2)
+        docs = [Document(page_content=f"chunk {i}") for i in range(5)]
+
+        # ACT
+        embeddings = pipeline._embed_documents(docs)
+
+        # ASSERT
+        assert [len(call.args[0]) for call in mock_embedding.embed_documents_array.call_args_list] == [2, 2, 1]
+        assert embeddings.shape == (5, 2)
 
     # --- Step 5: ทดสอบว่า Webhook ถูกยิงไปเมื่อทำงานสำเร็จ ---
     async def test_step5_sends_webhook_on_success(self, mocker, httpx_mock):
@@ -98,4 +123,192 @@ class TestProcessingPipelineSteps:
         assert len(requests) == 1
         payload = json.loads(requests[0].content)
         assert payload["status"] == "READY"
-        assert payload["fileId"] == "file-final"
\ No newline at end of file
+        assert payload["fileId"] == "file-final"
+
+    # --- Step 6: ทดสอบว่าแต่ละขั้นตอนรันบน executor ที่กำหนด ไม่ใช่บน event loop ---
+    async def test_step6_runs_blocking_stages_on_executors(self, mocker):
+        # ARRANGE
+        threads = {}
+
+        def fake_loader(source_type, source_location):
+            threads['load'] = threading.current_thread().name
+            return [Document(page_content="doc")]
+
+        def fake_split(documents):
+            threads['split'] = threading.current_thread().name
+            return [Document(page_content="chunk", metadata={})]
+
+        mocker.patch('app.core.pipeline.load_from_source', side_effect=fake_loader)
+        mock_splitter = MagicMock()
+        mock_splitter.split_documents.side_effect = fake_split
+
+        io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="test-io")
+        cpu_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="test-cpu")
+        pipeline = ProcessingPipeline(mock_splitter, MagicMock(), MagicMock(), io_executor=io_executor, cpu_executor=cpu_executor)
+
+        # ACT
+        await pipeline.execute("f", "u", "d", "s", "l", None)
+
+        # ASSERT
+        assert threads['load'].startswith("test-io")
+        assert threads['split'].startswith("test-cpu")
+        io_executor.shutdown()
+        cpu_executor.shutdown()
+
+    # --- Step 7: ทดสอบโหมด streaming ว่า upsert เป็น batch และ ID ต่อเนื่อง ---
+    async def test_step7_streaming_upserts_fixed_size_batches(self, mocker):
+        # ARRANGE: 3 pages, each split into 2 chunks -> 6 chunks in batches of 4
+        pages = [Document(page_content=f"page {i}") for i in range(3)]
+        mocker.patch('app.core.pipeline.lazy_load_from_source', return_value=iter(pages))
+        mock_splitter = MagicMock()
+        mock_splitter.split_documents.side_effect = lambda docs: [
+            Document(page_content=f"{docs[0].page_content} part {j}", metadata={}) for j in range(2)
+        ]
+        mock_embedding = MagicMock()
+        mock_embedding.embed_documents_array.side_effect = lambda texts: np.tile(np.array([0.5, 0.5], dtype=np.float32), (len(texts), 1))
+        mock_vector_store = MagicMock()
+        pipeline = ProcessingPipeline(mock_splitter, mock_embedding, mock_vector_store, streaming=True, batch_size=4)
+
+        # ACT
+        await pipeline.execute("f", "u", "d", "s", "l", None)
+
+        # ASSERT
+        calls = mock_vector_store.upsert_embeddings.call_args_list
+        assert [len(call.kwargs['ids']) for call in calls] == [4, 2]
+        all_ids = [doc_id for call in calls for doc_id in call.kwargs['ids']]
+        assert all_ids == [f"f_chunk_{i}" for i in range(6)]
+        assert mock_splitter.split_documents.call_count == 3
+
+    # --- Step 8: ทดสอบโหมด incremental: embed เฉพาะ chunk ที่เปลี่ยน และลบ chunk ที่ไม่มีแล้ว ---
+    async def test_step8_incremental_reingestion_diffs_chunks(self, mocker):
+        # ARRANGE: the new version has 2 chunks; chunk 0 is unchanged, chunk 1 changed,
+        # and the stored chunk 2 no longer exists in the new version.
+        mocker.patch('app.core.pipeline.load_from_source', return_value=[Document(page_content="doc")])
+        mock_splitter = MagicMock()
+        mock_splitter.split_documents.side_effect = lambda docs: [
+            Document(page_content="same", metadata={}), Document(page_content="edited", metadata={})
+        ]
+        mock_embedding = MagicMock()
+        mock_embedding.embed_documents_array.side_effect = lambda texts: np.tile(np.array([1.0, 0.0], dtype=np.float32), (len(texts), 1))
+        mock_vector_store = MagicMock()
+        pipeline = ProcessingPipeline(mock_splitter, mock_embedding, mock_vector_store, incremental=True)
+
+        unchanged_hash = pipeline._chunk_hash(
+            pipeline._prepare_documents_for_store([Document(page_content="same", metadata={})], "f", "u", "d")[0][0]
+        )
+        mock_vector_store.get_chunk_hashes.return_value = {
+            "f_chunk_0": unchanged_hash,
+            "f_chunk_1": "stale-hash",
+            "f_chunk_2": "stale-hash",
+        }
+
+        # ACT
+        result = await pipeline.execute("f", "u", "d", "s", "l", None)
+
+        # ASSERT
+        mock_embedding.embed_documents_array.assert_called_once_with(["edited"])
+        assert mock_vector_store.upsert_embeddings.call_args.kwargs['ids'] == ["f_chunk_1"]
+        mock_vector_store.get_chunk_hashes.assert_called_once_with("f", "u", "d")
+        mock_vector_store.delete_documents.assert_called_once_with(["f_chunk_2"], "u", "d")
+        assert result["chunks"] == {"added": 1, "kept": 1, "removed": 1}
+
+    async def test_step9_notifies_document_listeners_on_changes(self, mocker):
+        # ARRANGE: one listener fails, the other must still be called
+        mocker.patch('app.core.pipeline.load_from_source', return_value=[Document(page_content="doc")])
+        mock_splitter = MagicMock()
+        mock_splitter.split_documents.return_value = [Document(page_content="chunk", metadata={})]
+        mock_embedding = MagicMock()
+        mock_embedding.embed_documents_array.return_value = np.array([[1.0, 0.0]], dtype=np.float32)
+        mock_vector_store = MagicMock()
+        mock_vector_store.get_chunk_hashes.return_value = {"f_chunk_5": "old"}
+        failing_listener = MagicMock(side_effect=RuntimeError("boom"))
+        listener = MagicMock()
+        pipeline = ProcessingPipeline(
+            mock_splitter, mock_embedding, mock_vector_store, incremental=True,
+            document_listeners=[failing_listener, listener],
+        )
+
+        # ACT
+        result = await pipeline.execute("f", "u", "d", "s", "l", None)
+
+        # ASSERT: once for the written batch, once for the removed orphan
+        assert result["status"] == "READY"
+        assert listener.call_count == 2
+        listener.assert_called_with("u", "d")
+
+    async def test_step10_keeps_lexical_index_in_step_with_the_store(self, mocker):
+        # ARRANGE: chunk 0 is unchanged but not yet in the lexical index, chunk 1 is edited
+        # and the stored chunk 2 is gone.
+        mocker.patch('app.core.pipeline.load_from_source', return_value=[Document(page_content="doc")])
+        mock_splitter = MagicMock()
+        mock_splitter.split_documents.side_effect = lambda docs: [
+            Document(page_content="same", metadata={}), Document(page_content="edited", metadata={})
+        ]
+        mock_embedding = MagicMock()
+        mock_embedding.embed_documents_array.side_effect = lambda texts: np.tile(np.array([1.0, 0.0], dtype=np.float32), (len(texts), 1))
+        mock_vector_store = MagicMock()
+        mock_lexical_index = MagicMock()
+        mock_lexical_index.missing_ids.return_value = ["f_chunk_0"]
+        pipeline = ProcessingPipeline(mock_splitter, mock_embedding, mock_vector_store, incremental=True, lexical_index=mock_lexical_index)
+        unchanged_hash = pipeline._chunk_hash(
+            pipeline._prepare_documents_for_store([Document(page_content="same", metadata={})], "f", "u", "d")[0][0]
+        )
+        mock_vector_store.get_chunk_hashes.return_value = {"f_chunk_0": unchanged_hash, "f_chunk_1": "stale-hash", "f_chunk_2": "stale-hash"}
+
+        # ACT
+        await pipeline.execute("f", "u", "d", "s", "l", None)
+
+        # ASSERT
+        indexed_docs, indexed_ids = mock_lexical_index.upsert.call_args.args
+        assert indexed_ids == ["f_chunk_0", "f_chunk_1"]
+        assert indexed_docs[0].metadata["document_id"] == "d"
+        mock_lexical_index.delete.assert_called_once_with(["f_chunk_2"])
+
+    async def test_step10_lexical_index_is_not_written_when_the_vector_write_fails(self, mocker):
+        # ARRANGE
+        mocker.patch('app.core.pipeline.load_from_source', return_value=[Document(page_content="doc")])
+        mock_splitter = MagicMock()
+        mock_splitter.split_documents.return_value = [Document(page_content="chunk", metadata={})]
+        mock_embedding = MagicMock()
+        mock_embedding.embed_documents_array.return_value = np.array([[1.0, 0.0]], dtype=np.float32)
+        mock_vector_store = MagicMock()
+        mock_vector_store.upsert_embeddings.side_effect = RuntimeError("chroma is down")
+        mock_lexical_index = MagicMock()
+        mock_lexical_index.missing_ids.return_value = []
+        pipeline = ProcessingPipeline(mock_splitter, mock_embedding, mock_vector_store, lexical_index=mock_lexical_index)
+
+        # ACT
+        result = await pipeline.execute("f", "u", "d", "s", "l", None)
+
+        # ASSERT
+        assert result["status"] == "ERROR"
+        mock_lexical_index.upsert.assert_not_called()
+
+    async def test_step11_writes_sparse_weights_from_the_same_encode(self, mocker):
+        # ARRANGE: chunk 0 is unchanged but has no sparse weights yet, so it is encoded again.
+        mocker.patch('app.core.pipeline.load_from_source', return_value=[Document(page_content="doc")])
+        mock_splitter = MagicMock()
+        mock_splitter.split_documents.side_effect = lambda docs: [Document(page_content="same", metadata={})]
+        mock_embedding = MagicMock()
+        mock_embedding.embed_documents_with_sparse.side_effect = lambda texts: (
+            np.ones((len(texts), 2), dtype=np.float32), [{5: 0.5}] * len(texts)
+        )
+        mock_vector_store = MagicMock()
+        mock_sparse_index = MagicMock()
+        mock_sparse_index.missing_ids.return_value = ["f_chunk_0"]
+        pipeline = ProcessingPipeline(mock_splitter, mock_embedding, mock_vector_store, incremental=True, sparse_index=mock_sparse_index)
+        unchanged_hash = pipeline._chunk_hash(
+            pipeline._prepare_documents_for_store([Document(page_content="same", metadata={})], "f", "u", "d")[0][0]
+        )
+        mock_vector_store.get_chunk_hashes.return_value = {"f_chunk_0": unchanged_hash}
+
+        # ACT
+        await pipeline.execute("f", "u", "d", "s", "l", None)
+
+        # ASSERT
+        mock_embedding.embed_documents_with_sparse.assert_called_once_with(["same"])
+        mock_embedding.embed_documents_array.assert_not_called()
+        documents, ids, weights = mock_sparse_index.upsert.call_args.args
+        assert ids == ["f_chunk_0"]
+        assert weights == [{5: 0.5}]
+        assert mock_vector_store.upsert_embeddings.call_args.kwargs['ids'] == ["f_chunk_0"]
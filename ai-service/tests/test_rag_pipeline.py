@@ -20,6 +20,34 @@ class TestRagPipeline:
         # ASSERT
         mock_cross_encoder.assert_called_once_with('test-model')
 
+    def test_lazy_load_defers_cross_encoder(self, mocker):
+        """Tests that with lazy_load the CrossEncoder is only built by warmup."""
+        # ARRANGE
+        mock_cross_encoder = mocker.patch('app.core.pipeline.CrossEncoder')
+
+        # ACT
+        pipeline = RagPipeline(MagicMock(), MagicMock(), cross_encoder_model_name='test-model', lazy_load=True)
+        mock_cross_encoder.assert_not_called()
+        pipeline.warmup()
+
+        # ASSERT
+        mock_cross_encoder.assert_called_once_with('test-model')
+        mock_cross_encoder.return_value.predict.assert_called_once_with([["warmup", "warmup"]])
+
+    def test_given_cross_encoder_is_used_instead_of_loading_one(self, mocker):
+        """Tests that an injected cross encoder (e.g. the sidecar's) replaces the local model."""
+        # ARRANGE
+        mock_cross_encoder = mocker.patch('app.core.pipeline.CrossEncoder')
+        remote = MagicMock()
+
+        # ACT
+        pipeline = RagPipeline(MagicMock(), MagicMock(), cross_encoder=remote)
+        pipeline.warmup()
+
+        # ASSERT
+        mock_cross_encoder.assert_not_called()
+        remote.predict.assert_called_once_with([["warmup", "warmup"]])
+
     def test_reranker_logic(self, mocker):
         """Unit Test: Verifies the re-ranking and sorting logic."""
         # ARRANGE
@@ -37,6 +65,351 @@ class TestRagPipeline:
         assert len(top_docs) == 1
         assert top_docs[0].page_content == "high score"
 
+    def test_reranker_runs_on_scheduler_as_interactive(self, mocker):
+        """Unit Test: Verifies reranking is submitted to the scheduler ahead of ingestion."""
+        # ARRANGE
+        from app.core.inference_scheduler import Priority
+        mocker.patch('app.core.pipeline.CrossEncoder')
+        mock_scheduler = MagicMock()
+        mock_scheduler.run.return_value = [0.2, 0.8]
+        pipeline = RagPipeline(MagicMock(), MagicMock(), scheduler=mock_scheduler)
+        docs_to_rank = [Document(page_content="a"), Document(page_content="b")]
+
+        # ACT
+        top_docs = pipeline._reranker_docuements("query", docs_to_rank, top_n=1)
+
+        # ASSERT
+        assert mock_scheduler.run.call_args.kwargs["priority"] == Priority.INTERACTIVE
+        assert top_docs[0].page_content == "b"
+
+    def test_reranker_scores_only_uncached_pairs(self, mocker):
+        """Unit Test: Verifies that cached (question, chunk) scores are reused and only new chunks are scored."""
+        # ARRANGE
+        from app.core.rerank_cache import RerankScoreCache
+        mock_cross_encoder = mocker.patch('app.core.pipeline.CrossEncoder')
+        mock_cross_encoder.return_value.predict.side_effect = [[0.1, 0.9], [0.5]]
+        cache = RerankScoreCache()
+        pipeline = RagPipeline(MagicMock(), MagicMock(), rerank_cache=cache)
+        metadata = {"file_id": "f", "document_id": "d", "content_hash": "h"}
+        low = Document(page_content="low score", metadata={**metadata, "chunk_number": 0})
+        high = Document(page_content="high score", metadata={**metadata, "chunk_number": 1})
+        new = Document(page_content="new", metadata={**metadata, "chunk_number": 2})
+
+        # ACT
+        pipeline._reranker_docuements("Query", [low, high], top_n=2)
+        top_docs = pipeline._reranker_docuements("query ", [new, low, high], top_n=3)
+
+        # ASSERT
+        assert [doc.page_content for doc in top_docs] == ["high score", "new", "low score"]
+        assert mock_cross_encoder.return_value.predict.call_args_list[1].args[0] == [["query ", "new"]]
+        assert cache.stats()["hits"] == 2
+
+    def test_get_answer_uses_answer_cache(self, mocker):
+        """Tests that a repeated question is served from the answer cache without retrieval or LLM calls."""
+        # ARRANGE
+        from app.core.answer_cache import AnswerCache
+        mocker.patch('app.core.pipeline.CrossEncoder')
+        mock_vector_store = MagicMock()
+        mock_vector_store.get_retriever.return_value.invoke.return_value = [Document(page_content="doc", metadata={})]
+        mock_llm = MagicMock(model="gemini-2.0-flash", temperature=0.2)
+        mock_llm.invoke.return_value = MagicMock(content="Answer.")
+        cache = AnswerCache()
+        pipeline = RagPipeline(mock_vector_store, mock_llm, answer_cache=cache)
+        mocker.patch.object(pipeline, '_reranker_docuements', side_effect=lambda question, docs, top_n: docs)
+
+        # ACT
+        first = pipeline.get_answer("u1", "d1", "What is it?")
+        second = pipeline.get_answer("u1", "d1", "what is it?")
+        cache.on_document_changed("u1", "d1")
+        third = pipeline.get_answer("u1", "d1", "What is it?")
+
+        # ASSERT: the second call is a hit; the invalidation forces a recompute
+        assert first == second == third
+        assert mock_llm.invoke.call_count == 2
+        assert cache.stats()["hits"] == 1
+
+    def test_get_answer_reuses_answer_for_paraphrase(self, mocker):
+        """Tests that a paraphrased question is answered from the semantic cache, skipping retrieval, rerank and LLM."""
+        # ARRANGE
+        import numpy as np
+        from app.core.semantic_answer_cache import SemanticAnswerCache
+        mocker.patch('app.core.pipeline.CrossEncoder')
+        mock_vector_store = MagicMock()
+        mock_vector_store.similarity_search_by_vector.return_value = [Document(page_content="doc", metadata={})]
+        mock_embedding = MagicMock()
+        mock_embedding.embed_query_array.side_effect = [
+            np.array([1.0, 0.0], dtype=np.float32),
+            np.array([0.98, 0.1], dtype=np.float32),
+            np.array([0.0, 1.0], dtype=np.float32),
+        ]
+        mock_llm = MagicMock(model="gemini-2.0-flash", temperature=0.2)
+        mock_llm.invoke.return_value = MagicMock(content="October 15th.")
+        cache = SemanticAnswerCache(threshold=0.95)
+        pipeline = RagPipeline(mock_vector_store, mock_llm, semantic_cache=cache, embedding_service=mock_embedding)
+        mock_rerank = mocker.patch.object(pipeline, '_reranker_docuements', side_effect=lambda question, docs, top_n: docs)
+
+        # ACT
+        first = pipeline.get_answer("u1", "d1", "When is registration?")
+        paraphrase = pipeline.get_answer("u1", "d1", "What's the registration date?")
+        unrelated = pipeline.get_answer("u1", "d1", "Who is the dean?")
+
+        # ASSERT: the question vector is reused for retrieval; only the paraphrase skips the work
+        assert first == paraphrase == unrelated
+        assert mock_llm.invoke.call_count == 2
+        assert mock_rerank.call_count == 2
+        assert mock_vector_store.similarity_search_by_vector.call_count == 2
+        mock_vector_store.get_retriever.assert_not_called()
+        assert cache.stats()["hits"] == 1
+
+    def test_get_answer_fuses_dense_and_lexical_results(self, mocker):
+        """Tests that hybrid retrieval reranks the RRF fusion of the dense and BM25 results."""
+        # ARRANGE
+        mocker.patch('app.core.pipeline.CrossEncoder')
+        dense = [Document(id="a", page_content="a"), Document(id="b", page_content="b")]
+        lexical = [Document(id="c", page_content="c"), Document(id="b", page_content="b")]
+        mock_vector_store = MagicMock()
+        mock_vector_store.get_retriever.return_value.invoke.return_value = dense
+        mock_lexical_index = MagicMock()
+        mock_lexical_index.search.return_value = lexical
+        mock_llm = MagicMock()
+        mock_llm.invoke.return_value = MagicMock(content="Answer.")
+        pipeline = RagPipeline(mock_vector_store, mock_llm, lexical_index=mock_lexical_index)
+        mock_rerank = mocker.patch.object(pipeline, '_reranker_docuements', side_effect=lambda question, docs, top_n: docs[:top_n])
+
+        # ACT
+        pipeline.get_answer("u1", "d1", "code XR-7700")
+
+        # ASSERT
+        mock_lexical_index.search.assert_called_once_with("code XR-7700", "u1", "d1", k=10)
+        assert [doc.id for doc in mock_rerank.call_args.args[1]] == ["b", "a", "c"]
+
+    def test_get_answer_falls_back_to_dense_when_lexical_search_fails(self, mocker):
+        mocker.patch('app.core.pipeline.CrossEncoder')
+        dense = [Document(id="a", page_content="a")]
+        mock_vector_store = MagicMock()
+        mock_vector_store.get_retriever.return_value.invoke.return_value = dense
+        mock_lexical_index = MagicMock()
+        mock_lexical_index.search.side_effect = RuntimeError("database is locked")
+        mock_llm = MagicMock()
+        mock_llm.invoke.return_value = MagicMock(content="Answer.")
+        pipeline = RagPipeline(mock_vector_store, mock_llm, lexical_index=mock_lexical_index)
+        mock_rerank = mocker.patch.object(pipeline, '_reranker_docuements', side_effect=lambda question, docs, top_n: docs)
+
+        result = pipeline.get_answer("u1", "d1", "question")
+
+        assert mock_rerank.call_args.args[1] == dense
+        assert result["answer"] == "Answer."
+
+    def test_get_answer_fuses_sparse_results_from_one_query_encode(self, mocker):
+        """Tests that sparse mode encodes the question once and fuses dense and sparse results."""
+        # ARRANGE
+        import numpy as np
+        mocker.patch('app.core.pipeline.CrossEncoder')
+        query_vector = np.array([1.0, 0.0], dtype=np.float32)
+        mock_embedding = MagicMock()
+        mock_embedding.embed_query_with_sparse.return_value = (query_vector, {7: 0.5})
+        mock_vector_store = MagicMock()
+        mock_vector_store.similarity_search_by_vector.return_value = [Document(id="a", page_content="a")]
+        mock_sparse_index = MagicMock()
+        mock_sparse_index.search.return_value = [Document(id="b", page_content="b")]
+        mock_llm = MagicMock()
+        mock_llm.invoke.return_value = MagicMock(content="Answer.")
+        pipeline = RagPipeline(mock_vector_store, mock_llm, embedding_service=mock_embedding, sparse_index=mock_sparse_index)
+        mock_rerank = mocker.patch.object(pipeline, '_reranker_docuements', side_effect=lambda question, docs, top_n: docs)
+
+        # ACT
+        pipeline.get_answer("u1", "d1", "question")
+
+        # ASSERT
+        mock_embedding.embed_query_with_sparse.assert_called_once_with("question")
+        mock_embedding.embed_query_array.assert_not_called()
+        assert mock_vector_store.similarity_search_by_vector.call_args.args[0] is query_vector
+        mock_sparse_index.search.assert_called_once_with({7: 0.5}, "u1", "d1", k=10)
+        assert [doc.id for doc in mock_rerank.call_args.args[1]] == ["a", "b"]
+
+    def test_get_answer_searches_cached_document_vectors(self, mocker):
+        """Tests that retrieval uses the in-memory document index and falls back to Chroma when it cannot answer."""
+        # ARRANGE
+        import numpy as np
+        from app.core.document_vector_cache import DocumentVectorCache
+        mocker.patch('app.core.pipeline.CrossEncoder')
+        query_vector = np.array([1.0, 0.0], dtype=np.float32)
+        mock_embedding = MagicMock()
+        mock_embedding.embed_query_array.return_value = query_vector
+        mock_vector_store = MagicMock()
+        mock_vector_store.get_document_vectors.return_value = (
+            [Document(id="a", page_content="a"), Document(id="b", page_content="b")],
+            np.array([[0.0, 1.0], [1.0, 0.0]], dtype=np.float32),
+        )
+        mock_vector_store.similarity_search_by_vector.return_value = [Document(id="z", page_content="z")]
+        mock_llm = MagicMock()
+        mock_llm.invoke.return_value = MagicMock(content="Answer.")
+        vector_cache = MagicMock(wraps=DocumentVectorCache())
+        pipeline = RagPipeline(mock_vector_store, mock_llm, embedding_service=mock_embedding, vector_cache=vector_cache)
+        mock_rerank = mocker.patch.object(pipeline, '_reranker_docuements', side_effect=lambda question, docs, top_n: docs)
+
+        # ACT
+        pipeline.get_answer("u1", "d1", "question")
+        cached_docs = mock_rerank.call_args.args[1]
+        vector_cache.search.side_effect = RuntimeError("out of memory")
+        pipeline.get_answer("u1", "d1", "question")
+
+        # ASSERT
+        assert [doc.id for doc in cached_docs] == ["b", "a"]
+        mock_vector_store.get_document_vectors.assert_called_once_with(
+            {"$and": [{"user_id": {"$eq": "u1"}}, {"document_id": {"$eq": "d1"}}]}, user_id="u1", document_id="d1"
+        )
+        mock_vector_store.similarity_search_by_vector.assert_called_once()
+        assert [doc.id for doc in mock_rerank.call_args.args[1]] == ["z"]
+
+    def test_get_answers_batches_embedding_rerank_and_llm(self, mocker):
+        """Tests that a batch embeds once, reranks all pairs in one predict call and runs the LLM calls as one bounded batch."""
+        # ARRANGE
+        import numpy as np
+        mock_cross_encoder = mocker.patch('app.core.pipeline.CrossEncoder')
+        mock_cross_encoder.return_value.predict.side_effect = lambda pairs: [float(len(text)) for _, text in pairs]
+        mock_embedding = MagicMock()
+        mock_embedding.embed_queries_array.side_effect = lambda texts: np.eye(len(texts), 2, dtype=np.float32)
+        mock_vector_store = MagicMock()
+        mock_vector_store.similarity_search_by_vector.side_effect = [
+            [Document(page_content="a"), Document(page_content="bbb")],
+            [Document(page_content="cc")],
+        ]
+        mock_llm = MagicMock()
+        mock_llm.batch.return_value = [MagicMock(content="First."), MagicMock(content="Second.")]
+        pipeline = RagPipeline(mock_vector_store, mock_llm, embedding_service=mock_embedding, llm_concurrency=4)
+
+        # ACT
+        results = pipeline.get_answers("u1", "d1", ["one?", "two?"])
+
+        # ASSERT
+        mock_embedding.embed_queries_array.assert_called_once_with(["one?", "two?"])
+        mock_embedding.embed_query_array.assert_not_called()
+        pairs = mock_cross_encoder.return_value.predict.call_args.args[0]
+        assert mock_cross_encoder.return_value.predict.call_count == 1
+        assert pairs == [["one?", "a"], ["one?", "bbb"], ["two?", "cc"]]
+        prompts = mock_llm.batch.call_args.args[0]
+        assert len(prompts) == 2 and "one?" in prompts[0] and "two?" in prompts[1]
+        assert mock_llm.batch.call_args.kwargs == {"config": {"max_concurrency": 4}, "return_exceptions": True}
+        mock_llm.invoke.assert_not_called()
+        assert [result["answer"] for result in results] == ["First.", "Second."]
+        assert [source["page_content"] for source in results[0]["sources"]] == ["bbb", "a"]
+
+    def test_get_answers_reports_errors_per_question(self, mocker):
+        """Tests that cached, failed and empty questions each get their own entry, in request order."""
+        # ARRANGE
+        from app.core.answer_cache import AnswerCache
+        mocker.patch('app.core.pipeline.CrossEncoder')
+        def retrieve(question):
+            if question == "broken?":
+                raise RuntimeError("index unavailable")
+            return [] if question == "empty?" else [Document(page_content=question)]
+        mock_vector_store = MagicMock()
+        mock_vector_store.get_retriever.return_value.invoke.side_effect = retrieve
+        mock_llm = MagicMock(model="gemini-2.0-flash", temperature=0.2)
+        mock_llm.batch.return_value = [MagicMock(content="Answer."), ValueError("quota exceeded")]
+        cache = AnswerCache()
+        pipeline = RagPipeline(mock_vector_store, mock_llm, answer_cache=cache)
+        mocker.patch.object(pipeline, '_rerank_many', side_effect=lambda questions, docs_lists, top_n: docs_lists)
+        cached = {"answer": "Cached.", "sources": []}
+        cache.put(cache.make_key("u1", "d1", "cached?", pipeline._answer_settings()), "d1", cached, cache.generation("d1"))
+
+        # ACT
+        results = pipeline.get_answers("u1", "d1", ["ok?", "cached?", "broken?", "empty?", "quota?"])
+
+        # ASSERT
+        assert results[0]["answer"] == "Answer."
+        assert results[1] == cached
+        assert results[2] == {"error": "Retrieval failed: index unavailable"}
+        assert results[3]["sources"] == []
+        assert results[4] == {"error": "LLM call failed: quota exceeded"}
+        assert len(mock_llm.batch.call_args.args[0]) == 2
+        # Only the successful answer is cached.
+        assert pipeline.get_answers("u1", "d1", ["ok?"]) == [results[0]]
+        assert mock_llm.batch.call_count == 1
+
+    async def test_aget_answer_awaits_llm_and_offloads_blocking_work(self, mocker):
+        """Tests that the async path prepares on the query executor and awaits the LLM's async API."""
+        # ARRANGE
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        mocker.patch('app.core.pipeline.CrossEncoder')
+        loop_thread = threading.current_thread()
+        retrieval_threads = []
+        def retrieve(question):
+            retrieval_threads.append(threading.current_thread())
+            return [Document(page_content="doc", metadata={})]
+        mock_vector_store = MagicMock()
+        mock_vector_store.get_retriever.return_value.invoke.side_effect = retrieve
+        mock_llm = MagicMock()
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content="Async answer."))
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-test")
+        pipeline = RagPipeline(mock_vector_store, mock_llm, executor=executor)
+        mocker.patch.object(pipeline, '_reranker_docuements', side_effect=lambda question, docs, top_n: docs)
+
+        # ACT
+        result = await pipeline.aget_answer("u1", "d1", "question")
+        executor.shutdown()
+
+        # ASSERT
+        assert result["answer"] == "Async answer."
+        mock_llm.ainvoke.assert_awaited_once()
+        mock_llm.invoke.assert_not_called()
+        assert retrieval_threads[0] is not loop_thread
+        assert retrieval_threads[0].name.startswith("query-test")
+
+    async def test_async_llm_calls_are_bounded_by_llm_concurrency(self, mocker):
+        """Tests that concurrent queries and batch items never have more than llm_concurrency LLM calls in flight."""
+        # ARRANGE
+        import asyncio
+        mocker.patch('app.core.pipeline.CrossEncoder')
+        mock_vector_store = MagicMock()
+        mock_vector_store.get_retriever.return_value.invoke.side_effect = lambda question: [Document(page_content=question)]
+        in_flight = 0
+        peak = 0
+        async def ainvoke(prompt):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            if "fail?" in prompt:
+                raise ValueError("quota exceeded")
+            return MagicMock(content="Answer.")
+        mock_llm = MagicMock()
+        mock_llm.ainvoke = ainvoke
+        pipeline = RagPipeline(mock_vector_store, mock_llm, llm_concurrency=2)
+        mocker.patch.object(pipeline, '_rerank_many', side_effect=lambda questions, docs_lists, top_n: docs_lists)
+
+        # ACT
+        single = [pipeline.aget_answer("u1", "d1", f"q{i}?") for i in range(4)]
+        batch = pipeline.aget_answers("u1", "d1", ["a?", "fail?", "b?"])
+        *answers, batch_results = await asyncio.gather(*single, batch)
+
+        # ASSERT
+        assert peak == 2
+        assert all(answer["answer"] == "Answer." for answer in answers)
+        assert batch_results[0]["answer"] == "Answer."
+        assert batch_results[1] == {"error": "LLM call failed: quota exceeded"}
+        assert batch_results[2]["answer"] == "Answer."
+
+    async def test_missing_llm_raises_not_configured(self, mocker):
+        """Tests that every answer path fails fast with LLMNotConfiguredError instead of calling None."""
+        from app.core.pipeline import LLMNotConfiguredError
+        mocker.patch('app.core.pipeline.CrossEncoder')
+        mock_vector_store = MagicMock()
+        pipeline = RagPipeline(mock_vector_store, llm=None)
+
+        with pytest.raises(LLMNotConfiguredError):
+            pipeline.get_answer("u1", "d1", "q?")
+        with pytest.raises(LLMNotConfiguredError):
+            pipeline.get_answers("u1", "d1", ["q?"])
+        with pytest.raises(LLMNotConfiguredError):
+            await pipeline.aget_answer("u1", "d1", "q?")
+        with pytest.raises(LLMNotConfiguredError):
+            await pipeline.aget_answers("u1", "d1", ["q?"])
+        mock_vector_store.get_retriever.assert_not_called()
+
     def test_build_prompt_logic(self):
         """Unit Test: Verifies the prompt is built correctly."""
         # ARRANGE
@@ -0,0 +1,30 @@
+from langchain_core.documents import Document
+
+from app.core.rank_fusion import chunk_key, reciprocal_rank_fusion
+
+
+def _doc(chunk_id):
+    return Document(id=chunk_id, page_content=f"text of {chunk_id}")
+
+## Test Cases ##
+
+def test_chunks_found_by_both_retrievers_rank_first():
+    """Tests that RRF promotes chunks ranked by both lists and returns each chunk once."""
+    # ARRANGE
+    dense = [_doc("a"), _doc("b"), _doc("c")]
+    lexical = [_doc("c"), _doc("d")]
+
+    # ACT
+    fused = reciprocal_rank_fusion([dense, lexical], limit=3)
+
+    # ASSERT: b and d tie on 1/62; the dense result comes first
+    assert [doc.id for doc in fused] == ["c", "a", "b"]
+
+def test_empty_ranking_keeps_the_other_order():
+    dense = [_doc("a"), _doc("b")]
+
+    assert reciprocal_rank_fusion([dense, []]) == dense
+
+def test_chunk_key_falls_back_to_file_and_chunk_number():
+    assert chunk_key(Document(page_content="x", metadata={"file_id": "f", "chunk_number": 3})) == "f_chunk_3"
+    assert chunk_key(Document(page_content="x")) == "x"
@@ -0,0 +1,54 @@
+import pytest
+from unittest.mock import MagicMock
+
+from app.core.readiness import ServiceReadiness
+
+
+@pytest.mark.asyncio
+class TestServiceReadiness:
+
+    async def test_ready_after_all_loaders_succeed(self):
+        """Tests that the service reports ready only after every component has loaded."""
+        # ARRANGE
+        readiness = ServiceReadiness()
+        embedding_loader = MagicMock()
+        rerank_loader = MagicMock()
+        assert not readiness.is_ready
+
+        # ACT
+        result = await readiness.load({"embedding_model": embedding_loader, "cross_encoder": rerank_loader})
+
+        # ASSERT
+        assert result is True
+        embedding_loader.assert_called_once()
+        rerank_loader.assert_called_once()
+        assert readiness.to_dict() == {
+            "status": "ready",
+            "components": {"embedding_model": "ready", "cross_encoder": "ready"},
+            "errors": {},
+        }
+
+    async def test_failed_loader_is_reported(self):
+        """Tests that a failing loader marks its component failed without hiding the others."""
+        readiness = ServiceReadiness()
+
+        result = await readiness.load({
+            "embedding_model": MagicMock(side_effect=OSError("model not found")),
+            "cross_encoder": MagicMock(),
+        })
+
+        assert result is False
+        state = readiness.to_dict()
+        assert state["status"] == "failed"
+        assert state["components"] == {"embedding_model": "failed", "cross_encoder": "ready"}
+        assert state["errors"]["embedding_model"] == "model not found"
+
+    async def test_mark_failed_blocks_readiness(self):
+        """Tests that a configuration failure keeps the service unready even when models load."""
+        readiness = ServiceReadiness()
+        readiness.mark_failed("llm", "GOOGLE_API_KEY is not set.")
+
+        await readiness.load({"embedding_model": MagicMock()})
+
+        assert not readiness.is_ready
+        assert readiness.to_dict()["errors"] == {"llm": "GOOGLE_API_KEY is not set."}
@@ -0,0 +1,66 @@
+from langchain_core.documents import Document
+
+from app.core.rerank_cache import RerankScoreCache
+
+
+def _chunk(text, number, document_id="d1", content_hash=None):
+    metadata = {"file_id": "f1", "chunk_number": number, "document_id": document_id}
+    if content_hash is not None:
+        metadata["content_hash"] = content_hash
+    return Document(page_content=text, metadata=metadata)
+
+## Test Cases ##
+
+def test_scores_are_shared_by_normalized_questions():
+    """Tests that a retried question with different case/whitespace reuses the stored scores."""
+    # ARRANGE
+    cache = RerankScoreCache()
+    docs = [_chunk("a", 0, content_hash="ha"), _chunk("b", 1, content_hash="hb")]
+    cache.put_many(cache.make_keys("model", "When is  registration?", docs), [0.25, 0.75], ["d1", "d1"])
+
+    # ACT
+    scores = cache.get_many(cache.make_keys("model", "when is registration?", docs))
+
+    # ASSERT
+    assert scores == [0.25, 0.75]
+    assert cache.stats()["hits"] == 2
+
+def test_model_and_content_hash_are_part_of_the_key():
+    cache = RerankScoreCache()
+    doc = _chunk("a", 0, content_hash="v1")
+    cache.put_many(cache.make_keys("model", "q", [doc]), [0.5], ["d1"])
+
+    assert cache.get_many(cache.make_keys("other-model", "q", [doc])) == [None]
+    assert cache.get_many(cache.make_keys("model", "q", [_chunk("a2", 0, content_hash="v2")])) == [None]
+    assert cache.stats()["misses"] == 2
+
+def test_chunk_identity_falls_back_to_text_hash():
+    identity = RerankScoreCache.chunk_identity(Document(page_content="text"))
+
+    assert identity[0] == ""
+    assert identity == RerankScoreCache.chunk_identity(Document(page_content="text"))
+    assert identity != RerankScoreCache.chunk_identity(Document(page_content="other"))
+
+def test_least_recently_used_scores_are_evicted():
+    cache = RerankScoreCache(max_entries=2)
+    keys = cache.make_keys("model", "q", [_chunk("a", 0), _chunk("b", 1), _chunk("c", 2)])
+    cache.put_many(keys[:2], [0.1, 0.2], ["d1", "d1"])
+    cache.get_many([keys[0]])
+
+    cache.put_many(keys[2:], [0.3], ["d1"])
+
+    assert cache.get_many(keys) == [0.1, None, 0.3]
+
+def test_rewritten_document_drops_its_scores():
+    """Tests that re-ingesting a document evicts its chunks' scores and keeps other documents'."""
+    # ARRANGE
+    cache = RerankScoreCache()
+    keys = cache.make_keys("model", "q", [_chunk("a", 0, "d1"), _chunk("b", 0, "d2")])
+    cache.put_many(keys, [0.1, 0.2], ["d1", "d2"])
+
+    # ACT
+    cache.on_document_changed("u1", "d1")
+
+    # ASSERT
+    assert cache.get_many(keys) == [None, 0.2]
+    assert cache.stats()["entries"] == 1
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+
+from app.core.semantic_answer_cache import SemanticAnswerCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def _vector(*values):
+    return np.array(values, dtype=np.float32)
+
+## Test Cases ##
+
+def test_similar_question_hits_and_dissimilar_misses(clock):
+    """Tests that a paraphrase above the threshold reuses the answer and an unrelated question does not."""
+    # ARRANGE
+    cache = SemanticAnswerCache(threshold=0.9, clock=clock)
+    cache.put("u1", "d1", _vector(1.0, 0.0, 0.0), {"answer": "Oct 15"}, generation=0)
+
+    # ACT
+    paraphrase = cache.get("u1", "d1", _vector(0.95, 0.05, 0.0))
+    unrelated = cache.get("u1", "d1", _vector(0.0, 1.0, 0.0))
+
+    # ASSERT
+    assert paraphrase[0] == {"answer": "Oct 15"}
+    assert paraphrase[1] > 0.9
+    assert unrelated is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_questions_with_different_numbers_or_negation_do_not_match(clock):
+    """Tests that near-identical embeddings still miss when the questions differ in a number or in negation."""
+    # ARRANGE
+    cache = SemanticAnswerCache(threshold=0.9, clock=clock)
+    cache.put("u1", "d1", _vector(1.0, 0.0), "total 2566", generation=0, question="What is the total in 2566?")
+    cache.put("u1", "d1", _vector(0.0, 1.0), "approved", generation=0, question="Which items were approved?")
+
+    # ACT
+    other_year = cache.get("u1", "d1", _vector(1.0, 0.0), question="What is the total in 2567?")
+    same_year = cache.get("u1", "d1", _vector(0.99, 0.01), question="what's the total for 2566")
+    negated = cache.get("u1", "d1", _vector(0.0, 1.0), question="Which items were not approved?")
+
+    # ASSERT
+    assert other_year is None
+    assert same_year[0] == "total 2566"
+    assert negated is None
+
+def test_vectors_are_compared_by_cosine_similarity(clock):
+    cache = SemanticAnswerCache(threshold=0.99, clock=clock)
+    cache.put("u1", "d1", _vector(2.0, 0.0), "a", generation=0)
+
+    assert cache.get("u1", "d1", _vector(0.5, 0.0))[0] == "a"
+
+def test_users_documents_and_settings_are_isolated(clock):
+    cache = SemanticAnswerCache(threshold=0.9, clock=clock)
+    cache.put("u1", "d1", _vector(1.0, 0.0), "a", generation=0, settings=("gemini", 0.2))
+
+    assert cache.get("u2", "d1", _vector(1.0, 0.0), ("gemini", 0.2)) is None
+    assert cache.get("u1", "d2", _vector(1.0, 0.0), ("gemini", 0.2)) is None
+    assert cache.get("u1", "d1", _vector(1.0, 0.0), ("gemini", 0.7)) is None
+    assert cache.get("u1", "d1", _vector(1.0, 0.0), ("gemini", 0.2))[0] == "a"
+
+def test_entries_expire_after_ttl(clock):
+    cache = SemanticAnswerCache(ttl_seconds=10, clock=clock)
+    cache.put("u1", "d1", _vector(1.0, 0.0), "a", generation=0)
+
+    clock.now = 10.0
+
+    assert cache.get("u1", "d1", _vector(1.0, 0.0)) is None
+    assert cache.stats()["entries"] == 0
+
+def test_least_recently_used_entry_is_evicted_when_full(clock):
+    # ARRANGE
+    cache = SemanticAnswerCache(threshold=0.99, max_entries_per_document=2, clock=clock)
+    cache.put("u1", "d1", _vector(1.0, 0.0, 0.0), "x", generation=0)
+    clock.now = 1.0
+    cache.put("u1", "d1", _vector(0.0, 1.0, 0.0), "y", generation=0)
+    clock.now = 2.0
+    cache.get("u1", "d1", _vector(1.0, 0.0, 0.0))
+
+    # ACT
+    clock.now = 3.0
+    cache.put("u1", "d1", _vector(0.0, 0.0, 1.0), "z", generation=0)
+
+    # ASSERT
+    assert cache.get("u1", "d1", _vector(0.0, 1.0, 0.0)) is None
+    assert cache.get("u1", "d1", _vector(1.0, 0.0, 0.0))[0] == "x"
+    assert cache.get("u1", "d1", _vector(0.0, 0.0, 1.0))[0] == "z"
+
+def test_document_change_invalidates_every_user_of_that_document(clock):
+    """Tests that re-ingesting a document drops its answers and blocks answers computed before it."""
+    # ARRANGE
+    cache = SemanticAnswerCache(clock=clock)
+    generation = cache.generation("d1")
+    cache.put("u1", "d1", _vector(1.0, 0.0), "a", generation)
+    cache.put("u2", "d1", _vector(1.0, 0.0), "b", generation)
+    cache.put("u1", "d2", _vector(1.0, 0.0), "c", cache.generation("d2"))
+
+    # ACT
+    cache.on_document_changed("u1", "d1")
+    stored = cache.put("u1", "d1", _vector(0.0, 1.0), "stale", generation)
+
+    # ASSERT
+    assert stored is False
+    assert cache.get("u1", "d1", _vector(1.0, 0.0)) is None
+    assert cache.get("u2", "d1", _vector(1.0, 0.0)) is None
+    assert cache.get("u1", "d2", _vector(1.0, 0.0))[0] == "c"
+    assert cache.stats()["invalidations"] == 1
+
+def test_invalid_threshold_raises():
+    with pytest.raises(ValueError):
+        SemanticAnswerCache(threshold=0.0)
@@ -0,0 +1,179 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+
+from app.core.sidecar import (
+    DocumentChangeFeed,
+    RemoteCrossEncoder,
+    RemoteEmbeddingService,
+    SidecarClient,
+    SidecarError,
+    SidecarServer,
+)
+
+## Fixtures ##
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are limited to ~100 bytes, too short for pytest's tmp_path.
+    directory = tempfile.mkdtemp(prefix="sidecar-")
+    yield os.path.join(directory, "s.sock")
+    shutil.rmtree(directory, ignore_errors=True)
+
+@pytest.fixture
+def embedding_service():
+    service = MagicMock()
+    service.embed_documents_array.side_effect = lambda texts: np.ones((len(texts), 3), dtype=np.float32)
+    service.embed_query_array.return_value = np.full(3, 0.5, dtype=np.float32)
+    return service
+
+@pytest.fixture
+def cross_encoder():
+    model = MagicMock()
+    model.predict.side_effect = lambda pairs: np.arange(len(pairs), dtype=np.float32)
+    return model
+
+@pytest.fixture
+def cross_encoder_loader(cross_encoder):
+    return MagicMock(return_value=cross_encoder)
+
+@pytest.fixture
+def server(socket_path, embedding_service, cross_encoder_loader):
+    server = SidecarServer(socket_path, embedding_service, cross_encoder_loader=cross_encoder_loader, authkey=b"secret")
+    server.start()
+    yield server
+    server.close()
+
+@pytest.fixture
+def client(server):
+    client = SidecarClient(server.address, authkey=b"secret")
+    yield client
+    client.close()
+
+## Test Cases ##
+
+def test_remote_embedding_service_runs_on_the_sidecar(client, embedding_service):
+    """Tests that a worker's embedding calls return the sidecar service's arrays."""
+    # ARRANGE
+    remote = RemoteEmbeddingService(client)
+
+    # ACT
+    documents = remote.embed_documents_array(["a", "b"])
+    query = remote.embed_query("q")
+
+    # ASSERT
+    assert documents.shape == (2, 3) and documents.dtype == np.float32
+    assert query == [0.5, 0.5, 0.5]
+    embedding_service.embed_documents_array.assert_called_once_with(["a", "b"])
+    assert remote.embed_documents_array([]).shape == (0, 0)
+
+def test_remote_cross_encoder_loads_the_model_once(client, cross_encoder, cross_encoder_loader):
+    """Tests that reranks from several threads share the one model loaded by the sidecar."""
+    # ARRANGE
+    remote = RemoteCrossEncoder(client)
+    results = []
+
+    # ACT
+    threads = [threading.Thread(target=lambda: results.append(remote.predict([("q", "a"), ("q", "b")]))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # ASSERT
+    cross_encoder_loader.assert_called_once_with()
+    assert len(results) == 4
+    assert all(list(scores) == [0.0, 1.0] for scores in results)
+    assert cross_encoder.predict.call_count == 4
+    cross_encoder.predict.assert_called_with([["q", "a"], ["q", "b"]])
+
+def test_errors_are_raised_in_the_worker(client, embedding_service):
+    """Tests that an exception on the sidecar surfaces as a SidecarError and the connection stays usable."""
+    # ARRANGE
+    embedding_service.embed_query_array.side_effect = [RuntimeError("model not loaded"), np.zeros(3, dtype=np.float32)]
+
+    # ACT & ASSERT
+    with pytest.raises(SidecarError, match="RuntimeError: model not loaded"):
+        client.call("embed_query_array", "q")
+    with pytest.raises(SidecarError, match="Unknown sidecar method"):
+        client.call("__init__")
+    assert client.call("embed_query_array", "q").shape == (3,)
+
+def test_unreachable_sidecar_raises_sidecar_error(socket_path):
+    """Tests that a worker gets a SidecarError when no sidecar listens on the socket."""
+    client = SidecarClient(socket_path)
+
+    with pytest.raises(SidecarError, match="unreachable"):
+        client.call("embedding_stats")
+
+def test_job_states_are_shared_and_bounded(socket_path, embedding_service, cross_encoder):
+    """Tests that job states put by one worker are read by another, and old ones are dropped."""
+    # ARRANGE
+    server = SidecarServer(socket_path, embedding_service, lambda: cross_encoder, max_jobs=2)
+    server.start()
+    producer, poller = SidecarClient(socket_path), SidecarClient(socket_path)
+
+    # ACT
+    for job_id in ("j1", "j2", "j3"):
+        producer.put_job({"job_id": job_id, "status": "queued"})
+    producer.put_job({"job_id": "j2", "status": "finished"})
+
+    # ASSERT
+    assert poller.get_job("j2") == {"job_id": "j2", "status": "finished"}
+    assert poller.get_job("j3") == {"job_id": "j3", "status": "queued"}
+    assert poller.get_job("j1") is None
+    producer.close()
+    poller.close()
+    server.close()
+
+def test_change_feed_applies_other_workers_changes_only(server):
+    """Tests that each worker's listeners run for documents changed by the other workers."""
+    # ARRANGE
+    ingester, follower = SidecarClient(server.address, authkey=b"secret"), SidecarClient(server.address, authkey=b"secret")
+    ingester_listener, follower_listener = MagicMock(), MagicMock()
+    ingester_feed = DocumentChangeFeed(ingester, [ingester_listener])
+    follower_feed = DocumentChangeFeed(follower, [follower_listener])
+    ingester.publish_document_changed("u0", "before-start")
+    ingester_feed.poll()
+    follower_feed.poll()
+
+    # ACT
+    ingester.publish_document_changed("u1", "d1")
+    applied = follower_feed.poll()
+    ingester_feed.poll()
+
+    # ASSERT: changes from before the worker started are skipped, its own are not replayed
+    assert applied == 1
+    follower_listener.assert_called_once_with("u1", "d1")
+    ingester_listener.assert_not_called()
+    assert follower_feed.poll() == 0
+    ingester.close()
+    follower.close()
+
+def test_change_feed_replays_the_log_after_a_sidecar_restart(server):
+    """Tests that a new sidecar epoch resets the feed instead of skipping its first changes."""
+    # ARRANGE
+    ingester, follower = SidecarClient(server.address, authkey=b"secret"), SidecarClient(server.address, authkey=b"secret")
+    listener = MagicMock()
+    feed = DocumentChangeFeed(follower, [listener])
+    for document_id in ("d1", "d2", "d3"):
+        ingester.publish_document_changed("u1", document_id)
+    feed.poll()
+
+    # ACT: a restarted sidecar starts numbering from 1 again
+    server.epoch = "restarted"
+    server._changes.clear()
+    server._sequence = 0
+    ingester.publish_document_changed("u1", "d4")
+    applied = feed.poll()
+
+    # ASSERT
+    assert applied == 1
+    listener.assert_called_once_with("u1", "d4")
+    ingester.close()
+    follower.close()
@@ -0,0 +1,52 @@
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.core.span_splitter import SpanSplitter
+
+
+def reference_split(text, chunk_size, chunk_overlap):
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""]
+    )
+    return splitter.split_text(text)
+
+## Test Cases ##
+
+@pytest.mark.parametrize("text, chunk_size, chunk_overlap", [
+    ("", 10, 0),
+    ("short text", 100, 10),
+    ("word " * 200, 50, 10),
+    ("First paragraph.\n\nSecond paragraph is longer.\nIt has two lines.\n\n   \n\nThird.", 30, 5),
+    ("สวัสดีครับ นี่คือเอกสารภาษาไทย " * 30, 40, 8),
+    ("x" * 250 + " tail words here", 60, 0),
+    ("  leading and trailing whitespace  \n\n  more  ", 12, 4),
+    ("a\n\n\nb\n\n\n\nc " * 20 + "word " * 20, 9, 3),
+])
+def test_matches_recursive_character_text_splitter(text, chunk_size, chunk_overlap):
+    """Tests that span-based splitting yields exactly the chunks of RecursiveCharacterTextSplitter."""
+    # ACT
+    spans = SpanSplitter(chunk_size, chunk_overlap).split(text)
+
+    # ASSERT
+    assert [text[start:end] for start, end in spans] == reference_split(text, chunk_size, chunk_overlap)
+
+def test_custom_span_length():
+    """Tests that chunks are sized by the given span length function instead of characters."""
+    # ARRANGE: count words instead of characters
+    text = "one two three four five six seven"
+
+    def word_count(start, end):
+        return len(text[start:end].split())
+
+    # ACT
+    spans = SpanSplitter(chunk_size=3, chunk_overlap=0).split(text, word_count)
+
+    # ASSERT
+    assert [text[start:end] for start, end in spans] == ["one two three", "four five six", "seven"]
+
+def test_overlap_larger_than_size_is_rejected():
+    with pytest.raises(ValueError):
+        SpanSplitter(chunk_size=10, chunk_overlap=20)
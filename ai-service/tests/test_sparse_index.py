@@ -0,0 +1,55 @@
+import pytest
+from langchain_core.documents import Document
+
+from app.core.sparse_index import SparseIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    sparse_index = SparseIndex(path=str(tmp_path / "chroma" / "documents_sparse.sqlite3"))
+    yield sparse_index
+    sparse_index.close()
+
+
+def _chunk(text, user_id="u1", document_id="d1"):
+    return Document(page_content=text, metadata={"user_id": user_id, "document_id": document_id})
+
+## Test Cases ##
+
+def test_search_ranks_by_sparse_dot_product(index):
+    """Tests that chunks are scored by the sum of query weight x chunk weight over shared tokens."""
+    # ARRANGE
+    index.upsert(
+        [_chunk("a"), _chunk("b"), _chunk("c")],
+        ["c0", "c1", "c2"],
+        [{10: 0.5, 11: 0.1}, {10: 0.1, 12: 0.9}, {13: 1.0}],
+    )
+
+    # ACT
+    results = index.search({10: 1.0, 12: 0.5}, "u1", "d1", k=5)
+
+    # ASSERT: c1 = 0.1 + 0.45, c0 = 0.5; c2 shares no token
+    assert [doc.id for doc in results] == ["c1", "c0"]
+    assert results[0].page_content == "b"
+
+def test_zero_weights_are_not_indexed_or_queried(index):
+    index.upsert([_chunk("a")], ["c0"], [{10: 0.0, 11: 0.2}])
+
+    assert index.search({10: 1.0}, "u1", "d1") == []
+    assert index.stats() == {"chunks": 1, "postings": 1}
+
+def test_search_is_scoped_and_upsert_replaces(index):
+    # ARRANGE
+    index.upsert([_chunk("old"), _chunk("other user", user_id="u2")], ["c0", "c1"], [{10: 1.0}, {10: 1.0}])
+
+    # ACT
+    index.upsert([_chunk("new")], ["c0"], [{11: 1.0}])
+
+    # ASSERT
+    assert index.search({10: 1.0}, "u1", "d1") == []
+    assert [doc.page_content for doc in index.search({11: 1.0}, "u1", "d1")] == ["new"]
+    assert index.missing_ids(["c0", "c9"]) == ["c9"]
+
+def test_upsert_rejects_mismatched_weights(index):
+    with pytest.raises(ValueError):
+        index.upsert([_chunk("a")], ["c0"], [])
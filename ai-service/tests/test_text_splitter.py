@@ -72,7 +72,7 @@ def test_split_documents(mocker):
     mock_splitter_instance = mock_splitter_class.return_value
     mock_splitter_instance.split_documents.return_value = fake_chunks
     
-    service = TextSplitterService()
+    service = TextSplitterService(engine='langchain')
 
     # ACT
     result_chunks = service.split_documents(input_docs)
@@ -99,4 +99,82 @@ def test_split_documents_with_empty_list(mocker):
 
     # ASSERT
     assert result == []
-    service.text_splitter.split_documents.assert_not_called()
\ No newline at end of file
+    service.text_splitter.split_documents.assert_not_called()
+
+def test_span_engine_matches_langchain_and_records_offsets():
+    """
+    Tests that the default span engine returns the same chunks as RecursiveCharacterTextSplitter,
+    with the character offsets of each chunk in its page.
+    """
+    # ARRANGE
+    text = "First paragraph about cats.\n\nSecond paragraph, a bit longer, about dogs and birds.\nLast line."
+    docs = [Document(page_content=text, metadata={"page": 3})]
+
+    # ACT
+    span_chunks = TextSplitterService(chunk_size=40, chunk_overlap=10).split_documents(docs)
+    langchain_chunks = TextSplitterService(chunk_size=40, chunk_overlap=10, engine='langchain').split_documents(docs)
+
+    # ASSERT
+    assert [c.page_content for c in span_chunks] == [c.page_content for c in langchain_chunks]
+    for chunk in span_chunks:
+        assert text[chunk.metadata["start_index"]:chunk.metadata["end_index"]] == chunk.page_content
+        assert chunk.metadata["page"] == 3
+
+def fake_tokenizer(texts, **kwargs):
+    """Whitespace tokenizer returning character offsets like a fast tokenizer."""
+    import re
+    return {"offset_mapping": [[(m.start(), m.end()) for m in re.finditer(r"\S+", text)] for text in texts]}
+
+def test_split_documents_by_tokens(mocker):
+    """
+    Tests that token mode sizes chunks by the tighter of the embedding and rerank budgets,
+    tokenizing each model's input once per batch.
+    """
+    # ARRANGE: the rerank tokenizer counts every word twice
+    embed_tokenizer = mocker.Mock(side_effect=fake_tokenizer)
+    rerank_tokenizer = mocker.Mock(side_effect=lambda texts, **kwargs: {
+        "offset_mapping": [[span for span in offsets for _ in range(2)] for offsets in fake_tokenizer(texts)["offset_mapping"]]
+    })
+    mock_auto = mocker.patch('app.core.text_splitter.AutoTokenizer')
+    mock_auto.from_pretrained.side_effect = lambda name: {"embed": embed_tokenizer, "rerank": rerank_tokenizer}[name]
+    service = TextSplitterService(
+        mode='tokens',
+        embed_tokenizer_name='embed',
+        embed_token_budget=8,
+        rerank_tokenizer_name='rerank',
+        rerank_token_budget=8,
+        token_overlap=0,
+    )
+    docs = [
+        Document(page_content="one two three four five six seven eight nine ten", metadata={"page": 1}),
+        Document(page_content="alpha beta", metadata={"page": 2}),
+    ]
+
+    # ACT
+    chunks = service.split_documents(docs)
+
+    # ASSERT: at most 4 words per chunk, since 4 words are 8 rerank tokens
+    assert [chunk.page_content for chunk in chunks] == [
+        "one two three four", "five six seven eight", "nine ten", "alpha beta"
+    ]
+    assert [chunk.metadata["page"] for chunk in chunks] == [1, 1, 1, 2]
+    assert [(chunk.metadata["start_index"], chunk.metadata["end_index"]) for chunk in chunks[:2]] == [(0, 18), (19, 39)]
+    embed_tokenizer.assert_called_once()
+    rerank_tokenizer.assert_called_once()
+
+def test_split_documents_by_tokens_without_rerank_budget(mocker):
+    """Tests that only the embedding budget applies when the rerank budget is disabled."""
+    mock_auto = mocker.patch('app.core.text_splitter.AutoTokenizer')
+    mock_auto.from_pretrained.return_value = mocker.Mock(side_effect=fake_tokenizer)
+    service = TextSplitterService(mode='tokens', embed_tokenizer_name='embed', embed_token_budget=6, rerank_token_budget=None, token_overlap=0)
+
+    chunks = service.split_documents([Document(page_content="a b c d e f g h")])
+
+    assert [chunk.page_content for chunk in chunks] == ["a b c d e f", "g h"]
+    mock_auto.from_pretrained.assert_called_once_with('embed')
+
+def test_invalid_mode_or_engine():
+    with pytest.raises(ValueError):
+        TextSplitterService(mode='sentences')
+    with pytest.raises(ValueError):
+        TextSplitterService(mode='tokens', engine='langchain')
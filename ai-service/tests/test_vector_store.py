@@ -1,6 +1,8 @@
 import pytest
+import numpy as np
 from langchain_core.documents import Document
 from unittest.mock import MagicMock
+from chromadb.errors import NotFoundError
 
 # Replace with the actual path to your VectorStoreService class
 from app.core.vector_store import VectorStoreService
@@ -10,8 +12,9 @@ from app.core.vector_store import VectorStoreService
 @pytest.fixture
 def mocked_service(mocker):
     """Mocks the Chroma class and returns an instance of VectorStoreService."""
-    # Mock the entire Chroma class
+    # Mock the entire Chroma class and the client it is given
     mock_chroma_class = mocker.patch('app.core.vector_store.Chroma')
+    mocker.patch('app.core.vector_store.chromadb.PersistentClient')
     
     # Create a fake embedding function, as the constructor requires it
     fake_embedding_function = MagicMock()
@@ -29,6 +32,7 @@ def test_initialization(mocker):
     """Tests that the Chroma database is initialized with the correct parameters."""
     # ARRANGE
     mock_chroma_class = mocker.patch('app.core.vector_store.Chroma')
+    mock_client_class = mocker.patch('app.core.vector_store.chromadb.PersistentClient')
     fake_embedding_function = MagicMock()
 
     # ACT
@@ -39,12 +43,28 @@ def test_initialization(mocker):
     )
 
     # ASSERT
+    mock_client_class.assert_called_once_with(path='./test_db')
     mock_chroma_class.assert_called_once_with(
         collection_name='test_collection',
         embedding_function=fake_embedding_function,
-        persist_directory='./test_db'
+        client=mock_client_class.return_value,
     )
 
+def test_initialization_with_chroma_server(mocker):
+    """Tests that a server host connects to a Chroma server instead of the embedded store."""
+    # ARRANGE
+    mock_chroma_class = mocker.patch('app.core.vector_store.Chroma')
+    mock_persistent_class = mocker.patch('app.core.vector_store.chromadb.PersistentClient')
+    mock_http_class = mocker.patch('app.core.vector_store.chromadb.HttpClient')
+
+    # ACT
+    VectorStoreService(embedding_function=MagicMock(), server_host='chroma', server_port=8001)
+
+    # ASSERT
+    mock_persistent_class.assert_not_called()
+    mock_http_class.assert_called_once_with(host='chroma', port=8001)
+    assert mock_chroma_class.call_args.kwargs["client"] is mock_http_class.return_value
+
 def test_upsert_documents(mocked_service):
     """Tests that the add_documents method is called correctly."""
     # ARRANGE
@@ -69,6 +89,55 @@ def test_upsert_documents_mismatched_lengths(mocked_service):
     
     mocked_service._vector_store.add_documents.assert_not_called()
 
+def test_upsert_embeddings(mocked_service):
+    """Tests that precomputed vectors are written straight to the Chroma collection."""
+    # ARRANGE
+    docs = [Document(page_content="doc1", metadata={"file_id": "f"}), Document(page_content="doc2")]
+    ids = ["id1", "id2"]
+    embeddings = np.array([[0.1, 0.2], [0.3, 0.4]], dtype=np.float64)
+
+    # ACT
+    mocked_service.upsert_embeddings(documents=docs, ids=ids, embeddings=embeddings)
+
+    # ASSERT
+    mocked_service._vector_store.add_documents.assert_not_called()
+    kwargs = mocked_service._vector_store._collection.upsert.call_args.kwargs
+    assert kwargs['ids'] == ids
+    assert kwargs['documents'] == ["doc1", "doc2"]
+    assert kwargs['metadatas'] == [{"file_id": "f"}, None]
+    assert kwargs['embeddings'].dtype == np.float32
+
+def test_upsert_embeddings_mismatched_lengths(mocked_service):
+    """Tests that a ValueError is raised when embeddings and documents disagree in length."""
+    docs = [Document(page_content="doc1")]
+
+    with pytest.raises(ValueError, match="The number of documents, IDs and embeddings must match."):
+        mocked_service.upsert_embeddings(documents=docs, ids=["id1"], embeddings=np.zeros((2, 2)))
+
+    mocked_service._vector_store._collection.upsert.assert_not_called()
+
+def test_get_chunk_hashes(mocked_service):
+    """Tests that stored chunk IDs are mapped to their content_hash metadata."""
+    # ARRANGE
+    mocked_service._vector_store.get.return_value = {
+        "ids": ["f_chunk_0", "f_chunk_1"],
+        "metadatas": [{"content_hash": "abc"}, None],
+    }
+
+    # ACT
+    result = mocked_service.get_chunk_hashes("f")
+
+    # ASSERT
+    mocked_service._vector_store.get.assert_called_once_with(where={"file_id": "f"}, include=["metadatas"])
+    assert result == {"f_chunk_0": "abc", "f_chunk_1": None}
+
+def test_delete_documents(mocked_service):
+    """Tests that IDs are deleted in one bulk call and empty lists are a no-op."""
+    mocked_service.delete_documents(["id1", "id2"])
+    mocked_service.delete_documents([])
+
+    mocked_service._vector_store.delete.assert_called_once_with(ids=["id1", "id2"])
+
 def test_similarity_search(mocked_service):
     """Tests that the similarity_search method is called correctly."""
     # ARRANGE
@@ -125,4 +194,180 @@ def test_peek_empty_collection(mocked_service):
     result = mocked_service.peek_collection(limit=5)
     
     # ASSERT
-    assert result == []
\ No newline at end of file
+    assert result == []
+def test_similarity_search_by_vector(mocked_service):
+    """Tests that a precomputed query vector is passed to Chroma as a float32 array with the filter."""
+    # ARRANGE
+    mocked_service._vector_store._collection.query.return_value = {
+        "ids": [["c1"]],
+        "documents": [["doc"]],
+        "metadatas": [[{"file_id": "f"}]],
+    }
+    query_filter = {"user_id": {"$eq": "u1"}}
+
+    # ACT
+    result = mocked_service.similarity_search_by_vector(np.array([0.5, 0.25], dtype=np.float32), k=5, filter=query_filter)
+
+    # ASSERT
+    assert result == [Document(id="c1", page_content="doc", metadata={"file_id": "f"})]
+    call = mocked_service._vector_store._collection.query.call_args.kwargs
+    assert isinstance(call['query_embeddings'], np.ndarray)
+    assert call['query_embeddings'].dtype == np.float32
+    np.testing.assert_array_equal(call['query_embeddings'], [[0.5, 0.25]])
+    assert call['n_results'] == 5
+    assert call['where'] == query_filter
+
+def test_get_document_vectors(mocked_service):
+    """Tests that one document's chunks come back with their IDs and a float32 embedding matrix."""
+    # ARRANGE
+    mocked_service._vector_store.get.return_value = {
+        'ids': ['d1_chunk_0', 'd1_chunk_1'],
+        'documents': ['first', 'second'],
+        'metadatas': [{'chunk_number': 0}, None],
+        'embeddings': [[0.5, 0.5], [1.0, 0.0]],
+    }
+    where = {"document_id": {"$eq": "d1"}}
+
+    # ACT
+    documents, vectors = mocked_service.get_document_vectors(where)
+
+    # ASSERT
+    mocked_service._vector_store.get.assert_called_once_with(where=where, include=["embeddings", "documents", "metadatas"])
+    assert [doc.id for doc in documents] == ['d1_chunk_0', 'd1_chunk_1']
+    assert documents[1].metadata == {}
+    assert vectors.dtype == np.float32 and vectors.shape == (2, 2)
+
+def test_get_document_vectors_empty(mocked_service):
+    mocked_service._vector_store.get.return_value = {'ids': [], 'documents': [], 'metadatas': [], 'embeddings': []}
+
+    documents, vectors = mocked_service.get_document_vectors({"document_id": "missing"})
+
+    assert documents == []
+    assert vectors.shape == (0, 0)
+
+@pytest.fixture
+def partitioned_service(mocker):
+    """A VectorStoreService partitioned by user, whose partition handles are distinct mocks."""
+    mock_chroma_class = mocker.patch('app.core.vector_store.Chroma')
+    mocker.patch('app.core.vector_store.chromadb.PersistentClient')
+    mock_chroma_class.side_effect = lambda **kwargs: MagicMock(name=kwargs['collection_name'])
+    clock = MagicMock(return_value=0.0)
+    service = VectorStoreService(
+        embedding_function=MagicMock(), persist_directory="./fake_db", collection_name="documents",
+        partition_by="user", max_open_partitions=2, partition_idle_seconds=60, clock=clock,
+    )
+    return service, mock_chroma_class, clock
+
+def test_partitioned_upsert_routes_chunks_by_user(partitioned_service):
+    """Tests that each user's chunks are written to that user's collection only."""
+    # ARRANGE
+    service, mock_chroma_class, _ = partitioned_service
+    docs = [
+        Document(page_content="a", metadata={"user_id": "u1", "document_id": "d1"}),
+        Document(page_content="b", metadata={"user_id": "u2", "document_id": "d2"}),
+        Document(page_content="c", metadata={"user_id": "u1", "document_id": "d3"}),
+    ]
+    embeddings = np.array([[1.0, 0.0], [0.0, 1.0], [0.5, 0.5]], dtype=np.float32)
+
+    # ACT
+    service.upsert_embeddings(docs, ["a", "b", "c"], embeddings)
+
+    # ASSERT
+    u1 = service._collection("u1")
+    u1_call = u1._collection.upsert.call_args.kwargs
+    assert u1_call['ids'] == ["a", "c"]
+    np.testing.assert_array_equal(u1_call['embeddings'], embeddings[[0, 2]])
+    assert service._collection("u2")._collection.upsert.call_args.kwargs['ids'] == ["b"]
+    assert mock_chroma_class.call_args.kwargs['client'] is service._client
+    service._vector_store._collection.upsert.assert_not_called()
+    assert service.stats()["opened"] == 2
+
+def test_partitioned_search_uses_the_users_collection(partitioned_service):
+    service, _, _ = partitioned_service
+
+    service.similarity_search_by_vector(np.array([1.0, 0.0]), k=3, filter={"document_id": "d1"}, user_id="u1")
+
+    assert service._collection("u1")._collection.query.call_count == 1
+    service._vector_store._collection.query.assert_not_called()
+    assert service.partition_name("u1") != service.partition_name("u2")
+    assert service.partition_name("u1").startswith("documents_")
+
+def test_partition_handles_are_reused_and_idle_ones_closed(partitioned_service):
+    """Tests that handles are opened once, capped by an LRU, and dropped after the idle timeout."""
+    # ARRANGE
+    service, _, clock = partitioned_service
+
+    # ACT / ASSERT: reuse
+    first = service._collection("u1")
+    assert service._collection("u1") is first
+
+    # ACT / ASSERT: a third tenant evicts the least recently used handle
+    service._collection("u2")
+    service._collection("u3")
+    assert service.stats()["open_partitions"] == 2
+    assert service._collection("u1") is not first
+
+    # ACT / ASSERT: idle handles are closed on the next access
+    clock.return_value = 120.0
+    service._collection("u4")
+    assert service.stats()["open_partitions"] == 1
+    assert service.stats()["closed"] == 4
+
+def test_reads_of_an_unknown_partition_create_no_collection(partitioned_service):
+    """Tests that reads and deletes for a user with no stored chunks return empty results without creating their collection."""
+    # ARRANGE
+    service, mock_chroma_class, _ = partitioned_service
+    client = service._client
+    client.get_collection.side_effect = NotFoundError("Collection does not exist")
+    mock_chroma_class.reset_mock()
+
+    # ACT
+    hashes = service.get_chunk_hashes("f1", user_id="u9")
+    documents, vectors = service.get_document_vectors({"document_id": "d1"}, user_id="u9")
+    found = service.similarity_search_by_vector(np.array([1.0, 0.0]), k=3, user_id="u9")
+    retrieved = service.get_retriever(search_kwargs={"k": 3}, user_id="u9").invoke("question")
+    service.delete_documents(["a"], user_id="u9")
+
+    # ASSERT
+    assert hashes == {}
+    assert documents == [] and vectors.shape == (0, 0)
+    assert found == [] and retrieved == []
+    mock_chroma_class.assert_not_called()
+    assert service.stats()["opened"] == 0
+
+def test_document_partitioning_requires_document_id(mocker):
+    mocker.patch('app.core.vector_store.Chroma')
+    mocker.patch('app.core.vector_store.chromadb.PersistentClient')
+    service = VectorStoreService(embedding_function=MagicMock(), partition_by="document")
+
+    with pytest.raises(ValueError):
+        service.get_chunk_hashes("f1", user_id="u1")
+    assert service.partition_name("u1", "d1") != service.partition_name("u1", "d2")
+
+def test_invalid_partition_mode(mocker):
+    mocker.patch('app.core.vector_store.Chroma')
+    mocker.patch('app.core.vector_store.chromadb.PersistentClient')
+
+    with pytest.raises(ValueError):
+        VectorStoreService(embedding_function=MagicMock(), partition_by="tenant")
+
+def test_get_document_version_changes_with_chunks(mocked_service):
+    """Tests that the document fingerprint ignores order but changes when a chunk is rewritten or removed."""
+    # ARRANGE
+    def stored(ids, hashes):
+        return {'ids': ids, 'metadatas': [{'content_hash': h} for h in hashes]}
+    where = {"document_id": {"$eq": "d1"}}
+    mocked_service._vector_store.get.side_effect = [
+        stored(['c0', 'c1'], ['h0', 'h1']),
+        stored(['c1', 'c0'], ['h1', 'h0']),
+        stored(['c0', 'c1'], ['h0', 'h1-edited']),
+        stored(['c0'], ['h0']),
+    ]
+
+    # ACT
+    versions = [mocked_service.get_document_version(where) for _ in range(4)]
+
+    # ASSERT
+    mocked_service._vector_store.get.assert_called_with(where=where, include=["metadatas"])
+    assert versions[0] == versions[1]
+    assert len(set(versions[1:])) == 3